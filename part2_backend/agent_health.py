@@ -0,0 +1,155 @@
+# agent_health.py
+"""Agent heartbeats (written by each uagents agent) and the gateway's cached readiness snapshot"""
+import asyncio
+import json
+import os
+import time
+from typing import Callable, Dict, Optional
+from state_db import ensure_schema, add_missing_columns
+import job_queue
+import metrics
+
+HEARTBEAT_INTERVAL = float(os.getenv("AGENT_HEARTBEAT_INTERVAL", "2"))
+# An agent is considered down after missing this many heartbeats
+STALE_AFTER = HEARTBEAT_INTERVAL * 3
+# In-flight messages at which an agent reports itself overloaded
+AGENT_MAX_IN_FLIGHT = int(os.getenv("AGENT_MAX_IN_FLIGHT", "20"))
+HEALTH_REFRESH_INTERVAL = float(os.getenv("HEALTH_REFRESH_INTERVAL", "1"))
+
+EXPECTED_AGENTS = [
+    "perception_agent", "emotion_agent", "narration_agent",
+    "voice_agent", "audio_mixer_agent", "coordinator_agent"
+]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS agent_health (
+    agent TEXT PRIMARY KEY,
+    address TEXT NOT NULL,
+    last_seen REAL NOT NULL,
+    in_flight INTEGER NOT NULL,
+    handled INTEGER NOT NULL,
+    errors INTEGER NOT NULL
+);
+"""
+
+
+def _db():
+    return ensure_schema("agent_health", _SCHEMA,
+                         lambda conn: add_missing_columns(conn, "agent_health", {"details": "TEXT"}))
+
+
+class AgentLoad:
+    """Per-agent in-flight / handled / error counters reported with each heartbeat"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.handled = 0
+        self.errors = 0
+
+    def begin(self):
+        self.in_flight += 1
+
+    def failed(self):
+        self.errors += 1
+
+    def end(self):
+        self.in_flight = max(0, self.in_flight - 1)
+        self.handled += 1
+
+
+def register(agent, load: AgentLoad, details: Optional[Callable[[], Dict]] = None):
+    """Publish `load` (plus optional extra `details()`) as a heartbeat for `agent` every HEARTBEAT_INTERVAL seconds"""
+
+    @agent.on_interval(period=HEARTBEAT_INTERVAL)
+    async def heartbeat(ctx):
+        _db().execute(
+            "INSERT OR REPLACE INTO agent_health (agent, address, last_seen, in_flight, handled, errors, details) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (agent.name, agent.address, time.time(), load.in_flight, load.handled, load.errors,
+             json.dumps(details()) if details else None)
+        )
+        metrics.AGENT_IN_FLIGHT.set(load.in_flight, agent=agent.name)
+        metrics.flush()
+
+    return heartbeat
+
+
+def snapshot() -> Dict:
+    """Read heartbeats and queue depth and classify each agent as ready / overloaded / down"""
+    now = time.time()
+    rows = {row["agent"]: dict(row) for row in _db().execute("SELECT * FROM agent_health")}
+    agents = {}
+    for name in EXPECTED_AGENTS:
+        row = rows.get(name)
+        if row is None:
+            agents[name] = {"status": "down", "last_seen": None}
+            continue
+        age = now - row["last_seen"]
+        if age > STALE_AFTER:
+            status = "down"
+        elif row["in_flight"] >= AGENT_MAX_IN_FLIGHT:
+            status = "overloaded"
+        else:
+            status = "ready"
+        agents[name] = {
+            "status": status,
+            "last_seen": row["last_seen"],
+            "heartbeat_age_s": round(age, 2),
+            "in_flight": row["in_flight"],
+            "handled": row["handled"],
+            "errors": row["errors"]
+        }
+        if row.get("details"):
+            agents[name]["details"] = json.loads(row["details"])
+    return {
+        "ready": all(a["status"] != "down" for a in agents.values()),
+        "agents": agents,
+        "queue": job_queue.depth(),
+        "checked_at": now
+    }
+
+
+class HealthMonitor:
+    """Background task that keeps the latest snapshot() cached for per-request checks"""
+
+    def __init__(self, interval: float = HEALTH_REFRESH_INTERVAL):
+        self.interval = interval
+        self.current: Optional[Dict] = None
+        self._task = None
+
+    def refresh(self) -> Dict:
+        self.current = snapshot()
+        return self.current
+
+    async def _run(self):
+        while True:
+            try:
+                # Off the event loop: a locked state DB can hold these queries for up to busy_timeout
+                await asyncio.to_thread(self.refresh)
+                await asyncio.to_thread(metrics.flush)
+            except Exception as e:
+                print(f"⚠️  Health refresh failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.refresh()
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.current and self.current["ready"])
+
+    def unavailable_agents(self):
+        if not self.current:
+            return list(EXPECTED_AGENTS)
+        return [name for name, a in self.current["agents"].items() if a["status"] == "down"]
+
+    def overloaded_agents(self):
+        if not self.current:
+            return []
+        return [name for name, a in self.current["agents"].items() if a["status"] == "overloaded"]
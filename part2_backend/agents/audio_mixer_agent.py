@@ -2,9 +2,13 @@
 from uagents import Agent, Context
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-from fetch_models import AudioMixRequest, AudioMixData, ErrorMessage
+from fetch_models import AudioMixRequest, AudioMixData, AmbientPrepRequest, AmbientBedData, ErrorMessage
+import agent_health
+import resilience
 from pydub import AudioSegment
-import uuid
+import io
+from collections import OrderedDict
+import audio_store
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -14,72 +18,146 @@ audio_mixer_agent = Agent(
     seed="mixer_seed_33333"
 )
 
+load = agent_health.AgentLoad()
+agent_health.register(audio_mixer_agent, load)
+
+# Decoded ambient beds by filename, so the mix step doesn't decode what prepare_ambient just built
+AMBIENT_BED_CACHE_SIZE = int(os.getenv("AMBIENT_BED_CACHE_SIZE", "8"))
+ambient_beds = OrderedDict()
+
+def cache_bed(filename: str, bed: AudioSegment):
+    ambient_beds[filename] = bed
+    ambient_beds.move_to_end(filename)
+    while len(ambient_beds) > AMBIENT_BED_CACHE_SIZE:
+        ambient_beds.popitem(last=False)
+
+def build_ambient_bed(ambient_sounds):
+    """Layer the ambient sounds into one bed; None if none of them has a sample"""
+    bed = None
+    for sound in ambient_sounds:
+        # Generate or load ambient sound
+        if "waves" in sound.lower():
+            waves_path = audio_store.audio_path("waves.mp3")
+            ambient = AudioSegment.from_file(waves_path) if os.path.exists(waves_path) else AudioSegment.silent(30000)
+            bed = ambient if bed is None else bed.overlay(ambient, loop=True)
+    return bed
+
+def load_ambient_bed(ambient_url: str):
+    if not ambient_url:
+        return None
+    filename = os.path.basename(ambient_url)
+    bed = ambient_beds.get(filename)
+    if bed is None:
+        bed = AudioSegment.from_file(audio_store.audio_path(filename))
+        cache_bed(filename, bed)
+    return bed
+
 @audio_mixer_agent.on_event("startup")
 async def introduce(ctx: Context):
     ctx.logger.info(f"🎛️  Audio Mixer Agent started: {audio_mixer_agent.address}")
 
+async def prepare_bed(msg: AmbientPrepRequest, log) -> AmbientBedData:
+    """Build the ambient bed once and store it content-addressed ("" when no sound applies)"""
+    bed = build_ambient_bed(msg.ambient_sounds)
+    ambient_url = ""
+    if bed is not None:
+        buffer = io.BytesIO()
+        bed.export(buffer, format="mp3")
+        filename = audio_store.save_audio(buffer.getvalue(), prefix="bed_")
+        cache_bed(filename, bed)
+        ambient_url = audio_store.audio_url(filename)
+    return AmbientBedData(session_id=msg.session_id, ambient_url=ambient_url)
+
+@audio_mixer_agent.on_message(model=AmbientPrepRequest)
+async def prepare_ambient(ctx: Context, sender: str, msg: AmbientPrepRequest):
+    """Build the ambient bed while the voices are still being generated"""
+    if resilience.expired(msg.deadline):
+        ctx.logger.warning(f"⏰ Dropping expired ambient request for {msg.session_id}")
+        return
+    ctx.logger.info(f"🌊 Preparing ambient bed for {msg.session_id}: {msg.ambient_sounds}")
+    load.begin()
+
+    try:
+        result = await prepare_bed(msg, ctx.logger)
+        await ctx.send(sender, result)
+        ctx.logger.info(f"✅ Ambient bed: {result.ambient_url or 'none'}")
+
+    except Exception as e:
+        load.failed()
+        ctx.logger.error(f"❌ Error: {e}")
+        await ctx.send(sender, ErrorMessage(session_id=msg.session_id, error=str(e), step="ambient"))
+    finally:
+        load.end()
+
+async def mix(msg: AudioMixRequest, log) -> AudioMixData:
+    """Overlay the voices and the ambient bed into the final mix"""
+    # This is a simplified mixer - in production you'd use proper spatial audio
+    mixed_audio = AudioSegment.empty()
+    log.info(f"🎛️ Starting mix with empty audio segment")
+
+    # Add main narration (center)
+    for voice in msg.voice_files:
+        if voice["type"] == "narration":
+            # Load and add to center
+            audio_path = audio_store.audio_path(voice['url'])
+            log.info(f"🎛️ Looking for narration file: {audio_path}")
+            if os.path.exists(audio_path):
+                log.info(f"🎛️ Narration file exists, loading...")
+                narration = AudioSegment.from_file(audio_path)
+                log.info(f"🎛️ Narration duration: {len(narration)}ms")
+                if len(mixed_audio) == 0:
+                    mixed_audio = narration
+                    log.info(f"🎛️ Set mixed_audio to narration: {len(mixed_audio)}ms")
+                else:
+                    mixed_audio = mixed_audio.overlay(narration, position=0)
+                    log.info(f"🎛️ After overlay, mixed_audio duration: {len(mixed_audio)}ms")
+            else:
+                log.error(f"🎛️ Narration file NOT found: {audio_path}")
+
+    # Add dialogues (left/right - simplified as overlay)
+    for voice in msg.voice_files:
+        if voice["type"] == "dialogue":
+            audio_path = audio_store.audio_path(voice['url'])
+            if os.path.exists(audio_path):
+                dialogue = AudioSegment.from_file(audio_path)
+                # Simple pan left/right
+                if voice.get("position") == "left":
+                    dialogue = dialogue.pan(-0.5)
+                elif voice.get("position") == "right":
+                    dialogue = dialogue.pan(0.5)
+                mixed_audio = mixed_audio.overlay(dialogue, position=1000)  # Slight delay
+
+    # Add the ambient bed (prepared earlier by prepare_ambient, or built now for older requests)
+    ambient = load_ambient_bed(msg.ambient_url) if msg.ambient_url is not None else build_ambient_bed(msg.ambient_sounds)
+    if ambient is not None:
+        mixed_audio = mixed_audio.overlay(ambient, loop=True)
+
+    # Save final mix under its content hash so it can be served as immutable
+    buffer = io.BytesIO()
+    mixed_audio.export(buffer, format="mp3")
+    final_url = audio_store.audio_url(audio_store.save_audio(buffer.getvalue(), prefix="mix_"))
+    log.info(f"✅ Audio Mix: {len(mixed_audio)}ms final audio")
+    return AudioMixData(session_id=msg.session_id, final_audio_url=final_url)
+
 @audio_mixer_agent.on_message(model=AudioMixRequest)
 async def mix_audio(ctx: Context, sender: str, msg: AudioMixRequest):
+    if resilience.expired(msg.deadline):
+        ctx.logger.warning(f"⏰ Dropping expired mix request for {msg.session_id}")
+        return
     ctx.logger.info(f"🔊 [5/5] Mixing audio for {msg.session_id}")
+    load.begin()
 
     try:
-        # This is a simplified mixer - in production you'd use proper spatial audio
-        mixed_audio = AudioSegment.empty()
-        ctx.logger.info(f"🎛️ Starting mix with empty audio segment")
-
-        # Add main narration (center)
-        for voice in msg.voice_files:
-            if voice["type"] == "narration":
-                # Load and add to center
-                audio_path = f"storage/audio/{os.path.basename(voice['url'])}"
-                ctx.logger.info(f"🎛️ Looking for narration file: {audio_path}")
-                if os.path.exists(audio_path):
-                    ctx.logger.info(f"🎛️ Narration file exists, loading...")
-                    narration = AudioSegment.from_file(audio_path)
-                    ctx.logger.info(f"🎛️ Narration duration: {len(narration)}ms")
-                    if len(mixed_audio) == 0:
-                        mixed_audio = narration
-                        ctx.logger.info(f"🎛️ Set mixed_audio to narration: {len(mixed_audio)}ms")
-                    else:
-                        mixed_audio = mixed_audio.overlay(narration, position=0)
-                        ctx.logger.info(f"🎛️ After overlay, mixed_audio duration: {len(mixed_audio)}ms")
-                else:
-                    ctx.logger.error(f"🎛️ Narration file NOT found: {audio_path}")
-
-        # Add dialogues (left/right - simplified as overlay)
-        for voice in msg.voice_files:
-            if voice["type"] == "dialogue":
-                audio_path = f"storage/audio/{os.path.basename(voice['url'])}"
-                if os.path.exists(audio_path):
-                    dialogue = AudioSegment.from_file(audio_path)
-                    # Simple pan left/right
-                    if voice.get("position") == "left":
-                        dialogue = dialogue.pan(-0.5)
-                    elif voice.get("position") == "right":
-                        dialogue = dialogue.pan(0.5)
-                    mixed_audio = mixed_audio.overlay(dialogue, position=1000)  # Slight delay
-
-        # Add ambient sounds
-        for sound in msg.ambient_sounds:
-            # Generate or load ambient sound
-            if "waves" in sound.lower():
-                ambient = AudioSegment.from_file("storage/audio/waves.mp3") if os.path.exists("storage/audio/waves.mp3") else AudioSegment.silent(30000)
-                mixed_audio = mixed_audio.overlay(ambient, loop=True)
-
-        # Save final mix
-        output_filename = f"storage/audio/mix_{msg.session_id}_{uuid.uuid4()}.mp3"
-        mixed_audio.export(output_filename, format="mp3")
-
-        final_url = f"http://localhost:9000/static/{os.path.basename(output_filename)}"
-        result = AudioMixData(session_id=msg.session_id, final_audio_url=final_url)
-
+        result = await mix(msg, ctx.logger)
         await ctx.send(sender, result)
-        ctx.logger.info(f"✅ Audio Mix: {len(mixed_audio)}ms final audio")
         ctx.logger.info(f"📊 Audio Mix JSON: {result.__dict__}")
 
     except Exception as e:
+        load.failed()
         ctx.logger.error(f"❌ Error: {e}")
-        await ctx.send(sender, ErrorMessage(session_id=msg.session_id, error=str(e), step="mixing"))
+        await ctx.send(sender, ErrorMessage(session_id=msg.session_id, error=str(e), step="mix"))
+    finally:
+        load.end()
 
 if __name__ == "__main__":
     audio_mixer_agent.run()
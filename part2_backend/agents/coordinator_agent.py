@@ -4,10 +4,33 @@ import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from fetch_models import (
     VisionAnalysisRequest, PerceptionData, EmotionRequest, EmotionData,
-    NarrationRequest, NarrationData, VoiceRequest, VoiceData,
-    AudioMixRequest, AudioMixData, ExperienceComplete, ErrorMessage
+    NarrationRequest, NarrationLead, NarrationData, VoiceRequest, VoiceData,
+    AmbientPrepRequest, AmbientBedData, AudioMixRequest, AudioMixData, ErrorMessage
 )
 import asyncio
+import time
+import job_queue
+import state_db
+import job_events
+import notify
+import agent_health
+import result_cache
+import phash_index
+import blob_store
+import image_prep
+import metrics
+from session_store import SessionStore
+from experience import build_final_response, JOB_DEADLINE
+from pipeline import Pipeline, Stage, parse_stage_map, PIPELINE_STAGE_LIMITS, PIPELINE_STAGE_TIMEOUTS, PIPELINE_STAGE_RETRIES
+
+# Max jobs claimed from the queue per poll
+CLAIM_BATCH_SIZE = int(os.getenv("COORDINATOR_CLAIM_BATCH", "10"))
+# Max sessions running through the agents at once (batch items share this pool)
+MAX_CONCURRENT_SESSIONS = int(os.getenv("MAX_CONCURRENT_SESSIONS", "8"))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "30"))
+# Outputs later stages consume; stored once in the blob store and sent onward as digests
+SHARED_STAGE_OUTPUTS = ("perception", "emotion", "narration_lead", "narration")
+STAGE_WATCHDOG_INTERVAL = float(os.getenv("STAGE_WATCHDOG_INTERVAL", "1"))
 
 # Agent addresses (hardcoded - deterministic from seeds)
 PERCEPTION_AGENT_ADDRESS = "agent1q26xyx0j7jszd9uhah2s2kvp2my555zvywhnxh7x0dz6u3z354k65229de5"
@@ -22,8 +45,44 @@ coordinator_agent = Agent(
     endpoint=["http://localhost:8006/submit"]
 )
 
-# Global storage for agent responses
-agent_responses = {}
+def session_evicted(state, reason: str):
+    pipeline.cancel(state)
+    load.end()
+    metrics.SESSIONS.inc(outcome="evicted" if reason != "replaced" else "replaced")
+    print(f"🧹 Evicted session {state.session_id} ({reason}) after stage '{state.stage}'")
+    if reason != "replaced":
+        # Nobody will send this session's remaining stages - fail it now instead of at the client's timeout
+        job_queue.fail(state.session_id, f"Session evicted ({reason}) after stage '{state.stage}'", state.stage)
+        notifier.dispatch("jobs")
+
+# Stage outputs per in-flight session (TTL + max-size bounded)
+sessions = SessionStore(on_evict=session_evicted)
+
+# In-flight sessions, reported in the coordinator's heartbeat along with session store usage
+load = agent_health.AgentLoad()
+agent_health.register(coordinator_agent, load, details=lambda: {"session_store": sessions.stats(), "pipeline": pipeline.stats()})
+
+# Woken by the gateway whenever it enqueues a job
+notifier = notify.Notifier("coordinator")
+
+@coordinator_agent.on_interval(period=SESSION_SWEEP_INTERVAL)
+async def sweep_sessions(ctx: Context):
+    """Drop sessions that stalled mid-pipeline so they don't pin their stage outputs forever"""
+    expired = sessions.evict_expired()
+    if expired:
+        ctx.logger.warning(f"🧹 Expired {len(expired)} stalled session(s); store: {sessions.stats()}")
+    pruned = blob_store.prune()
+    if pruned:
+        ctx.logger.info(f"🧹 Pruned {pruned} old stage payload blob(s)")
+    pruned = job_queue.prune()
+    if pruned:
+        ctx.logger.info(f"🧹 Pruned {pruned} finished job(s) older than {job_queue.JOB_RETENTION:.0f}s")
+    pruned = job_events.prune()
+    if pruned:
+        ctx.logger.info(f"🧹 Pruned {pruned} old stage event(s)")
+    pruned = phash_index.prune()
+    if pruned:
+        ctx.logger.info(f"🧹 Pruned {pruned} old photo hash(es)")
 
 @coordinator_agent.on_event("startup")
 async def introduce(ctx: Context):
@@ -34,232 +93,323 @@ async def introduce(ctx: Context):
     ctx.logger.info(f"  Narration: {NARRATION_AGENT_ADDRESS}")
     ctx.logger.info(f"  Voice: {VOICE_AGENT_ADDRESS}")
     ctx.logger.info(f"  AudioMixer: {AUDIO_MIXER_AGENT_ADDRESS}")
+    ctx.logger.info(f"🧩 Pipeline stages: {' → '.join(pipeline.order)}")
     ctx.logger.info(f"📁 Monitoring for requests...")
     
     # Start polling for requests
     asyncio.create_task(poll_requests(ctx))
 
 async def poll_requests(ctx: Context):
-    """Poll for incoming requests from FastAPI"""
-    import os
-    import json
-    
-    # Use absolute paths based on script location
-    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    request_file = os.path.join(base_dir, "storage/requests.json")
-    response_dir = os.path.join(base_dir, "storage/responses")
-    
-    ctx.logger.info(f"📂 Polling request file: {request_file}")
-    
+    """Drain queued requests from FastAPI in batches"""
+    if await notifier.start():
+        ctx.logger.info(f"📂 Waiting for jobs on {notifier.path} (queue: {state_db.DB_PATH})")
+    else:
+        ctx.logger.warning(f"📂 Push notifications unavailable - polling job queue every {notify.FALLBACK_POLL}s")
+
+    with notifier.subscribe("jobs") as new_jobs:
+        while True:
+            await drain_queue(ctx)
+            # Sleep until the gateway signals a new job (or the fallback poll interval passes)
+            await notifier.wait(new_jobs)
+
+async def drain_queue(ctx: Context):
+    """Claim and start queued jobs until the queue is empty or all session slots are busy"""
     while True:
         try:
-            if os.path.exists(request_file):
-                ctx.logger.info(f"📨 Found request file!")
-                
-                # Read request
-                with open(request_file, "r") as f:
-                    request_data = json.load(f)
-                
-                session_id = request_data["session_id"]
-                photo_url = request_data["photo_url"]
-                
-                ctx.logger.info(f"🚀 Processing request for session {session_id}")
+            slots = MAX_CONCURRENT_SESSIONS - job_queue.in_flight()
+            if slots <= 0:
+                return
+            limit = min(CLAIM_BATCH_SIZE, slots)
+            jobs = job_queue.claim(limit=limit)
+            if jobs:
+                ctx.logger.info(f"📨 Claimed {len(jobs)} job(s) from queue")
+
+            for job in jobs:
+                session_id = job["session_id"]
+                photo_url = job["photo_url"]
+
+                ctx.logger.info(f"🚀 Processing request for session {session_id} (attempt {job['attempts'] + 1})")
                 ctx.logger.info(f"   Photo URL: {photo_url}")
-                
-                # Remove the request file so we don't process it again
-                os.remove(request_file)
-                ctx.logger.info(f"✅ Request file removed")
-                
-                # Trigger processing by sending message to self
-                vision_request = VisionAnalysisRequest(photo_url=photo_url, session_id=session_id)
-                # Store response dir in context storage for later use
-                ctx.storage.set(f"response_dir_{session_id}", response_dir)
-                await ctx.send(coordinator_agent.address, vision_request)
-                ctx.logger.info(f"📤 Sent VisionAnalysisRequest to coordinator")
-                
+
+                asyncio.create_task(start_session(ctx, session_id, photo_url, time.time() + JOB_DEADLINE))
+
+            if len(jobs) < limit:
+                return
+
         except Exception as e:
             ctx.logger.error(f"❌ Error in request polling: {e}")
             import traceback
             traceback.print_exc()
-        
-        # Poll every 2 seconds
-        await asyncio.sleep(2)
+            return
+
+async def start_session(ctx: Context, session_id: str, photo_url: str, deadline: float):
+    """Serve the session from the result cache if this exact photo was already processed, else run the pipeline"""
+    key = None
+    cached = None
+    try:
+        key = result_cache.cache_key(await image_prep.fetch(photo_url))
+        cached = result_cache.get(key)
+    except Exception as e:
+        ctx.logger.warning(f"⚠️  Result cache lookup skipped for {session_id}: {e}")
+
+    if cached:
+        response = dict(cached, session_id=session_id, cached=True)
+        job_queue.ack(session_id, response)
+        notifier.dispatch("jobs")
+        metrics.SESSIONS.inc(outcome="cached")
+        ctx.logger.info(f"♻️  Result cache hit for {session_id}: {response['final_audio_url']}")
+        return
+
+    sessions.create(session_id, photo_url, cache_key=key, deadline=deadline)
+
+    # Trigger processing by sending message to self
+    vision_request = VisionAnalysisRequest(photo_url=photo_url, session_id=session_id, deadline=deadline)
+    await ctx.send(coordinator_agent.address, vision_request)
+    ctx.logger.info(f"📤 Sent VisionAnalysisRequest to coordinator")
+
+# Stage dispatchers: each sends one request; the reply handlers below report completion to the pipeline
+async def request_perception(ctx: Context, state, deadline):
+    ctx.logger.info(f"📸 [1/5] → Perception Agent")
+    await ctx.send(PERCEPTION_AGENT_ADDRESS, VisionAnalysisRequest(
+        photo_url=state.photo_url, session_id=state.session_id, deadline=deadline
+    ))
+
+async def request_emotion(ctx: Context, state, deadline):
+    ctx.logger.info(f"🎭 [2/5] → Emotion Agent (using perception data)")
+    await ctx.send(EMOTION_AGENT_ADDRESS, EmotionRequest(
+        session_id=state.session_id, perception_ref=state.refs["perception"], deadline=deadline
+    ))
+
+async def request_ambient_bed(ctx: Context, state, deadline):
+    ctx.logger.info(f"🌊 → Audio Mixer Agent (ambient bed: {state.perception.ambient_sounds})")
+    await ctx.send(AUDIO_MIXER_AGENT_ADDRESS, AmbientPrepRequest(
+        session_id=state.session_id,
+        ambient_sounds=state.perception.ambient_sounds,
+        deadline=deadline
+    ))
+
+async def request_narration(ctx: Context, state, deadline):
+    ctx.logger.info(f"📝 [3/5] → Narration Agent")
+    await ctx.send(NARRATION_AGENT_ADDRESS, NarrationRequest(
+        session_id=state.session_id,
+        perception_ref=state.refs["perception"],
+        emotion_ref=state.refs["emotion"],
+        deadline=deadline
+    ))
+
+async def await_narration_lead(ctx: Context, state, deadline):
+    """Nothing to send: the narration request also yields the lead (a NarrationLead, or else the full NarrationData)"""
+
+def voice_requester(part: str, source: str):
+    """Dispatch for one voice part; `source` is the stage whose output carries its lines"""
+    async def request_voice(ctx: Context, state, deadline):
+        ctx.logger.info(f"🎤 [4/5] → Voice Agent ({part})")
+        await ctx.send(VOICE_AGENT_ADDRESS, VoiceRequest(
+            session_id=state.session_id,
+            narration_ref=state.refs[source],
+            emotion_ref=state.refs["emotion"],
+            part=part,
+            deadline=deadline
+        ))
+    return request_voice
+
+async def request_mix(ctx: Context, state, deadline):
+    ctx.logger.info(f"🎵 [5/5] → Audio Mixer Agent")
+    await ctx.send(AUDIO_MIXER_AGENT_ADDRESS, AudioMixRequest(
+        session_id=state.session_id,
+        voice_files=state.narrator_voice.voice_files + state.dialogue_voice.voice_files,
+        ambient_sounds=state.perception.ambient_sounds,
+        ambient_url=state.ambient.ambient_url,
+        deadline=deadline
+    ))
+
+# The narrator and dialogue lines are synthesized as separate stages, and the ambient bed is prepared
+# as soon as perception lists the sounds, so both overlap with the emotion -> narration chain.
+# The narrator only needs main_narration, which the narration agent streams ahead of the dialogues
+# ("narration_lead"), so narrator TTS starts while the dialogues are still being written.
+# Timeouts are per attempt; a stage that misses one (or reports an error) is re-sent up to `retries` times.
+pipeline = Pipeline([
+    Stage("perception", request_perception, timeout=90, retries=1),
+    Stage("emotion", request_emotion, inputs=["perception"], timeout=45, retries=1),
+    Stage("ambient", request_ambient_bed, inputs=["perception"], timeout=60),
+    Stage("narration", request_narration, inputs=["perception", "emotion"], timeout=60, retries=1),
+    Stage("narration_lead", await_narration_lead, inputs=["perception", "emotion"]),
+    Stage("narrator_voice", voice_requester("narrator", "narration_lead"), inputs=["narration_lead", "emotion"], timeout=60, retries=1),
+    Stage("dialogue_voice", voice_requester("dialogue", "narration"), inputs=["narration", "emotion"], timeout=60, retries=1),
+    Stage("mix", request_mix, inputs=["narrator_voice", "dialogue_voice", "ambient"], timeout=60),
+],
+    limits=parse_stage_map(PIPELINE_STAGE_LIMITS),
+    timeouts=parse_stage_map(PIPELINE_STAGE_TIMEOUTS, float),
+    retries=parse_stage_map(PIPELINE_STAGE_RETRIES),
+    on_start=lambda state, stage: job_events.stage_started(state.session_id, stage)
+)
+
+@metrics.collector
+def report_pipeline():
+    for name, stage in pipeline.stats().items():
+        metrics.STAGE_IN_FLIGHT.set(stage["running"], stage=name)
+        metrics.STAGE_QUEUED.set(stage["waiting"], stage=name)
+
+@coordinator_agent.on_interval(period=STAGE_WATCHDOG_INTERVAL)
+async def watch_deadlines(ctx: Context):
+    """Re-send stages that missed their deadline, and fail sessions that are out of retries or time"""
+    for state in sessions.values():
+        try:
+            stage = await pipeline.check_deadlines(ctx, state)
+        except Exception as e:
+            ctx.logger.error(f"❌ Could not retry a stage of session {state.session_id}: {e}")
+            fail_session(state.session_id, str(e), "coordinator")
+            continue
+        if stage is not None:
+            ctx.logger.error(f"⏰ Session {state.session_id} timed out in {stage} (attempt {state.attempts.get(stage, [0])[0]})")
+            fail_session(state.session_id, f"{stage} did not finish before its deadline", stage)
+
+async def stage_done(ctx: Context, stage: str, msg):
+    """Store a stage's output, start whatever it unblocks, and finish the session once every stage is done.
+
+    Only the first reply per stage counts: a late one from an earlier attempt is dropped before it can
+    replace the stored output or report the stage finished again.
+    """
+    session_id = msg.session_id
+    state = sessions.get(session_id)
+    if state is None:
+        ctx.logger.warning(f"⚠️  Ignoring {stage} data for unknown session {session_id}")
+        return
+    if not pipeline.is_running(state, stage):
+        ctx.logger.info(f"♻️  Ignoring duplicate {stage} data for {session_id}")
+        return
+    size = None
+    if stage in SHARED_STAGE_OUTPUTS:
+        # Without session_id, identical outputs of different sessions share one blob
+        state.refs[stage], size = blob_store.put({k: v for k, v in msg.__dict__.items() if k != "session_id"})
+    sessions.record(session_id, stage, msg, size)
+    duration_ms = job_events.stage_finished(session_id, stage)
+    if duration_ms is not None:
+        metrics.STAGE_SECONDS.observe(duration_ms / 1000, stage=stage)
+    ctx.logger.info(f"✅ {stage} finished for {session_id}" + (f" in {duration_ms:.0f}ms" if duration_ms else ""))
+    try:
+        if await pipeline.finished(ctx, state, stage):
+            await create_final_response(ctx, state)
+    except Exception as e:
+        ctx.logger.error(f"❌ Could not continue session {session_id} after {stage}: {e}")
+        fail_session(session_id, str(e), "coordinator")
 
 @coordinator_agent.on_message(model=PerceptionData)
 async def handle_perception_response(ctx: Context, sender: str, msg: PerceptionData):
     """Handle perception agent response"""
-    session_id = msg.session_id
-    agent_responses[f"{session_id}_perception"] = msg
-    ctx.logger.info(f"📸 Received perception data for {session_id}")
-
-    # Now start emotion analysis with the perception data
-    ctx.logger.info(f"🎭 [2/5] → Emotion Agent (using perception data)")
-    emotion_request = EmotionRequest(session_id=session_id, perception_data=msg.__dict__)
-    await ctx.send(EMOTION_AGENT_ADDRESS, emotion_request)
+    ctx.logger.info(f"📸 Received perception data for {msg.session_id}")
+    await stage_done(ctx, "perception", msg)
 
 @coordinator_agent.on_message(model=EmotionData)
 async def handle_emotion_response(ctx: Context, sender: str, msg: EmotionData):
     """Handle emotion agent response"""
-    session_id = msg.session_id
-    agent_responses[f"{session_id}_emotion"] = msg
-    ctx.logger.info(f"😊 Received emotion data for {session_id}")
+    ctx.logger.info(f"😊 Received emotion data for {msg.session_id}")
+    await stage_done(ctx, "emotion", msg)
+
+@coordinator_agent.on_message(model=AmbientBedData)
+async def handle_ambient_bed(ctx: Context, sender: str, msg: AmbientBedData):
+    """Handle the mixer's prepared ambient bed"""
+    ctx.logger.info(f"🌊 Received ambient bed for {msg.session_id}: {msg.ambient_url or 'none'}")
+    await stage_done(ctx, "ambient", msg)
 
-    # Check if we have both perception and emotion data to proceed
-    await check_and_proceed_with_narration(ctx, session_id)
+@coordinator_agent.on_message(model=NarrationLead)
+async def handle_narration_lead(ctx: Context, sender: str, msg: NarrationLead):
+    """Handle the main narration, streamed ahead of the full narration"""
+    ctx.logger.info(f"📝 Received main narration for {msg.session_id}")
+    await stage_done(ctx, "narration_lead", msg)
 
 @coordinator_agent.on_message(model=NarrationData)
 async def handle_narration_response(ctx: Context, sender: str, msg: NarrationData):
     """Handle narration agent response"""
-    session_id = msg.session_id
-    agent_responses[f"{session_id}_narration"] = msg
-    ctx.logger.info(f"📝 Received narration data for {session_id}")
-
-    # Proceed with voice synthesis
-    await proceed_with_voice_synthesis(ctx, session_id)
+    ctx.logger.info(f"📝 Received narration data for {msg.session_id}")
+    state = sessions.get(msg.session_id)
+    if state is not None and pipeline.is_running(state, "narration_lead"):
+        # No lead was streamed (or it got lost) - the full narration carries it
+        await stage_done(ctx, "narration_lead", NarrationLead(session_id=msg.session_id, main_narration=msg.main_narration))
+    elif state is not None and state.narration_lead is not None and msg.main_narration != state.narration_lead.main_narration:
+        # A retried attempt wrote a new narration, but the narrator is already voicing the first lead
+        msg = NarrationData(**dict(msg.__dict__, main_narration=state.narration_lead.main_narration))
+    await stage_done(ctx, "narration", msg)
 
 @coordinator_agent.on_message(model=VoiceData)
 async def handle_voice_response(ctx: Context, sender: str, msg: VoiceData):
-    """Handle voice agent response"""
-    session_id = msg.session_id
-    agent_responses[f"{session_id}_voice"] = msg
-    ctx.logger.info(f"🎤 Received voice data for {session_id}")
-
-    # Proceed with audio mixing
-    await proceed_with_audio_mixing(ctx, session_id)
+    """Handle voice agent response (narrator or dialogue lines)"""
+    ctx.logger.info(f"🎤 Received {msg.part} voice data for {msg.session_id}")
+    await stage_done(ctx, f"{msg.part}_voice", msg)
 
 @coordinator_agent.on_message(model=AudioMixData)
 async def handle_audio_mix_response(ctx: Context, sender: str, msg: AudioMixData):
     """Handle audio mixer response - final step"""
-    session_id = msg.session_id
-    agent_responses[f"{session_id}_audio"] = msg
-    ctx.logger.info(f"🎵 Received final audio for {session_id}")
-
-    # Create final response
-    await create_final_response(ctx, session_id)
+    ctx.logger.info(f"🎵 Received final audio for {msg.session_id}")
+    await stage_done(ctx, "mix", msg)
 
 @coordinator_agent.on_message(model=ErrorMessage)
 async def handle_error(ctx: Context, sender: str, msg: ErrorMessage):
-    """Handle any agent errors"""
-    ctx.logger.error(f"❌ Agent error from {sender}: {msg.error}")
-
-async def check_and_proceed_with_narration(ctx: Context, session_id: str):
-    """Check if we have both perception and emotion data, then start narration"""
-    perception_key = f"{session_id}_perception"
-    emotion_key = f"{session_id}_emotion"
-
-    if perception_key in agent_responses and emotion_key in agent_responses:
-        perception_data = agent_responses[perception_key]
-        emotion_data = agent_responses[emotion_key]
-
-        # Start narration
-        ctx.logger.info(f"📝 [3/5] → Narration Agent")
-        narration_request = NarrationRequest(
-            session_id=session_id,
-            perception=perception_data.__dict__,
-            emotion=emotion_data.__dict__
-        )
-        await ctx.send(NARRATION_AGENT_ADDRESS, narration_request)
-
-async def proceed_with_voice_synthesis(ctx: Context, session_id: str):
-    """Proceed with voice synthesis after getting narration"""
-    narration_key = f"{session_id}_narration"
-    perception_key = f"{session_id}_perception"
-    emotion_key = f"{session_id}_emotion"
-
-    if (narration_key in agent_responses and
-        perception_key in agent_responses and
-        emotion_key in agent_responses):
-
-        narration_data = agent_responses[narration_key]
-        emotion_data = agent_responses[emotion_key]
-
-        # Start voice synthesis
-        ctx.logger.info(f"🎤 [4/5] → Voice Agent")
-        voice_request = VoiceRequest(
-            session_id=session_id,
-            narration_data=narration_data.__dict__,
-            emotion_data=emotion_data.__dict__
-        )
-        await ctx.send(VOICE_AGENT_ADDRESS, voice_request)
-
-async def proceed_with_audio_mixing(ctx: Context, session_id: str):
-    """Proceed with audio mixing after getting voice data"""
-    voice_key = f"{session_id}_voice"
-    perception_key = f"{session_id}_perception"
-
-    if voice_key in agent_responses and perception_key in agent_responses:
-        voice_data = agent_responses[voice_key]
-        perception_data = agent_responses[perception_key]
-
-        # Start audio mixing
-        ctx.logger.info(f"🎵 [5/5] → Audio Mixer Agent")
-        audio_mix_request = AudioMixRequest(
-            session_id=session_id,
-            voice_files=voice_data.voice_files,
-            ambient_sounds=perception_data.ambient_sounds
-        )
-        await ctx.send(AUDIO_MIXER_AGENT_ADDRESS, audio_mix_request)
-
-async def create_final_response(ctx: Context, session_id: str):
+    """Retry the failed stage if it has retries left, otherwise fail the session right away"""
+    ctx.logger.error(f"❌ Agent error from {sender} at {msg.step}: {msg.error}")
+    state = sessions.get(msg.session_id)
+    if state is not None and msg.step in pipeline.stages:
+        if not pipeline.is_running(state, msg.step):
+            # An earlier attempt failing after a retry already answered
+            return
+        metrics.STAGE_FAILURES.inc(stage=msg.step, reason="error")
+        try:
+            if await pipeline.retry(ctx, state, msg.step):
+                ctx.logger.warning(f"🔁 Retrying {msg.step} for {msg.session_id} (attempt {state.attempts[msg.step][0]})")
+                return
+        except Exception as e:
+            ctx.logger.error(f"❌ Could not retry {msg.step} for {msg.session_id}: {e}")
+    fail_session(msg.session_id, msg.error, msg.step)
+
+def fail_session(session_id: str, error: str, step: str):
+    """Terminal failure: tell waiting clients, drop the session's state and free its slot"""
+    job_queue.fail(session_id, error, step)
+    state = sessions.pop(session_id)
+    if state is not None:
+        pipeline.cancel(state)
+        load.end()
+        metrics.SESSIONS.inc(outcome="failed")
+    # A session slot just freed up - let the poll loop claim the next job
+    notifier.dispatch("jobs")
+
+async def create_final_response(ctx: Context, state):
     """Create the final response after all processing is complete"""
-    # Get all the data
-    perception_data = agent_responses.get(f"{session_id}_perception")
-    emotion_data = agent_responses.get(f"{session_id}_emotion")
-    narration_data = agent_responses.get(f"{session_id}_narration")
-    voice_data = agent_responses.get(f"{session_id}_voice")
-    audio_data = agent_responses.get(f"{session_id}_audio")
-
-    if not all([perception_data, emotion_data, narration_data, voice_data, audio_data]):
-        ctx.logger.error(f"❌ Missing data for session {session_id}")
-        return
-
-    # Create audio layers
-    audio_layers = []
-    for voice_file in voice_data.voice_files:
-        audio_layers.append({
-            "type": voice_file["type"],
-            "position": voice_file["position"],
-            "text": voice_file["text"][:100] + "..." if len(voice_file["text"]) > 100 else voice_file["text"]
-        })
-
-    # Create final response
-    final_response = {
-        "session_id": session_id,
-        "emotion": emotion_data.__dict__,
-        "narration": narration_data.__dict__,
-        "audio_layers": audio_layers,
-        "final_audio_url": audio_data.final_audio_url
-    }
-
-    # Write to response file for FastAPI to pick up
-    import json
-    import os
-    response_dir = "../storage/responses/"
-    os.makedirs(response_dir, exist_ok=True)
-    response_file = f"{response_dir}/{session_id}.json"
-
-    with open(response_file, "w") as f:
-        json.dump(final_response, f)
-
+    session_id = state.session_id
+    final_response = build_final_response(
+        session_id, state.emotion, state.narration,
+        state.narrator_voice.voice_files + state.dialogue_voice.voice_files,
+        state.mix.final_audio_url
+    )
+    critical_path = pipeline.critical_path(state)
+
+    # Store the result on the job for FastAPI to pick up, and release the session's state
+    job_queue.ack(session_id, dict(final_response, critical_path=critical_path))
+    sessions.pop(session_id)
+    load.end()
+    metrics.SESSIONS.inc(outcome="completed")
+    metrics.SESSION_SECONDS.observe(time.time() - state.created_at)
+
+    if state.cache_key:
+        result_cache.put(state.cache_key, final_response)
+    # A session slot just freed up - let the poll loop claim the next job
+    notifier.dispatch("jobs")
     ctx.logger.info(f"✅ Complete processing for session {session_id}")
-
-    # Clean up agent responses
-    for key in list(agent_responses.keys()):
-        if key.startswith(session_id):
-            del agent_responses[key]
+    ctx.logger.info(f"⏱️  Critical path: " + " → ".join(f"{step['stage']} {step['ms']:.0f}ms" for step in critical_path))
 
 @coordinator_agent.on_message(model=VisionAnalysisRequest)
 async def orchestrate_experience(ctx: Context, sender: str, msg: VisionAnalysisRequest):
     session_id = msg.session_id
-    photo_url = msg.photo_url
     ctx.logger.info(f"🚀 [COORDINATOR] Starting experience for {session_id}")
-
-    # Start perception analysis first
-    ctx.logger.info(f"📸 [1/5] → Perception Agent")
-    vision_request = VisionAnalysisRequest(photo_url=photo_url, session_id=session_id)
-    await ctx.send(PERCEPTION_AGENT_ADDRESS, vision_request)
-
-    ctx.logger.info(f"⏳ Waiting for perception result, then will start emotion for session {session_id}")
+    state = sessions.get(session_id) or sessions.create(
+        session_id, msg.photo_url, deadline=msg.deadline or time.time() + JOB_DEADLINE
+    )
+    load.begin()
+
+    try:
+        await pipeline.advance(ctx, state)
+    except Exception as e:
+        ctx.logger.error(f"❌ Could not start session {session_id}: {e}")
+        fail_session(session_id, str(e), "coordinator")
 
 if __name__ == "__main__":
     coordinator_agent.run()
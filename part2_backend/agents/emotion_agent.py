@@ -3,7 +3,13 @@ from uagents import Agent, Context
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from fetch_models import EmotionRequest, EmotionData, ErrorMessage
-import httpx, json
+import agent_health
+import resilience
+import json_repair
+import providers
+import blob_store
+import emotion_cache
+import json
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,63 +19,80 @@ emotion_agent = Agent(
     seed="emotion_seed_67890"
 )
 
+load = agent_health.AgentLoad()
+agent_health.register(emotion_agent, load)
+
 LETTA_API_KEY = os.getenv("LETTA_API_KEY")
 EMOTION_AGENT_ID = os.getenv("EMOTION_AGENT_ID")
 
+# Used when Letta's reply has no usable JSON, and for fields that are missing or malformed
+EMOTION_DEFAULTS = {
+    "mood": "neutral", "emotion_tags": [], "tone": "neutral", "intensity": "medium",
+    "voice_characteristics": {}, "ambient_mood": "calm"
+}
+
 @emotion_agent.on_event("startup")
 async def introduce(ctx: Context):
     ctx.logger.info(f"💭 Emotion Agent started: {emotion_agent.address}")
+    await providers.warm_up("letta")
+
+async def detect(msg: EmotionRequest, log) -> EmotionData:
+    """Infer the scene's mood and voice direction from perception data"""
+    perception_data = blob_store.resolve(msg.perception_data, msg.perception_ref)
+
+    # Same scene as an earlier session - reuse its emotion instead of another Letta round trip
+    key = emotion_cache.fingerprint(perception_data) if emotion_cache.EMOTION_CACHE_ENABLED else None
+    if key is not None:
+        cached = emotion_cache.get(key)
+        if cached is not None:
+            log.info(f"♻️  Emotion cache hit for {msg.session_id}")
+            return EmotionData(session_id=msg.session_id, **cached)
+
+    log.warning("🔥 USING LETTA AI FOR EMOTION DETECTION (NO GPT FALLBACK)")
+    async def send_letta(timeout):
+        return await providers.client("letta").post(
+            f"/v1/agents/{EMOTION_AGENT_ID}/messages",
+            headers={"Authorization": f"Bearer {LETTA_API_KEY}"},
+            json={"messages": [{"role": "user", "content": f"Analyze emotion:\n\n{json.dumps(perception_data, indent=2)}"}], "stream": False},
+            timeout=timeout
+        )
+
+    letta_response = await resilience.call("letta", send_letta, resilience.LETTA_POLICY, msg.deadline)
+    letta_data = letta_response.json()
+    emotion_text = next((m.get("content", "") for m in letta_data.get("messages", []) if m.get("message_type") == "assistant_message"), "{}")
+
+    # Parse JSON (Letta mixes quotes and wraps the object in prose)
+    try:
+        parsed = json_repair.extract(emotion_text)
+    except json_repair.JSONRepairError:
+        parsed = {}
+
+    result = json_repair.validate(EmotionData, parsed, EMOTION_DEFAULTS, session_id=msg.session_id)
+    # A reply with nothing usable is all defaults - not worth reusing
+    if key is not None and parsed:
+        emotion_cache.put(key, {k: v for k, v in result.__dict__.items() if k != "session_id"})
+    return result
 
 @emotion_agent.on_message(model=EmotionRequest)
 async def detect_emotion(ctx: Context, sender: str, msg: EmotionRequest):
+    if resilience.expired(msg.deadline):
+        ctx.logger.warning(f"⏰ Dropping expired emotion request for {msg.session_id}")
+        return
     ctx.logger.info(f"🎭 [2/5] Detecting emotion for {msg.session_id}")
+    load.begin()
 
     try:
-        ctx.logger.warning("🔥 USING LETTA AI FOR EMOTION DETECTION (NO GPT FALLBACK)")
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            letta_response = await client.post(
-                f"https://api.letta.com/v1/agents/{EMOTION_AGENT_ID}/messages",
-                headers={"Authorization": f"Bearer {LETTA_API_KEY}"},
-                json={"messages": [{"role": "user", "content": f"Analyze emotion:\n\n{json.dumps(msg.perception_data, indent=2)}"}], "stream": False}
-            )
-            letta_data = letta_response.json()
-            emotion_text = next((m.get("content", "") for m in letta_data.get("messages", []) if m.get("message_type") == "assistant_message"), "{}")
-
-            # Parse JSON (handle mixed quotes from Letta AI)
-            json_start = emotion_text.find('{')
-            json_end = emotion_text.rfind('}') + 1
-            if json_start >= 0 and json_end > json_start:
-                json_content = emotion_text[json_start:json_end]
-                # Fix mixed quotes
-                import re
-                json_content = re.sub(r"'([^']*)':", r'"\1":', json_content)  # Keys
-                json_content = re.sub(r": '([^']*)'", r': "\1"', json_content)  # String values
-                json_content = re.sub(r": '([^']*)',", r': "\1",', json_content)  # String values with comma
-                json_content = re.sub(r": '([^']*)'}", r': "\1"}', json_content)  # String values at end
-                json_content = re.sub(r"'([^']*)'", r'"\1"', json_content)  # Fix single quotes in arrays
-
-                try:
-                    parsed = json.loads(json_content)
-                except json.JSONDecodeError:
-                    parsed = {"mood": "neutral", "emotion_tags": [], "tone": "neutral", "intensity": "medium", "voice_characteristics": {}, "ambient_mood": "calm"}
-
-        result = EmotionData(
-            session_id=msg.session_id,
-            mood=parsed.get("mood", "neutral"),
-            emotion_tags=parsed.get("emotion_tags", []),
-            tone=parsed.get("tone", "neutral"),
-            intensity=parsed.get("intensity", "medium"),
-            voice_characteristics=parsed.get("voice_characteristics", {}),
-            ambient_mood=parsed.get("ambient_mood", "calm")
-        )
-
+        result = await detect(msg, ctx.logger)
         await ctx.send(sender, result)
         # ctx.logger.info(f"✅ Emotion: {result.mood} ({result.intensity})")
         # ctx.logger.info(f"📊 Emotion JSON: {result.__dict__}")
 
     except Exception as e:
+        load.failed()
         ctx.logger.error(f"❌ Error: {e}")
         await ctx.send(sender, ErrorMessage(session_id=msg.session_id, error=str(e), step="emotion"))
+    finally:
+        load.end()
 
 if __name__ == "__main__":
     emotion_agent.run()
@@ -2,8 +2,17 @@
 from uagents import Agent, Context
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-from fetch_models import NarrationRequest, NarrationData, ErrorMessage
-import httpx, json
+from fetch_models import NarrationRequest, NarrationData, NarrationLead, ErrorMessage
+import agent_health
+import resilience
+import json_repair
+import providers
+import blob_store
+import json
+import asyncio
+import httpx
+import stats
+from typing import Awaitable, Callable, Optional
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,26 +22,34 @@ narration_agent = Agent(
     seed="narration_seed_11111"
 )
 
+load = agent_health.AgentLoad()
+agent_health.register(narration_agent, load)
+
 LETTA_API_KEY = os.getenv("LETTA_API_KEY")
 NARRATION_AGENT_ID = os.getenv("NARRATION_AGENT_ID")
 
+# Stream Letta's reply so main_narration can be handed on (for narrator TTS) before the dialogues are written
+NARRATION_STREAMING = os.getenv("NARRATION_STREAMING", "1") == "1"
+
+# Used when Letta's reply has no usable JSON, and for fields that are missing or malformed
+NARRATION_DEFAULTS = {"main_narration": "Scene description unavailable.", "person_dialogues": [], "ambient_descriptions": []}
+
 @narration_agent.on_event("startup")
 async def introduce(ctx: Context):
     ctx.logger.info(f"📖 Narration Agent started: {narration_agent.address}")
+    await providers.warm_up("letta")
 
-@narration_agent.on_message(model=NarrationRequest)
-async def generate_narration(ctx: Context, sender: str, msg: NarrationRequest):
-    ctx.logger.info(f"✍️  [3/5] Generating narration for {msg.session_id}")
-
-    try:
-        ctx.logger.warning("🔥 USING LETTA AI FOR NARRATION GENERATION (NO GPT FALLBACK)")
-        prompt = f"""Create a narration JSON for an immersive audio experience based on the following data:
+async def narrate(msg: NarrationRequest, log,
+                  on_lead: Optional[Callable[[str], Awaitable[None]]] = None) -> NarrationData:
+    """Write the narration and per-person dialogue; `on_lead(main_narration)` is awaited as soon as that field is complete"""
+    log.warning("🔥 USING LETTA AI FOR NARRATION GENERATION (NO GPT FALLBACK)")
+    prompt = f"""Create a narration JSON for an immersive audio experience based on the following data:
 
 PERCEPTION DATA:
-{json.dumps(msg.perception, indent=2)}
+{json.dumps(blob_store.resolve(msg.perception, msg.perception_ref), indent=2)}
 
 EMOTION DATA:
-{json.dumps(msg.emotion, indent=2)}
+{json.dumps(blob_store.resolve(msg.emotion, msg.emotion_ref), indent=2)}
 
 Please output ONLY a valid JSON object with these exact keys:
 - main_narration: A 3-4 sentence description of the scene, focusing on spatial elements and atmosphere
@@ -43,42 +60,100 @@ Example output:
 {{
   "main_narration": "You stand on a serene beach at sunset, the warm golden light bathing the sand and gentle waves lapping at the shore.",
   "person_dialogues": [
-    {{"person_id": 1, "dialogue": "This view is breathtaking.", "emotion": "joyful"}},
-    {{"person_id": 2, "dialogue": "I could stay here forever.", "emotion": "content"}}
+{{"person_id": 1, "dialogue": "This view is breathtaking.", "emotion": "joyful"}},
+{{"person_id": 2, "dialogue": "I could stay here forever.", "emotion": "content"}}
   ],
   "ambient_descriptions": ["ocean waves", "sea breeze", "distant seagulls"]
 }}
 """
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            letta_response = await client.post(
-                f"https://api.letta.com/v1/agents/{NARRATION_AGENT_ID}/messages",
-                headers={"Authorization": f"Bearer {LETTA_API_KEY}"},
-                json={"messages": [{"role": "user", "content": prompt}], "stream": False}
-            )
+    async def send_letta(timeout):
+        return await providers.client("letta").post(
+            f"/v1/agents/{NARRATION_AGENT_ID}/messages",
+            headers={"Authorization": f"Bearer {LETTA_API_KEY}"},
+            json={"messages": [{"role": "user", "content": prompt}], "stream": False},
+            timeout=timeout
+        )
+
+    narration_text = None
+    lead = None
+    if NARRATION_STREAMING and on_lead is not None:
+        stream = json_repair.StreamingObject()
+        # Once Letta has sent any event it has taken the turn, so the prompt must not be sent again:
+        # a stream that breaks off after that is finished from what arrived (the parser closes truncated JSON)
+        received = False
+        for attempt in range(1, resilience.LETTA_POLICY.attempts + 1):
+            try:
+                async for event in providers.stream_events(
+                    "letta", f"/v1/agents/{NARRATION_AGENT_ID}/messages/stream",
+                    timeout=resilience.budget(msg.deadline, resilience.LETTA_POLICY.timeout),
+                    headers={"Authorization": f"Bearer {LETTA_API_KEY}"},
+                    json={"messages": [{"role": "user", "content": prompt}], "stream_tokens": True}
+                ):
+                    received = True
+                    if event.get("message_type") != "assistant_message" or not isinstance(event.get("content"), str):
+                        continue
+                    stream.feed(event["content"])
+                    if lead is None and isinstance(stream.fields.get("main_narration"), str):
+                        lead = stream.fields["main_narration"]
+                        log.info(f"   ⚡ main_narration complete after {len(stream.text)} chars - handing it on")
+                        await on_lead(lead)
+                narration_text = stream.text
+                break
+            except (httpx.HTTPError, ValueError) as e:
+                if received:
+                    log.warning(f"⚠️  Narration stream broke off ({e}) - using the {len(stream.text)} chars received")
+                    narration_text = stream.text
+                    break
+                retryable = isinstance(e, httpx.TransportError) or (
+                    isinstance(e, httpx.HTTPStatusError) and e.response.status_code in resilience.RETRYABLE_STATUSES)
+                delay = resilience.retry_delay(resilience.LETTA_POLICY, attempt, msg.deadline) if retryable else None
+                if delay is None:
+                    # No event came back, so Letta most likely never took the turn (e.g. no streaming endpoint)
+                    log.warning(f"⚠️  Streaming narration failed ({e}) - retrying without streaming")
+                    break
+                stats.incr("retries_letta_stream")
+                log.warning(f"🔁 letta_stream: attempt {attempt} failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    if narration_text is None:
+        letta_response = await resilience.call("letta", send_letta, resilience.LETTA_POLICY, msg.deadline)
         letta_data = letta_response.json()
         narration_text = next((m.get("content", "") for m in letta_data.get("messages", []) if m.get("message_type") == "assistant_message"), "{}")
 
-        json_start = narration_text.find('{')
-        json_end = narration_text.rfind('}') + 1
-        if json_start >= 0:
-            parsed = json.loads(narration_text[json_start:json_end])
-        else:
-            parsed = {"main_narration": "Scene description unavailable.", "person_dialogues": [], "ambient_descriptions": []}
-
-        result = NarrationData(
-            session_id=msg.session_id,
-            main_narration=parsed.get("main_narration", "Scene description unavailable."),
-            person_dialogues=parsed.get("person_dialogues", []),
-            ambient_descriptions=parsed.get("ambient_descriptions", [])
-        )
+    try:
+        parsed = json_repair.extract(narration_text)
+    except json_repair.JSONRepairError:
+        parsed = {}
+    if lead is not None:
+        # The narrator is already being voiced from this text, so it stays the narration
+        parsed["main_narration"] = lead
+
+    result = json_repair.validate(NarrationData, parsed, NARRATION_DEFAULTS, session_id=msg.session_id)
+    return result
+
+@narration_agent.on_message(model=NarrationRequest)
+async def generate_narration(ctx: Context, sender: str, msg: NarrationRequest):
+    if resilience.expired(msg.deadline):
+        ctx.logger.warning(f"⏰ Dropping expired narration request for {msg.session_id}")
+        return
+    ctx.logger.info(f"✍️  [3/5] Generating narration for {msg.session_id}")
+    load.begin()
+
+    try:
+        async def send_lead(main_narration: str):
+            await ctx.send(sender, NarrationLead(session_id=msg.session_id, main_narration=main_narration))
 
+        result = await narrate(msg, ctx.logger, on_lead=send_lead)
         await ctx.send(sender, result)
         ctx.logger.info(f"✅ Narration: {len(result.main_narration)} chars, {len(result.person_dialogues)} dialogues")
         ctx.logger.info(f"📊 Narration JSON: {result.__dict__}")
 
     except Exception as e:
+        load.failed()
         ctx.logger.error(f"❌ Error: {e}")
         await ctx.send(sender, ErrorMessage(session_id=msg.session_id, error=str(e), step="narration"))
+    finally:
+        load.end()
 
 if __name__ == "__main__":
     narration_agent.run()
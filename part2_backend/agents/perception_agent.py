@@ -3,7 +3,19 @@ from uagents import Agent, Context
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from fetch_models import VisionAnalysisRequest, PerceptionData, ErrorMessage
-import httpx, json
+import agent_health
+import resilience
+import providers
+import image_prep
+import phash_index
+import perception_runs
+import json_repair
+import scene_lexicon
+import stats
+import httpx
+import asyncio
+import json
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,236 +25,324 @@ perception_agent = Agent(
     seed="perception_seed_12345"
 )
 
+load = agent_health.AgentLoad()
+agent_health.register(perception_agent, load)
+
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 LETTA_API_KEY = os.getenv("LETTA_API_KEY")
 PERCEPTION_AGENT_ID = os.getenv("PERCEPTION_AGENT_ID")
 
+VISION_POLICY = resilience.RetryPolicy.from_env("VISION", attempts=2, timeout=60.0)
+# Two-hop mode: how long Letta extraction may take before the GPT-4o description is classified locally
+# with scene_lexicon instead (0 = no limit). PERCEPTION_LOCAL_FALLBACK=0 always waits for Letta.
+PERCEPTION_LOCAL_FALLBACK = os.getenv("PERCEPTION_LOCAL_FALLBACK", "1") == "1"
+PERCEPTION_LETTA_BUDGET = float(os.getenv("PERCEPTION_LETTA_BUDGET", "10"))
+# After Letta reports it is over quota, skip it for this long
+LETTA_QUOTA_STATUSES = {402, 429}
+LETTA_QUOTA_COOLDOWN = float(os.getenv("LETTA_QUOTA_COOLDOWN", "60"))
+_letta_skip_until = 0.0
+
+# "two_hop": GPT-4o describes the photo, then the Letta agent extracts JSON from the text.
+# "fused": one GPT-4o call returns the PerceptionData fields under a strict JSON schema.
+PERCEPTION_MODE = os.getenv("PERCEPTION_MODE", "two_hop")
+
+FUSED_PROMPT = ("Analyze this image for an immersive audio experience. List ALL visible objects, count the people "
+                "and describe each one's position, apparent age and mood, lay out what is in the foreground, center "
+                "and background, the dominant colors and the lighting, and the ambient sounds someone standing in "
+                "this scene would hear. Use short snake_case for scene_type (e.g. outdoor_beach, urban_city).")
+
+PERCEPTION_DEFAULTS = {
+    "objects": [], "people_count": 0, "people_details": [], "layout": {}, "scene_type": "unknown",
+    "setting": "unknown", "colors": [], "lighting": "natural", "ambient_sounds": []
+}
+
+_STRING = {"type": "string"}
+_STRINGS = {"type": "array", "items": _STRING}
+# Strict mode needs every property listed and required, so layout and people_details get fixed keys
+PERCEPTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "objects": _STRINGS,
+        "people_count": {"type": "integer"},
+        "people_details": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"position": _STRING, "description": _STRING, "apparent_age": _STRING, "apparent_mood": _STRING},
+                "required": ["position", "description", "apparent_age", "apparent_mood"],
+                "additionalProperties": False
+            }
+        },
+        "layout": {
+            "type": "object",
+            "properties": {"foreground": _STRING, "center": _STRING, "background": _STRING},
+            "required": ["foreground", "center", "background"],
+            "additionalProperties": False
+        },
+        "scene_type": _STRING,
+        "setting": _STRING,
+        "colors": _STRINGS,
+        "lighting": _STRING,
+        "ambient_sounds": _STRINGS
+    },
+    "required": ["objects", "people_count", "people_details", "layout", "scene_type",
+                 "setting", "colors", "lighting", "ambient_sounds"],
+    "additionalProperties": False
+}
+
 @perception_agent.on_event("startup")
 async def introduce(ctx: Context):
-    ctx.logger.info(f"🔍 Perception Agent started: {perception_agent.address}")
+    ctx.logger.info(f"🔍 Perception Agent started: {perception_agent.address} (mode: {PERCEPTION_MODE})")
+    await providers.warm_up("openai", "letta")
 
-@perception_agent.on_message(model=VisionAnalysisRequest)
-async def analyze_image(ctx: Context, sender: str, msg: VisionAnalysisRequest):
-    ctx.logger.info(f"📸 [1/5] Analyzing image for {msg.session_id}")
+async def perceive(msg: VisionAnalysisRequest, log) -> PerceptionData:
+    """Describe the photo and extract structured scene data"""
+    # Step 0: a near-duplicate of an already analyzed photo reuses its perception
+    photo_hash = None
+    if phash_index.PHASH_ENABLED:
+        try:
+            photo_hash = await asyncio.to_thread(phash_index.dhash, await image_prep.fetch(msg.photo_url))
+            match = phash_index.lookup(photo_hash)
+            if match:
+                perception, distance = match
+                log.info(f"   ♻️  Near-duplicate photo (distance {distance}) - reusing its perception")
+                return PerceptionData(session_id=msg.session_id, **perception)
+        except Exception as e:
+            log.warning(f"   ⚠️  Near-duplicate lookup skipped: {e}")
+
+    # Step 1: the image as sent to GPT-4o (downscaled data URL, or the raw URL)
+    image_part = {"url": msg.photo_url}
+    image_mode = "url"
+    if image_prep.IMAGE_PREP_ENABLED:
+        try:
+            prepared = await image_prep.prepare_url(msg.photo_url)
+            image_part = {"url": prepared.data_url, "detail": prepared.detail}
+            image_mode = "prepared"
+            log.info(f"   🖼️  Image prepared: {prepared.original_bytes} → {prepared.bytes} bytes, "
+                     f"{prepared.width}x{prepared.height} {prepared.detail} detail (~{prepared.est_tokens} tokens, {prepared.prep_ms:.0f}ms)")
+        except Exception as e:
+            # OpenAI can still fetch the original itself
+            log.warning(f"   ⚠️  Image prep failed, sending the raw URL: {e}")
 
+    if PERCEPTION_MODE == "fused":
+        parsed, usage = await extract_fused(msg, image_part, image_mode, log)
+    else:
+        parsed, usage = await extract_two_hop(msg, image_part, image_mode, log)
+    mode = usage.pop("mode", PERCEPTION_MODE)
+    log.info(f"   ⏱️  Perception ({mode}): {usage['vision_ms'] + usage['extraction_ms']:.0f}ms, "
+             f"{usage['prompt_tokens']} prompt + {usage['completion_tokens']} completion tokens")
     try:
-        # Step 1: OpenAI Vision
-        ctx.logger.warning("🔥 USING GPT-4o FOR VISION ANALYSIS (REQUIRED)")
-        ctx.logger.info("   → GPT-4o Vision analysis...")
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            vision_response = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
-                json={
-                    "model": "gpt-4o",
-                    "messages": [{
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": "Analyze this image in extreme detail. Describe: 1) ALL objects, 2) Number of people and their positions/moods, 3) Spatial layout, 4) Colors/lighting, 5) Scene context. Be exhaustive."},
-                            {"type": "image_url", "image_url": {"url": msg.photo_url}}
-                        ]
-                    }],
-                    "max_tokens": 800
-                }
-            )
-            vision_desc = vision_response.json()["choices"][0]["message"]["content"]
-            ctx.logger.info(f"   ✓ Vision complete ({len(vision_desc)} chars)")
-            ctx.logger.info(f"   📝 Vision preview: {vision_desc[:200]}...")
-
-        # Step 2: Letta AI structured extraction (REQUIRED - no fallback)
-        ctx.logger.warning("🔥 USING LETTA AI FOR STRUCTURED EXTRACTION (REQUIRED - NO GPT FALLBACK)")
-        ctx.logger.info("   → Letta AI extraction (REQUIRED)")
-        ctx.logger.info(f"   Calling agent: {PERCEPTION_AGENT_ID}")
-        ctx.logger.info(f"   Input length: {len(vision_desc)} characters")
-
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            letta_response = await client.post(
-                f"https://api.letta.com/v1/agents/{PERCEPTION_AGENT_ID}/messages",
-                headers={"Authorization": f"Bearer {LETTA_API_KEY}"},
-                json={"messages": [{"role": "user", "content": f"Extract structured data:\\n\\n{vision_desc}"}], "stream": False}
-            )
-
-            ctx.logger.info(f"   HTTP Status: {letta_response.status_code}")
-
-            if letta_response.status_code != 200:
-                ctx.logger.error(f"   ❌ HTTP Error: {letta_response.status_code}")
-                ctx.logger.error(f"   Response headers: {dict(letta_response.headers)}")
-                ctx.logger.error(f"   Response body: {letta_response.text}")
-                raise Exception(f"Letta AI HTTP error {letta_response.status_code}: {letta_response.text}")
-
-            letta_data = letta_response.json()
-            ctx.logger.info(f"   📦 Raw API response: {json.dumps(letta_data, indent=2)}")
-
-            perception_text = next((m.get("content", "") for m in letta_data.get("messages", []) if m.get("message_type") == "assistant_message"), "{}")
-            ctx.logger.info(f"   📝 Extracted assistant content: {perception_text}")
-
-            # Parse JSON (handle mixed quotes from Letta AI)
-            json_start = perception_text.find('{')
-            json_end = perception_text.rfind('}') + 1
-            if json_start >= 0 and json_end > json_start:
-                json_content = perception_text[json_start:json_end]
-                # Fix mixed quotes by replacing single quotes around keys/values
-                import re
-                # Replace single quotes around keys and string values with double quotes
-                json_content = re.sub(r"'([^']*)':", r'"\1":', json_content)  # Keys
-                json_content = re.sub(r": '([^']*)'", r': "\1"', json_content)  # String values
-                json_content = re.sub(r": '([^']*)',", r': "\1",', json_content)  # String values with comma
-                json_content = re.sub(r": '([^']*)'}", r': "\1"}', json_content)  # String values at end
-                # Fix single quotes in arrays: ['item1', 'item2'] -> ["item1", "item2"]
-                json_content = re.sub(r"'([^']*)'", r'"\1"', json_content)
-
-                try:
-                    parsed = json.loads(json_content)
-                    ctx.logger.info("   ✓ JSON parsing successful")
-                    
-                    # Flatten nested dicts in layout to strings
-                    if "layout" in parsed and isinstance(parsed["layout"], dict):
-                        flattened_layout = {}
-                        for key, value in parsed["layout"].items():
-                            if isinstance(value, dict):
-                                # Convert nested dict to string
-                                flattened_layout[key] = ", ".join(f"{k}: {v}" for k, v in value.items() if v)
-                            else:
-                                flattened_layout[key] = str(value) if value else ""
-                        parsed["layout"] = flattened_layout
-                        ctx.logger.info(f"   ✓ Flattened nested layout: {flattened_layout}")
-                    
-                except json.JSONDecodeError as e:
-                    ctx.logger.error(f"   ❌ JSON parsing failed even after quote fix: {e}")
-                    ctx.logger.error(f"   Fixed content: {json_content}")
-                    raise Exception(f"Letta AI returned unparseable JSON: {json_content}")
+        perception_runs.record(msg.session_id, mode, **usage)
+    except Exception as e:
+        log.warning(f"   ⚠️  Could not record perception run: {e}")
+
+    result = json_repair.validate(PerceptionData, parsed, PERCEPTION_DEFAULTS, session_id=msg.session_id)
+    # Lexicon results are a stand-in for Letta's; don't let near-duplicates reuse them
+    if photo_hash is not None and mode != "two_hop_local":
+        try:
+            phash_index.remember(photo_hash, {k: v for k, v in result.__dict__.items() if k != "session_id"})
+        except Exception as e:
+            log.warning(f"   ⚠️  Could not index perception for near-duplicates: {e}")
+    return result
+
+async def extract_two_hop(msg: VisionAnalysisRequest, image_part: dict, image_mode: str, log):
+    """GPT-4o free-text description, then the Letta agent turns it into JSON; returns (parsed, usage)"""
+    global _letta_skip_until
+    # Step 2: OpenAI Vision
+    log.warning("🔥 USING GPT-4o FOR VISION ANALYSIS (REQUIRED)")
+    log.info("   → GPT-4o Vision analysis...")
+
+
+    async def send_vision(timeout):
+        return await providers.client("openai").post(
+            "/v1/chat/completions",
+            headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
+            json={
+                "model": "gpt-4o",
+                "messages": [{
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": "Analyze this image in extreme detail. Describe: 1) ALL objects, 2) Number of people and their positions/moods, 3) Spatial layout, 4) Colors/lighting, 5) Scene context. Be exhaustive."},
+                        {"type": "image_url", "image_url": image_part}
+                    ]
+                }],
+                "max_tokens": 800
+            },
+            timeout=timeout
+        )
+
+    vision_started = time.perf_counter()
+    vision_response = await resilience.call("vision", send_vision, VISION_POLICY, msg.deadline)
+    vision_ms = (time.perf_counter() - vision_started) * 1000
+    image_prep.record_vision(image_mode, vision_ms)
+    vision_data = vision_response.json()
+    vision_usage = vision_data.get("usage") or {}
+    vision_desc = vision_data["choices"][0]["message"]["content"]
+    log.info(f"   ✓ Vision complete ({len(vision_desc)} chars)")
+    log.info(f"   📝 Vision preview: {vision_desc[:200]}...")
+
+    # Step 3: Letta AI structured extraction, or the local lexicon classifier when Letta is over quota or slow
+    if PERCEPTION_LOCAL_FALLBACK and time.time() < _letta_skip_until:
+        log.warning("   ⚡ Letta is over quota - classifying the description locally")
+        return classify_locally(vision_desc, vision_ms, vision_usage)
+
+    log.warning("🔥 USING LETTA AI FOR STRUCTURED EXTRACTION")
+    log.info("   → Letta AI extraction")
+    log.info(f"   Calling agent: {PERCEPTION_AGENT_ID}")
+    log.info(f"   Input length: {len(vision_desc)} characters")
+
+    async def send_letta(timeout):
+        return await providers.client("letta").post(
+            f"/v1/agents/{PERCEPTION_AGENT_ID}/messages",
+            headers={"Authorization": f"Bearer {LETTA_API_KEY}"},
+            json={"messages": [{"role": "user", "content": f"Extract structured data:\\n\\n{vision_desc}"}], "stream": False},
+            timeout=timeout
+        )
+
+    extraction_started = time.perf_counter()
+    letta_call = resilience.call("letta", send_letta, resilience.LETTA_POLICY, msg.deadline)
+    if not PERCEPTION_LOCAL_FALLBACK:
+        letta_response = await letta_call
+    else:
+        try:
+            letta_response = await asyncio.wait_for(letta_call, PERCEPTION_LETTA_BUDGET or None)
+        except asyncio.TimeoutError:
+            log.warning(f"   ⚡ Letta didn't answer within {PERCEPTION_LETTA_BUDGET}s - classifying the description locally")
+            return classify_locally(vision_desc, vision_ms, vision_usage)
+        except httpx.TransportError as e:
+            log.warning(f"   ⚡ Letta unreachable ({e}) - classifying the description locally")
+            return classify_locally(vision_desc, vision_ms, vision_usage)
+        if letta_response.status_code in LETTA_QUOTA_STATUSES:
+            _letta_skip_until = time.time() + LETTA_QUOTA_COOLDOWN
+            log.warning(f"   ⚡ Letta over quota (HTTP {letta_response.status_code}) - classifying locally "
+                        f"for the next {LETTA_QUOTA_COOLDOWN:.0f}s")
+            return classify_locally(vision_desc, vision_ms, vision_usage)
+
+    log.info(f"   HTTP Status: {letta_response.status_code}")
+
+    if letta_response.status_code != 200:
+        log.error(f"   ❌ HTTP Error: {letta_response.status_code}")
+        log.error(f"   Response headers: {dict(letta_response.headers)}")
+        log.error(f"   Response body: {letta_response.text}")
+        raise Exception(f"Letta AI HTTP error {letta_response.status_code}: {letta_response.text}")
+
+    letta_data = letta_response.json()
+    letta_usage = letta_data.get("usage") or {}
+    log.info(f"   📦 Raw API response: {json.dumps(letta_data, indent=2)}")
+
+    perception_text = next((m.get("content", "") for m in letta_data.get("messages", []) if m.get("message_type") == "assistant_message"), "{}")
+    log.info(f"   📝 Extracted assistant content: {perception_text}")
+
+    # Parse JSON (Letta mixes quotes and wraps the object in prose)
+    try:
+        parsed = json_repair.extract(perception_text)
+    except json_repair.JSONRepairError as e:
+        log.error(f"   ❌ No valid JSON found in assistant response: {e}")
+        log.error(f"   Content: {perception_text}")
+        raise Exception(f"Letta AI returned invalid JSON: {perception_text}")
+    log.info("   ✓ JSON parsing successful")
+
+    # Flatten nested dicts in layout to strings
+    if "layout" in parsed and isinstance(parsed["layout"], dict):
+        flattened_layout = {}
+        for key, value in parsed["layout"].items():
+            if isinstance(value, dict):
+                # Convert nested dict to string
+                flattened_layout[key] = ", ".join(f"{k}: {v}" for k, v in value.items() if v)
             else:
-                ctx.logger.error("   ❌ No valid JSON found in assistant response")
-                ctx.logger.error(f"   Content: {perception_text}")
-                raise Exception(f"Letta AI returned invalid JSON: {perception_text}")
-
-        result = PerceptionData(
-            session_id=msg.session_id,
-            objects=parsed.get("objects", []),
-            people_count=parsed.get("people_count", 0),
-            people_details=parsed.get("people_details", []),
-            layout=parsed.get("layout", {}),
-            scene_type=parsed.get("scene_type", "unknown"),
-            setting=parsed.get("setting", "unknown"),
-            colors=parsed.get("colors", []),
-            lighting=parsed.get("lighting", "natural"),
-            ambient_sounds=parsed.get("ambient_sounds", [])
+                flattened_layout[key] = str(value) if value else ""
+        parsed["layout"] = flattened_layout
+        log.info(f"   ✓ Flattened nested layout: {flattened_layout}")
+
+
+    return parsed, {
+        "vision_ms": vision_ms,
+        "extraction_ms": (time.perf_counter() - extraction_started) * 1000,
+        "prompt_tokens": vision_usage.get("prompt_tokens", 0) + letta_usage.get("prompt_tokens", 0),
+        "completion_tokens": vision_usage.get("completion_tokens", 0) + letta_usage.get("completion_tokens", 0)
+    }
+
+def classify_locally(vision_desc: str, vision_ms: float, vision_usage: dict):
+    """scene_lexicon instead of the Letta hop; returns (parsed, usage) like extract_two_hop"""
+    started = time.perf_counter()
+    parsed = scene_lexicon.classify(vision_desc)
+    stats.incr("perception_local_classifications")
+    return parsed, {
+        "mode": "two_hop_local",
+        "vision_ms": vision_ms,
+        "extraction_ms": (time.perf_counter() - started) * 1000,
+        "prompt_tokens": vision_usage.get("prompt_tokens", 0),
+        "completion_tokens": vision_usage.get("completion_tokens", 0)
+    }
+
+async def extract_fused(msg: VisionAnalysisRequest, image_part: dict, image_mode: str, log):
+    """One GPT-4o call that returns the PerceptionData fields directly (strict JSON schema); returns (parsed, usage)"""
+    log.info("   → GPT-4o fused vision + extraction...")
+
+    async def send_fused(timeout):
+        return await providers.client("openai").post(
+            "/v1/chat/completions",
+            headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
+            json={
+                "model": "gpt-4o",
+                "messages": [{
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": FUSED_PROMPT},
+                        {"type": "image_url", "image_url": image_part}
+                    ]
+                }],
+                "response_format": {
+                    "type": "json_schema",
+                    "json_schema": {"name": "perception", "strict": True, "schema": PERCEPTION_SCHEMA}
+                },
+                "max_tokens": 800
+            },
+            timeout=timeout
         )
 
+    started = time.perf_counter()
+    response = await resilience.call("vision", send_fused, VISION_POLICY, msg.deadline)
+    vision_ms = (time.perf_counter() - started) * 1000
+    image_prep.record_vision(image_mode, vision_ms)
+    data = response.json()
+    message = data["choices"][0]["message"]
+    if message.get("refusal"):
+        raise Exception(f"GPT-4o refused the fused perception request: {message['refusal']}")
+    parsed = json_repair.extract(message["content"])
+    log.info("   ✓ Fused perception complete")
+    usage = data.get("usage") or {}
+    return parsed, {
+        "vision_ms": vision_ms,
+        "extraction_ms": 0.0,
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0)
+    }
+
+@perception_agent.on_message(model=VisionAnalysisRequest)
+async def analyze_image(ctx: Context, sender: str, msg: VisionAnalysisRequest):
+    if resilience.expired(msg.deadline):
+        ctx.logger.warning(f"⏰ Dropping expired perception request for {msg.session_id}")
+        return
+    ctx.logger.info(f"📸 [1/5] Analyzing image for {msg.session_id}")
+    load.begin()
+
+    try:
+        result = await perceive(msg, ctx.logger)
         await ctx.send(sender, result)
         ctx.logger.info(f"✅ Perception: {result.people_count} people, {len(result.objects)} objects")
         ctx.logger.info(f"📊 Perception JSON: {result.__dict__}")
 
     except Exception as e:
+        load.failed()
         ctx.logger.error(f"❌ Error: {e}")
         await ctx.send(sender, ErrorMessage(session_id=msg.session_id, error=str(e), step="perception"))
+    finally:
+        load.end()
 
 def parse_vision_fallback(vision_text: str) -> dict:
     """Parse GPT-4o vision response into structured perception data"""
-    vision_lower = vision_text.lower()
-
-    # Extract objects mentioned
-    objects = []
-    if "wave" in vision_lower or "ocean" in vision_lower or "water" in vision_lower:
-        objects.extend(["waves", "ocean", "water"])
-    if "sand" in vision_lower or "beach" in vision_lower:
-        objects.extend(["sand", "beach"])
-    if "cloud" in vision_lower or "sky" in vision_lower:
-        objects.extend(["clouds", "sky"])
-    if "palm" in vision_lower or "tree" in vision_lower:
-        objects.extend(["palm trees", "trees"])
-    if "sun" in vision_lower:
-        objects.extend(["sun"])
-    if "mountain" in vision_lower or "peak" in vision_lower:
-        objects.extend(["mountains", "peaks"])
-    if "building" in vision_lower or "city" in vision_lower:
-        objects.extend(["buildings", "city"])
-    if "car" in vision_lower or "vehicle" in vision_lower:
-        objects.extend(["cars", "vehicles"])
-
-    # Remove duplicates and filter
-    objects = list(set(objects))[:8]  # Limit to 8 objects
-
-    # Extract people count
-    people_count = 0
-    people_details = []
-    if "person" in vision_lower or "people" in vision_lower or "man" in vision_lower or "woman" in vision_lower:
-        # Simple heuristic - look for numbers before "person/people"
-        import re
-        numbers = re.findall(r'(\d+)\s*(?:person|people|man|woman)', vision_lower)
-        if numbers:
-            people_count = sum(int(n) for n in numbers)
-        else:
-            people_count = 1  # Default to 1 if mentioned but no number
-
-        # Create basic people details
-        for i in range(min(people_count, 3)):  # Max 3 people details
-            position = "center" if i == 0 else ("left" if i == 1 else "right")
-            people_details.append({
-                "position": position,
-                "description": f"person {i+1}",
-                "apparent_age": "adult",
-                "apparent_mood": "neutral"
-            })
-
-    # Determine scene type and setting
-    if "beach" in vision_lower or "ocean" in vision_lower or "wave" in vision_lower:
-        scene_type = "outdoor_beach"
-        setting = "tropical beach at sunset"
-        ambient_sounds = ["waves", "seagulls", "wind"]
-    elif "mountain" in vision_lower or "peak" in vision_lower:
-        scene_type = "outdoor_mountain"
-        setting = "mountain landscape"
-        ambient_sounds = ["wind", "birds"]
-    elif "city" in vision_lower or "urban" in vision_lower or "building" in vision_lower:
-        scene_type = "urban_city"
-        setting = "urban cityscape"
-        ambient_sounds = ["traffic", "people"]
-    elif "forest" in vision_lower or "tree" in vision_lower:
-        scene_type = "outdoor_forest"
-        setting = "peaceful forest"
-        ambient_sounds = ["birds", "wind", "leaves"]
-    else:
-        scene_type = "outdoor_nature"
-        setting = "natural outdoor scene"
-        ambient_sounds = ["nature sounds"]
-
-    # Extract colors
-    colors = []
-    color_keywords = ["blue", "green", "yellow", "orange", "red", "purple", "pink", "white", "black", "brown", "gold", "silver"]
-    for color in color_keywords:
-        if color in vision_lower:
-            colors.append(color)
-    colors = colors[:5]  # Limit to 5 colors
-
-    # Determine lighting
-    if "sunset" in vision_lower or "sun" in vision_lower:
-        lighting = "warm golden hour"
-    elif "night" in vision_lower or "dark" in vision_lower:
-        lighting = "nighttime"
-    elif "cloud" in vision_lower or "overcast" in vision_lower:
-        lighting = "diffuse natural light"
-    else:
-        lighting = "natural daylight"
-
-    # Create layout based on scene
-    layout = {
-        "foreground": " | ".join(objects[:3]),
-        "center": f"main {scene_type.split('_')[1]} scene",
-        "background": f"distant {scene_type.split('_')[0]} elements"
-    }
-
-    return {
-        "objects": objects,
-        "people_count": people_count,
-        "people_details": people_details,
-        "layout": layout,
-        "scene_type": scene_type,
-        "setting": setting,
-        "colors": colors,
-        "lighting": lighting,
-        "ambient_sounds": ambient_sounds
-    }
+    return scene_lexicon.classify(vision_text)
 
 if __name__ == "__main__":
     perception_agent.run()
@@ -3,7 +3,12 @@ from uagents import Agent, Context
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from fetch_models import VoiceRequest, VoiceData, ErrorMessage
-import httpx, json, uuid
+import agent_health
+import resilience
+import providers
+import blob_store
+import asyncio
+import audio_store
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,91 +18,126 @@ voice_agent = Agent(
     seed="voice_seed_22222"
 )
 
+load = agent_health.AgentLoad()
+agent_health.register(voice_agent, load)
+
 FISH_AUDIO_API_KEY = os.getenv("FISH_AUDIO_API_KEY")
 FISH_AUDIO_REFERENCE_ID = os.getenv("FISH_AUDIO_REFERENCE_ID", "b545c585f631496c914815291da4e893")  # Default to provided ID
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Max TTS calls in flight across all sessions
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "4"))
+
+tts_slots = asyncio.Semaphore(TTS_CONCURRENCY)
+
+# TTS is stateless and its latency has a long tail, so slow calls get a hedged duplicate
+FISH_POLICY = resilience.RetryPolicy.from_env("FISH_TTS", attempts=2, timeout=60.0, hedge_after=10.0)
+OPENAI_TTS_POLICY = resilience.RetryPolicy.from_env("OPENAI_TTS", attempts=3, timeout=60.0, hedge_after=10.0)
 
 @voice_agent.on_event("startup")
 async def introduce(ctx: Context):
     ctx.logger.info(f"🎵 Voice Agent started: {voice_agent.address}")
+    await providers.warm_up("fish", "openai")
 
-@voice_agent.on_message(model=VoiceRequest)
-async def generate_voices(ctx: Context, sender: str, msg: VoiceRequest):
-    ctx.logger.info(f"🎤 [4/5] Generating voices for {msg.session_id}")
-
-    try:
-        voice_files = []
+async def synthesize(msg: VoiceRequest, log) -> VoiceData:
+    """Synthesize the requested part's lines and return their audio URLs"""
+    narration_data = blob_store.resolve(msg.narration_data, msg.narration_ref)
 
-        # Generate main narration
-        narration_text = msg.narration_data.get("main_narration", "")
-        if narration_text:
-            voice_url = await generate_tts(narration_text, "main_narrator", msg.emotion_data)
-            voice_files.append({"type": "narration", "position": "center", "url": voice_url, "text": narration_text})
+    # Lines to synthesize: (speaker, voice_file metadata) for the requested part
+    lines = []
+    narration_text = narration_data.get("main_narration", "")
+    if narration_text and msg.part in ("narrator", "all"):
+        lines.append(("main_narrator", {"type": "narration", "position": "center", "text": narration_text}))
 
-        # Generate person dialogues
-        dialogues = msg.narration_data.get("person_dialogues", [])
+    if msg.part in ("dialogue", "all"):
+        dialogues = narration_data.get("person_dialogues", [])
         for i, dialogue in enumerate(dialogues):
             person_id = dialogue.get("person_id", i+1)
             text = dialogue.get("dialogue", "")
             if text:
                 position = "left" if person_id == 1 else "right"
-                voice_url = await generate_tts(text, f"person_{person_id}", msg.emotion_data)
-                voice_files.append({"type": "dialogue", "position": position, "person_id": person_id, "url": voice_url, "text": text})
+                lines.append((f"person_{person_id}", {"type": "dialogue", "position": position, "person_id": person_id, "text": text}))
+
+    # Synthesize all lines concurrently (bounded by TTS_CONCURRENCY), keeping their order
+    urls = await asyncio.gather(*(
+        generate_tts_limited(info["text"], speaker, msg.deadline) for speaker, info in lines
+    ))
+    voice_files = [dict(info, url=url) for (_, info), url in zip(lines, urls)]
 
-        result = VoiceData(session_id=msg.session_id, voice_files=voice_files)
+    result = VoiceData(session_id=msg.session_id, voice_files=voice_files, part=msg.part)
+    return result
+
+@voice_agent.on_message(model=VoiceRequest)
+async def generate_voices(ctx: Context, sender: str, msg: VoiceRequest):
+    if resilience.expired(msg.deadline):
+        ctx.logger.warning(f"⏰ Dropping expired {msg.part} voice request for {msg.session_id}")
+        return
+    ctx.logger.info(f"🎤 [4/5] Generating {msg.part} voices for {msg.session_id}")
+    load.begin()
+
+    try:
+        result = await synthesize(msg, ctx.logger)
         await ctx.send(sender, result)
-        ctx.logger.info(f"✅ Voice: {len(voice_files)} audio files generated")
+        ctx.logger.info(f"✅ Voice: {len(result.voice_files)} audio files generated")
         ctx.logger.info(f"📊 Voice JSON: {result.__dict__}")
 
     except Exception as e:
+        load.failed()
         ctx.logger.error(f"❌ Error: {e}")
-        await ctx.send(sender, ErrorMessage(session_id=msg.session_id, error=str(e), step="voice"))
+        await ctx.send(sender, ErrorMessage(session_id=msg.session_id, error=str(e), step=f"{msg.part}_voice"))
+    finally:
+        load.end()
+
+async def generate_tts_limited(text: str, speaker: str, deadline=None) -> str:
+    async with tts_slots:
+        return await generate_tts(text, speaker, deadline)
 
-async def generate_tts(text: str, speaker: str, emotion_data: dict) -> str:
+async def generate_tts(text: str, speaker: str, deadline=None) -> str:
     """Generate TTS using Fish Audio or fallback to OpenAI"""
     try:
         # Try Fish Audio first
         print("🔥 USING FISH AUDIO FOR TTS (PREFERRED)")
         if FISH_AUDIO_API_KEY and FISH_AUDIO_REFERENCE_ID:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    "https://api.fish.audio/v1/tts",
+            async def send_fish(timeout):
+                return await providers.client("fish").post(
+                    "/v1/tts",
                     headers={"Authorization": f"Bearer {FISH_AUDIO_API_KEY}"},
                     json={
                         "text": text,
                         "reference_id": FISH_AUDIO_REFERENCE_ID,
                         "format": "mp3",
                         "mp3_bitrate": 128
-                    }
+                    },
+                    timeout=timeout
                 )
-                if response.status_code == 200:
-                    # Save to file and return URL
-                    filename = f"storage/audio/{uuid.uuid4()}.mp3"
-                    with open(filename, "wb") as f:
-                        f.write(response.content)
-                    return f"http://localhost:9000/static/{os.path.basename(filename)}"
-                else:
-                    print(f"🔥 FISH AUDIO FAILED: Status {response.status_code}")
+
+            response = await resilience.call("fish_tts", send_fish, FISH_POLICY, deadline)
+            if response.status_code == 200:
+                # Save to a content-addressed file and return URL
+                return audio_store.audio_url(audio_store.save_audio(response.content))
+            else:
+                print(f"🔥 FISH AUDIO FAILED: Status {response.status_code}")
+    except resilience.DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"🔥 FISH AUDIO ERROR: {e}")
         pass
 
     # Fallback to OpenAI TTS
     print("🔥 FALLBACK: USING OPENAI TTS (FISH AUDIO FAILED)")
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(
-            "https://api.openai.com/v1/audio/speech",
+    async def send_openai(timeout):
+        return await providers.client("openai").post(
+            "/v1/audio/speech",
             headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
             json={
                 "model": "tts-1",
                 "input": text,
                 "voice": "alloy"
-            }
+            },
+            timeout=timeout
         )
-        filename = f"storage/audio/{uuid.uuid4()}.mp3"
-        with open(filename, "wb") as f:
-            f.write(response.content)
-        return f"http://localhost:9000/static/{os.path.basename(filename)}"
+
+    response = await resilience.call("openai_tts", send_openai, OPENAI_TTS_POLICY, deadline)
+    return audio_store.audio_url(audio_store.save_audio(response.content))
 
 if __name__ == "__main__":
     voice_agent.run()
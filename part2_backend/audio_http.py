@@ -0,0 +1,105 @@
+# audio_http.py
+"""HTTP serving for generated audio: strong ETags, immutable caching and byte-range (206) responses"""
+import os
+from typing import Optional, Tuple
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+import audio_store
+
+CHUNK_SIZE = 64 * 1024
+# Optional proxy offload: e.g. AUDIO_SENDFILE_HEADER=X-Accel-Redirect with AUDIO_SENDFILE_PREFIX=/internal-audio/
+# lets nginx stream the file with sendfile() instead of this process
+AUDIO_SENDFILE_HEADER = os.getenv("AUDIO_SENDFILE_HEADER", "")
+AUDIO_SENDFILE_PREFIX = os.getenv("AUDIO_SENDFILE_PREFIX", "/internal-audio/")
+
+
+def _etag(filename: str, stat: os.stat_result) -> str:
+    digest = audio_store.content_hash(filename)
+    if digest is None:
+        # Like nginx: size and mtime, so a file without a content-hash name is never read just to tag it
+        digest = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    return f'"{digest}"'
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """(start, end) inclusive for a single `bytes=` range; None means serve the whole file.
+
+    Raises ValueError for a syntactically valid range that can't be satisfied.
+    """
+    if not header.startswith("bytes=") or "," in header:
+        return None  # multi-range requests get the full body, which RFC 9110 allows
+    start_s, _, end_s = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_s == "":
+            length = int(end_s)
+            if length <= 0:
+                raise ValueError("empty suffix range")
+            return max(0, size - length), size - 1
+        start = int(start_s)
+        end = int(end_s) if end_s else size - 1
+    except ValueError:
+        if start_s == "" or start_s.isdigit():
+            raise
+        return None
+    if start >= size or end < start:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
+
+
+def _iter_file(path: str, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def audio_response(request: Request, filename: str) -> Response:
+    if filename != os.path.basename(filename) or filename.startswith("."):
+        raise HTTPException(status_code=404, detail="Audio file not found")
+    path = audio_store.audio_path(filename)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Audio file not found")
+
+    etag = _etag(filename, stat)
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        # Content-hash names never change content, so browsers and proxies can keep them forever
+        "Cache-Control": "public, max-age=31536000, immutable" if audio_store.content_hash(filename) else "public, no-cache"
+    }
+    media_type = "audio/mpeg" if filename.endswith(".mp3") else "application/octet-stream"
+
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    if AUDIO_SENDFILE_HEADER:
+        # The proxy handles ranges and zero-copy transfer itself
+        headers[AUDIO_SENDFILE_HEADER] = f"{AUDIO_SENDFILE_PREFIX}{filename}"
+        return Response(status_code=200, headers=headers, media_type=media_type)
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", etag) == etag:
+        try:
+            byte_range = _parse_range(range_header, stat.st_size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{stat.st_size}"
+            return Response(status_code=416, headers=headers)
+
+    start, end = byte_range or (0, stat.st_size - 1)
+    length = end - start + 1 if stat.st_size else 0
+    headers["Content-Length"] = str(length)
+    status_code = 200
+    if byte_range:
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    return StreamingResponse(_iter_file(path, start, length), status_code=status_code, headers=headers, media_type=media_type)
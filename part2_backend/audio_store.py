@@ -0,0 +1,43 @@
+# audio_store.py
+"""Content-addressed storage for generated audio: files are named by the hash of their bytes"""
+import hashlib
+import os
+import re
+import tempfile
+from typing import Optional
+from state_db import BASE_DIR
+import metrics
+
+AUDIO_DIR = os.path.join(BASE_DIR, "storage", "audio")
+AUDIO_BASE_URL = os.getenv("AUDIO_BASE_URL", "http://localhost:9000/static")
+
+_HASHED_NAME = re.compile(r"^(?:[a-z]+_)?([0-9a-f]{20})\.mp3$")
+
+
+def save_audio(data: bytes, prefix: str = "") -> str:
+    """Write `data` as <prefix><sha256[:20]>.mp3 (atomically, once) and return the filename"""
+    filename = f"{prefix}{hashlib.sha256(data).hexdigest()[:20]}.mp3"
+    path = os.path.join(AUDIO_DIR, filename)
+    if not os.path.exists(path):
+        os.makedirs(AUDIO_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=AUDIO_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    metrics.AUDIO_BYTES.inc(len(data), kind=prefix.rstrip("_") or "voice")
+    return filename
+
+
+def audio_url(filename: str) -> str:
+    return f"{AUDIO_BASE_URL}/{filename}"
+
+
+def audio_path(url_or_filename: str) -> str:
+    """Local path for an audio URL or filename (only the basename is trusted)"""
+    return os.path.join(AUDIO_DIR, os.path.basename(url_or_filename))
+
+
+def content_hash(filename: str) -> Optional[str]:
+    """The content hash embedded in a save_audio() filename, or None for other files"""
+    match = _HASHED_NAME.match(filename)
+    return match.group(1) if match else None
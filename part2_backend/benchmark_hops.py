@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Per-hop overhead: uagents Bureau messages vs direct in-process calls (embedded mode)
+Usage: python3 benchmark_hops.py [--mode both|direct|bureau] [--hops 500] [--payload-bytes 4096]
+       python3 benchmark_hops.py --photo <url>   # also time one embedded run_experience() (needs API keys)
+
+The handler does no work, so the numbers are pure messaging cost: the Bureau
+path signs, serializes and dispatches an envelope per hop; the direct path is
+a model construction plus an await.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Add the project root to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from uagents import Agent, Bureau, Context, Model
+
+
+class BenchPing(Model):
+    seq: int
+    payload: str
+
+
+class BenchPong(Model):
+    seq: int
+    payload: str
+
+
+def report(label: str, samples_ms):
+    samples_ms = sorted(samples_ms)
+    p99 = samples_ms[min(len(samples_ms) - 1, int(len(samples_ms) * 0.99))]
+    print(f"{label:>8}: {len(samples_ms)} hops  mean {statistics.mean(samples_ms) * 1000:8.1f}µs  "
+          f"p50 {statistics.median(samples_ms) * 1000:8.1f}µs  p99 {p99 * 1000:8.1f}µs")
+
+
+async def bench_direct(hops: int, payload: str):
+    """What embedded.py does per hop: build the request model and await the handler"""
+    async def handler(msg: BenchPing) -> BenchPong:
+        return BenchPong(seq=msg.seq, payload=msg.payload)
+
+    samples = []
+    for seq in range(hops):
+        started = time.perf_counter()
+        await handler(BenchPing(seq=seq, payload=payload))
+        samples.append((time.perf_counter() - started) * 1000)
+    report("direct", samples)
+
+
+def bench_bureau(hops: int, payload: str, port: int):
+    """Ping-pong between two agents in one Bureau (like run_agents.py); a hop is half a round trip"""
+    ping = Agent(name="bench_ping", seed="bench_ping_seed_98765")
+    pong = Agent(name="bench_pong", seed="bench_pong_seed_98765")
+    samples = []
+    sent_at = {}
+
+    @pong.on_message(model=BenchPing)
+    async def reply(ctx: Context, sender: str, msg: BenchPing):
+        await ctx.send(sender, BenchPong(seq=msg.seq, payload=msg.payload))
+
+    @ping.on_event("startup")
+    async def start(ctx: Context):
+        sent_at[0] = time.perf_counter()
+        await ctx.send(pong.address, BenchPing(seq=0, payload=payload))
+
+    @ping.on_message(model=BenchPong)
+    async def on_pong(ctx: Context, sender: str, msg: BenchPong):
+        samples.append((time.perf_counter() - sent_at.pop(msg.seq)) * 1000 / 2)
+        if msg.seq + 1 < hops:
+            sent_at[msg.seq + 1] = time.perf_counter()
+            await ctx.send(pong.address, BenchPing(seq=msg.seq + 1, payload=payload))
+        else:
+            report("bureau", samples)
+            sys.stdout.flush()
+            os._exit(0)
+
+    bureau = Bureau(port=port)
+    bureau.add(ping)
+    bureau.add(pong)
+    bureau.run()
+
+
+async def bench_embedded(photo_url: str):
+    from embedded import run_experience
+    result = await run_experience(photo_url)
+    print("embedded run_experience timings (ms):")
+    print(json.dumps(result["timings"], indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["both", "direct", "bureau"], default="both")
+    parser.add_argument("--hops", type=int, default=500)
+    parser.add_argument("--payload-bytes", type=int, default=4096, help="roughly a PerceptionData message")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--photo", help="also run one embedded pipeline on this photo")
+    args = parser.parse_args()
+    payload = "x" * args.payload_bytes
+
+    print(f"⏱️  Per-hop overhead ({args.payload_bytes} byte payload)")
+    print("=" * 60)
+    if args.mode in ("both", "direct"):
+        asyncio.run(bench_direct(args.hops, payload))
+    if args.mode == "bureau":
+        bench_bureau(args.hops, payload, args.port)
+    elif args.mode == "both":
+        # The Bureau owns its event loop and never returns, so it gets its own process
+        subprocess.run([sys.executable, __file__, "--mode", "bureau", "--hops", str(args.hops),
+                        "--payload-bytes", str(args.payload_bytes), "--port", str(args.port)])
+    if args.photo:
+        asyncio.run(bench_embedded(args.photo))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+json_repair.extract() vs the regex quote-fix chain the agents used before (find/rfind slice + 5 re.sub + json.loads)
+Usage: python3 benchmark_json_repair.py [--iterations 2000]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+# Add the project root to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import json_repair
+
+SAMPLES = {
+    "clean": json.dumps({
+        "objects": ["palm trees", "waves", "sand", "beach umbrella"], "people_count": 2,
+        "people_details": [{"position": "left", "description": "woman in a sun hat", "apparent_age": "adult", "apparent_mood": "relaxed"},
+                           {"position": "right", "description": "child with a bucket", "apparent_age": "child", "apparent_mood": "excited"}],
+        "layout": {"foreground": "sand and shells", "center": "two people", "background": "ocean horizon"},
+        "scene_type": "outdoor_beach", "setting": "tropical beach at sunset", "colors": ["gold", "blue", "white"],
+        "lighting": "warm golden hour", "ambient_sounds": ["waves", "seagulls", "wind"]
+    }),
+    "single_quotes": "Here is the data: {'mood': 'joyful', 'emotion_tags': ['warm', 'playful'], 'tone': 'light', "
+                     "'intensity': 'medium', 'voice_characteristics': {'pace': 'relaxed', 'pitch': 'mid'}, 'ambient_mood': 'calm'}",
+    "apostrophe": "{'main_narration': 'You stand where the child's laughter rises over the surf.', "
+                  "'person_dialogues': [], 'ambient_descriptions': ['surf']}",
+    "fenced_trailing": "```json\n{\"mood\": \"calm\", \"emotion_tags\": [\"serene\",], \"tone\": \"soft\",}\n```\n"
+                       "Let me know if you'd like a {different} take!",
+    "python_literals": "{'people_count': 0, 'has_water': True, 'notes': None}",
+    "truncated": "{\"main_narration\": \"The tide rolls in beneath a violet sky\", \"person_dialogues\": [{\"person_id\": 1, \"dia",
+}
+
+
+def legacy_repair(text: str):
+    """The pre-json_repair parsing from perception_agent/emotion_agent"""
+    json_start = text.find('{')
+    json_end = text.rfind('}') + 1
+    if json_start < 0 or json_end <= json_start:
+        raise ValueError("no braces")
+    json_content = text[json_start:json_end]
+    json_content = re.sub(r"'([^']*)':", r'"\1":', json_content)
+    json_content = re.sub(r": '([^']*)'", r': "\1"', json_content)
+    json_content = re.sub(r": '([^']*)',", r': "\1",', json_content)
+    json_content = re.sub(r": '([^']*)'}", r': "\1"}', json_content)
+    json_content = re.sub(r"'([^']*)'", r'"\1"', json_content)
+    return json.loads(json_content)
+
+
+def bench(fn, text: str, iterations: int):
+    try:
+        fn(text)
+    except Exception:
+        return None
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn(text)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"🧪 JSON repair: {args.iterations} iterations per sample")
+    print("=" * 60)
+    print(f"{'sample':>16}  {'regex chain':>12}  {'json_repair':>12}")
+    for name, text in SAMPLES.items():
+        cells = []
+        for fn in (legacy_repair, json_repair.extract):
+            us = bench(fn, text, args.iterations)
+            cells.append("fails" if us is None else f"{us:.1f}µs")
+        print(f"{name:>16}  {cells[0]:>12}  {cells[1]:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate index lookup latency at scale (in-memory part of phash_index; no DB)
+Usage: python3 benchmark_phash.py [--entries 1000000] [--queries 2000] [--threshold 5]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+# Add the project root to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from phash_index import PHashIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--threshold", type=int, default=6)
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    index = PHashIndex()
+    started = time.perf_counter()
+    for entry_id in range(args.entries):
+        index.add(rng.getrandbits(64), entry_id)
+    print(f"🗂️  Indexed {args.entries} hashes in {time.perf_counter() - started:.1f}s")
+
+    samples = []
+    found = 0
+    for _ in range(args.queries):
+        # Half the queries are near-duplicates of an indexed photo, half are new photos
+        if rng.random() < 0.5:
+            query = index.hashes[rng.randrange(len(index))]
+            for bit in rng.sample(range(64), rng.randint(0, args.threshold)):
+                query ^= 1 << bit
+        else:
+            query = rng.getrandbits(64)
+        started = time.perf_counter()
+        found += index.search(query, args.threshold) is not None
+        samples.append((time.perf_counter() - started) * 1e6)
+
+    samples.sort()
+    print(f"🔎 {args.queries} lookups (threshold {args.threshold}): {found} matched  "
+          f"mean {statistics.mean(samples):.1f}µs  p50 {statistics.median(samples):.1f}µs  "
+          f"p99 {samples[int(len(samples) * 0.99)]:.1f}µs")
+
+
+if __name__ == "__main__":
+    main()
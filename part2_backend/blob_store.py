@@ -0,0 +1,83 @@
+# blob_store.py
+"""Content-addressed store for stage outputs, so messages can carry a digest instead of the full payload.
+
+A payload is serialized once by put(); agents call resolve() only for the
+fields they actually use. Blobs live in the shared state DB (agents may run in
+separate processes) with a per-process cache of decoded payloads in front, so
+inside the Bureau a lookup is a dict hit.
+"""
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from state_db import ensure_schema
+
+BLOB_TTL = float(os.getenv("BLOB_TTL", "3600"))
+BLOB_CACHE_SIZE = int(os.getenv("BLOB_CACHE_SIZE", "256"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    stored_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blobs_stored_idx ON blobs (stored_at);
+"""
+
+# digest -> decoded payload; callers must treat resolved payloads as read-only
+_cache: "OrderedDict[str, Dict]" = OrderedDict()
+
+
+def _db():
+    return ensure_schema("blob_store", _SCHEMA)
+
+
+def _remember(digest: str, payload: Dict):
+    _cache[digest] = payload
+    _cache.move_to_end(digest)
+    while len(_cache) > BLOB_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+def put(payload: Dict) -> Tuple[str, int]:
+    """Store `payload` (a JSON-able dict); returns its digest and serialized size. Storing the same content again is cheap"""
+    data = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    digest = hashlib.sha256(data.encode()).hexdigest()
+    # Re-storing refreshes stored_at, so content shared by live sessions isn't pruned under them
+    _db().execute(
+        "INSERT INTO blobs (digest, data, stored_at) VALUES (?, ?, ?) "
+        "ON CONFLICT(digest) DO UPDATE SET stored_at = excluded.stored_at",
+        (digest, data, time.time())
+    )
+    _remember(digest, payload)
+    return digest, len(data)
+
+
+def get(digest: str) -> Dict:
+    payload = _cache.get(digest)
+    if payload is not None:
+        _cache.move_to_end(digest)
+        return payload
+    row = _db().execute("SELECT data FROM blobs WHERE digest = ?", (digest,)).fetchone()
+    if row is None:
+        raise KeyError(f"Unknown blob {digest}")
+    payload = json.loads(row["data"])
+    _remember(digest, payload)
+    return payload
+
+
+def resolve(inline: Optional[Dict], ref: Optional[str]) -> Dict:
+    """A message field that may be sent inline or as a `*_ref` digest"""
+    if inline is not None:
+        return inline
+    if ref is None:
+        raise ValueError("Message carries neither the payload nor a reference to it")
+    return get(ref)
+
+
+def prune(older_than: float = BLOB_TTL) -> int:
+    """Delete blobs not stored for `older_than` seconds; returns how many"""
+    cur = _db().execute("DELETE FROM blobs WHERE stored_at < ?", (time.time() - older_than,))
+    return cur.rowcount
@@ -0,0 +1,136 @@
+# embedded.py
+"""Single-process pipeline: calls the agents' business logic directly instead of sending uagents messages.
+
+Same stages and overlap as the coordinator's pipeline (ambient prep alongside
+emotion/narration, narrator TTS starting from the streamed main narration,
+narrator and dialogue TTS in parallel), but each hop is a
+plain `await` - no envelope signing, serialization or Bureau dispatch.
+
+    from embedded import run_experience
+    result = await run_experience("https://...jpg")
+
+or from a shell: python embedded.py <photo_url>
+"""
+import asyncio
+import json
+import logging
+import sys
+import time
+import uuid
+from typing import Dict, Optional
+from fetch_models import (
+    VisionAnalysisRequest, EmotionRequest, NarrationRequest, VoiceRequest,
+    AmbientPrepRequest, AudioMixRequest
+)
+from agents.perception_agent import perceive
+from agents.emotion_agent import detect
+from agents.narration_agent import narrate
+from agents.voice_agent import synthesize
+from agents.audio_mixer_agent import prepare_bed, mix
+from experience import build_final_response, JOB_DEADLINE
+import metrics
+
+log = logging.getLogger("embedded")
+
+
+class StageError(Exception):
+    """A stage failed; `step` names it the same way ErrorMessage.step does"""
+
+    def __init__(self, step: str, error: str):
+        super().__init__(f"{step}: {error}")
+        self.step = step
+        self.error = error
+
+
+async def _hop(step: str, call, timings: Dict[str, float], deadline: float):
+    started = time.perf_counter()
+    try:
+        return await asyncio.wait_for(call, max(0.0, deadline - time.time()))
+    except asyncio.TimeoutError:
+        metrics.STAGE_FAILURES.inc(stage=step, reason="timeout")
+        raise StageError(step, "did not finish before the deadline")
+    except StageError:
+        raise
+    except Exception as e:
+        metrics.STAGE_FAILURES.inc(stage=step, reason="error")
+        raise StageError(step, str(e))
+    finally:
+        elapsed = time.perf_counter() - started
+        timings[step] = round(elapsed * 1000, 1)
+        metrics.STAGE_SECONDS.observe(elapsed, stage=step)
+
+
+async def run_experience(photo_url: str, session_id: Optional[str] = None,
+                         timeout: float = JOB_DEADLINE) -> Dict:
+    """Run the whole pipeline in this process; returns the same payload as /api/experience/create.
+
+    Raises StageError with the failing step.
+    """
+    session_id = session_id or str(uuid.uuid4())
+    deadline = time.time() + timeout
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+
+    perception = await _hop("perception", perceive(
+        VisionAnalysisRequest(photo_url=photo_url, session_id=session_id, deadline=deadline), log
+    ), timings, deadline)
+
+    # The ambient bed only needs perception, so it is built while emotion and narration run
+    ambient_task = asyncio.create_task(_hop("ambient", prepare_bed(
+        AmbientPrepRequest(session_id=session_id, ambient_sounds=perception.ambient_sounds, deadline=deadline), log
+    ), timings, deadline))
+    try:
+        emotion = await _hop("emotion", detect(
+            EmotionRequest(session_id=session_id, perception_data=perception.__dict__, deadline=deadline), log
+        ), timings, deadline)
+        def voice(part: str, narration_data: Dict):
+            return asyncio.create_task(_hop(f"{part}_voice", synthesize(
+                VoiceRequest(session_id=session_id, narration_data=narration_data,
+                             emotion_data=emotion.__dict__, part=part, deadline=deadline), log
+            ), timings, deadline))
+
+        # Narrator TTS starts as soon as main_narration has streamed in, while the dialogues are still being written
+        narrator_task = None
+        dialogue_task = None
+
+        async def on_lead(main_narration: str):
+            nonlocal narrator_task
+            narrator_task = voice("narrator", {"main_narration": main_narration})
+
+        try:
+            narration = await _hop("narration", narrate(
+                NarrationRequest(session_id=session_id, perception=perception.__dict__,
+                                 emotion=emotion.__dict__, deadline=deadline), log, on_lead=on_lead
+            ), timings, deadline)
+            if narrator_task is None:
+                narrator_task = voice("narrator", narration.__dict__)
+            dialogue_task = voice("dialogue", narration.__dict__)
+            narrator_voice, dialogue_voice = await asyncio.gather(narrator_task, dialogue_task)
+        finally:
+            # If one voice part failed, the other is still running; nobody will use it
+            for task in (narrator_task, dialogue_task):
+                if task is not None:
+                    task.cancel()
+        ambient = await ambient_task
+    finally:
+        ambient_task.cancel()
+
+    voice_files = narrator_voice.voice_files + dialogue_voice.voice_files
+    mixed = await _hop("mix", mix(
+        AudioMixRequest(session_id=session_id, voice_files=voice_files,
+                        ambient_sounds=perception.ambient_sounds,
+                        ambient_url=ambient.ambient_url, deadline=deadline), log
+    ), timings, deadline)
+
+    response = build_final_response(session_id, emotion, narration, voice_files, mixed.final_audio_url)
+    response["timings"] = dict(timings, total=round((time.perf_counter() - started) * 1000, 1))
+    metrics.flush()
+    return response
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python embedded.py <photo_url>")
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    print(json.dumps(asyncio.run(run_experience(sys.argv[1])), indent=2))
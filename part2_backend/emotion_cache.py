@@ -0,0 +1,134 @@
+# emotion_cache.py
+"""Emotion results memoized by scene: canonical perception fingerprint + pipeline config -> EmotionData fields.
+
+The emotion agent's only input is the perception payload, and similar photos
+often produce the same payload apart from ordering and casing. Before
+hashing, the payload is canonicalized:
+- session_id is dropped
+- strings are trimmed, lower-cased and have their whitespace collapsed
+- lists of plain values are sorted
+- dicts are sorted by key
+
+Lookups check an in-process LRU first (EMOTION_CACHE_SIZE entries,
+EMOTION_CACHE_TTL). With EMOTION_CACHE_PERSIST=1 they then check the shared
+state DB, which survives restarts and is capped at
+EMOTION_CACHE_MAX_ENTRIES by last access.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from state_db import ensure_schema
+import result_cache
+import stats
+
+EMOTION_CACHE_ENABLED = os.getenv("EMOTION_CACHE", "1") == "1"
+EMOTION_CACHE_SIZE = int(os.getenv("EMOTION_CACHE_SIZE", "256"))
+EMOTION_CACHE_TTL = float(os.getenv("EMOTION_CACHE_TTL", str(24 * 3600)))
+EMOTION_CACHE_PERSIST = os.getenv("EMOTION_CACHE_PERSIST", "1") == "1"
+EMOTION_CACHE_MAX_ENTRIES = int(os.getenv("EMOTION_CACHE_MAX_ENTRIES", "5000"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS emotion_cache (
+    key TEXT PRIMARY KEY,
+    emotion TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS emotion_cache_lru_idx ON emotion_cache (last_access);
+"""
+
+
+def _db():
+    return ensure_schema("emotion_cache", _SCHEMA)
+
+
+_SPACES = re.compile(r"\s+")
+# key -> (emotion fields, created_at), least recently used first
+_memory: "OrderedDict[str, Tuple[Dict, float]]" = OrderedDict()
+
+
+def canonical(value: Any) -> Any:
+    """`value` with strings normalized, dict keys sorted and lists of plain values sorted"""
+    if isinstance(value, str):
+        return _SPACES.sub(" ", value.strip().lower())
+    if isinstance(value, dict):
+        return {str(k): canonical(v) for k, v in sorted(value.items(), key=lambda item: str(item[0]))}
+    if isinstance(value, (list, tuple)):
+        items = [canonical(item) for item in value]
+        # Lists of dicts (people_details) are sorted too, by their canonical JSON
+        return sorted(items, key=lambda item: json.dumps(item, sort_keys=True))
+    return value
+
+
+def fingerprint(perception: Dict) -> str:
+    """Cache key for a perception payload; session_id doesn't take part"""
+    scene = canonical({k: v for k, v in perception.items() if k != "session_id"})
+    digest = hashlib.sha256(json.dumps(scene, separators=(",", ":"), ensure_ascii=False).encode()).hexdigest()
+    return f"{digest}:{result_cache.pipeline_fingerprint()}"
+
+
+def _remember(key: str, emotion: Dict, created_at: float):
+    _memory[key] = (emotion, created_at)
+    _memory.move_to_end(key)
+    while len(_memory) > EMOTION_CACHE_SIZE:
+        _memory.popitem(last=False)
+
+
+def get(key: str) -> Optional[Dict]:
+    """Cached emotion fields (without session_id) for `key`, or None if missing or expired"""
+    now = time.time()
+    entry = _memory.get(key)
+    if entry is not None and now - entry[1] > EMOTION_CACHE_TTL:
+        del _memory[key]
+        entry = None
+    if entry is None and EMOTION_CACHE_PERSIST:
+        conn = _db()
+        row = conn.execute("SELECT emotion, created_at FROM emotion_cache WHERE key = ?", (key,)).fetchone()
+        if row is not None and now - row["created_at"] > EMOTION_CACHE_TTL:
+            conn.execute("DELETE FROM emotion_cache WHERE key = ?", (key,))
+        elif row is not None:
+            conn.execute("UPDATE emotion_cache SET last_access = ? WHERE key = ?", (now, key))
+            entry = (json.loads(row["emotion"]), row["created_at"])
+    if entry is None:
+        stats.incr("emotion_cache_misses")
+        return None
+    _remember(key, *entry)
+    stats.incr("emotion_cache_hits")
+    return dict(entry[0])
+
+
+def put(key: str, emotion: Dict):
+    """Store emotion fields (without session_id); the DB copy is trimmed to EMOTION_CACHE_MAX_ENTRIES"""
+    now = time.time()
+    _remember(key, emotion, now)
+    if not EMOTION_CACHE_PERSIST:
+        return
+    conn = _db()
+    conn.execute(
+        "INSERT OR REPLACE INTO emotion_cache (key, emotion, created_at, last_access) VALUES (?, ?, ?, ?)",
+        (key, json.dumps(emotion), now, now)
+    )
+    conn.execute("DELETE FROM emotion_cache WHERE created_at < ?", (now - EMOTION_CACHE_TTL,))
+    conn.execute(
+        "DELETE FROM emotion_cache WHERE key IN ("
+        "SELECT key FROM emotion_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+        (EMOTION_CACHE_MAX_ENTRIES,)
+    )
+
+
+def summary() -> Dict:
+    counters = stats.counters("emotion_cache_")
+    hits = counters.get("emotion_cache_hits", 0)
+    misses = counters.get("emotion_cache_misses", 0)
+    return {
+        "enabled": EMOTION_CACHE_ENABLED,
+        "persistent": EMOTION_CACHE_PERSIST,
+        "entries": _db().execute("SELECT COUNT(*) FROM emotion_cache").fetchone()[0] if EMOTION_CACHE_PERSIST else None,
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None
+    }
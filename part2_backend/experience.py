@@ -0,0 +1,32 @@
+# experience.py
+"""What the coordinator and the embedded runner share: the per-session budget and the final response payload.
+
+Kept free of agents and other import-time side effects so either runner can import it.
+"""
+import os
+from fetch_models import EmotionData, NarrationData
+
+# Overall budget per attempt, counted from when the job is claimed: batch items can wait in the queue far longer
+# than this, and a redelivered job gets a fresh budget (the visibility timeout is a little longer)
+JOB_DEADLINE = float(os.getenv("JOB_DEADLINE", "300"))
+
+
+def build_final_response(session_id: str, emotion: EmotionData, narration: NarrationData,
+                         voice_files, final_audio_url: str) -> dict:
+    """The experience payload returned to clients"""
+    # Create audio layers
+    audio_layers = []
+    for voice_file in voice_files:
+        audio_layers.append({
+            "type": voice_file["type"],
+            "position": voice_file["position"],
+            "text": voice_file["text"][:100] + "..." if len(voice_file["text"]) > 100 else voice_file["text"]
+        })
+
+    return {
+        "session_id": session_id,
+        "emotion": emotion.__dict__,
+        "narration": narration.__dict__,
+        "audio_layers": audio_layers,
+        "final_audio_url": final_audio_url
+    }
@@ -2,9 +2,11 @@
 from uagents import Model
 from typing import List, Dict, Optional
 
+# Every *Request carries `deadline` in epoch seconds; agents drop the work once it has passed (resilience.expired)
 class VisionAnalysisRequest(Model):
     photo_url: str
     session_id: str
+    deadline: Optional[float] = None
 
 class PerceptionData(Model):
     session_id: str
@@ -18,9 +20,12 @@ class PerceptionData(Model):
     lighting: str
     ambient_sounds: List[str]
 
+# Stage payloads can be sent inline or as a blob_store digest (*_ref); agents use blob_store.resolve()
 class EmotionRequest(Model):
     session_id: str
-    perception_data: Dict
+    perception_data: Optional[Dict] = None
+    perception_ref: Optional[str] = None
+    deadline: Optional[float] = None
 
 class EmotionData(Model):
     session_id: str
@@ -33,8 +38,16 @@ class EmotionData(Model):
 
 class NarrationRequest(Model):
     session_id: str
-    perception: Dict
-    emotion: Dict
+    perception: Optional[Dict] = None
+    emotion: Optional[Dict] = None
+    perception_ref: Optional[str] = None
+    emotion_ref: Optional[str] = None
+    deadline: Optional[float] = None
+
+# Sent by the narration agent as soon as main_narration is complete, ahead of the full NarrationData
+class NarrationLead(Model):
+    session_id: str
+    main_narration: str
 
 class NarrationData(Model):
     session_id: str
@@ -44,17 +57,33 @@ class NarrationData(Model):
 
 class VoiceRequest(Model):
     session_id: str
-    narration_data: Dict
-    emotion_data: Dict
+    narration_data: Optional[Dict] = None
+    emotion_data: Optional[Dict] = None
+    narration_ref: Optional[str] = None
+    emotion_ref: Optional[str] = None
+    part: str = "all"  # "narrator", "dialogue" or "all"
+    deadline: Optional[float] = None
 
 class VoiceData(Model):
     session_id: str
     voice_files: List[Dict]  # List of {type, position, url}
+    part: str = "all"
+
+class AmbientPrepRequest(Model):
+    session_id: str
+    ambient_sounds: List[str]
+    deadline: Optional[float] = None
+
+class AmbientBedData(Model):
+    session_id: str
+    ambient_url: str  # "" when no ambient sound applies
 
 class AudioMixRequest(Model):
     session_id: str
     voice_files: List[Dict]
     ambient_sounds: List[str]
+    ambient_url: Optional[str] = None  # prepared bed; None means build it from ambient_sounds
+    deadline: Optional[float] = None
 
 class AudioMixData(Model):
     session_id: str
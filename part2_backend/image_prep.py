@@ -0,0 +1,266 @@
+# image_prep.py
+"""Download a photo once, then downscale, strip metadata and re-encode it before it goes to GPT-4o vision.
+
+OpenAI bills a high-detail image at 85 + 170 tokens per 512px tile (after
+fitting it in 2048x2048 and scaling its short side to 768), and fetches the
+full-resolution original for every request. Sending a capped, metadata-free
+JPEG as a data URL avoids both: fewer tiles, and no re-download on OpenAI's side.
+"""
+import asyncio
+import base64
+import io
+import ipaddress
+import math
+import os
+import socket
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import urljoin, urlsplit, urlunsplit
+import httpx
+from PIL import Image, ImageOps
+import providers
+import stats
+
+IMAGE_PREP_ENABLED = os.getenv("IMAGE_PREP", "1") == "1"
+# "auto" picks low detail for images that fit in one low-detail tile, high otherwise
+IMAGE_DETAIL = os.getenv("IMAGE_DETAIL", "auto")
+IMAGE_MAX_TILES = int(os.getenv("IMAGE_MAX_TILES", "4"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(20 * 1024 * 1024)))
+# Downloaded originals kept per process, so the coordinator's cache lookup and perception share one fetch.
+# Entries are only reused for IMAGE_CACHE_TTL seconds: the content behind a URL can change, and the result
+# cache and phash keys are computed from these bytes, so a later session must see a fresh download.
+IMAGE_CACHE_BYTES = int(os.getenv("IMAGE_CACHE_BYTES", str(64 * 1024 * 1024)))
+IMAGE_CACHE_TTL = float(os.getenv("IMAGE_CACHE_TTL", "60"))
+MAX_IMAGE_REDIRECTS = int(os.getenv("MAX_IMAGE_REDIRECTS", "3"))
+# Photo URLs come from clients, so by default only public hosts are fetched; set to 1 for local development
+IMAGE_FETCH_ALLOW_PRIVATE = os.getenv("IMAGE_FETCH_ALLOW_PRIVATE", "0") == "1"
+
+LOW_DETAIL_SIDE = 512
+TILE = 512
+
+# url -> (bytes, downloaded_at), least recently used first
+_downloads: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+_download_bytes = 0
+_in_flight: Dict[str, asyncio.Future] = {}
+
+
+class PreparedImage:
+    """A re-encoded photo ready for the vision API, with its before/after sizes"""
+
+    __slots__ = ("data_url", "detail", "width", "height", "original_bytes", "bytes", "tiles", "prep_ms")
+
+    def __init__(self, data_url, detail, width, height, original_bytes, size, tiles, prep_ms):
+        self.data_url = data_url
+        self.detail = detail
+        self.width = width
+        self.height = height
+        self.original_bytes = original_bytes
+        self.bytes = size
+        self.tiles = tiles
+        self.prep_ms = prep_ms
+
+    @property
+    def est_tokens(self) -> int:
+        return 85 if self.detail == "low" else 85 + 170 * self.tiles
+
+
+def _remember(url: str, data: bytes):
+    global _download_bytes
+    if len(data) > IMAGE_CACHE_BYTES:
+        return
+    _forget(url)
+    _downloads[url] = (data, time.monotonic())
+    _download_bytes += len(data)
+    while _download_bytes > IMAGE_CACHE_BYTES:
+        _, (evicted, _) = _downloads.popitem(last=False)
+        _download_bytes -= len(evicted)
+
+
+def _forget(url: str):
+    global _download_bytes
+    entry = _downloads.pop(url, None)
+    if entry is not None:
+        _download_bytes -= len(entry[0])
+
+
+class UnsafeURL(ValueError):
+    """A photo URL (or a redirect) that must not be fetched from the server"""
+
+
+async def _resolve(host: str, port: int) -> List[str]:
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return [info[4][0] for info in infos]
+
+
+async def _check_url(url: str) -> Optional[Union[ipaddress.IPv4Address, ipaddress.IPv6Address]]:
+    """Allow only http(s) URLs whose host resolves exclusively to public addresses; returns the one to connect to.
+
+    None (with IMAGE_FETCH_ALLOW_PRIVATE) means the host isn't vetted, so the client may resolve it itself.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise UnsafeURL(f"only http(s) photo URLs are allowed: {url[:100]}")
+    if IMAGE_FETCH_ALLOW_PRIVATE:
+        return None
+    try:
+        resolved = await _resolve(parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+    except socket.gaierror as e:
+        raise UnsafeURL(f"cannot resolve {parts.hostname}: {e}")
+    addresses = []
+    for raw in resolved:
+        address = ipaddress.ip_address(raw.split("%")[0])
+        if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise UnsafeURL(f"{parts.hostname} resolves to a non-public address ({address})")
+        addresses.append(address)
+    if not addresses:
+        raise UnsafeURL(f"cannot resolve {parts.hostname}")
+    return addresses[0]
+
+
+def _pinned(url: str, address) -> Tuple[str, Dict, Dict]:
+    """`url` aimed at the vetted `address`, plus the Host header and TLS server name of its real host.
+
+    Connecting by name would let httpx resolve it again, and a rebinding DNS server could answer that
+    second lookup with a private address.
+    """
+    parts = urlsplit(url)
+    host = f"[{address}]" if address.version == 6 else str(address)
+    netloc = host if parts.port is None else f"{host}:{parts.port}"
+    host_header = parts.hostname if parts.port is None else f"{parts.hostname}:{parts.port}"
+    return urlunsplit(parts._replace(netloc=netloc)), {"Host": host_header}, {"sni_hostname": parts.hostname}
+
+
+async def _download(photo_url: str) -> bytes:
+    url = photo_url
+    for _ in range(MAX_IMAGE_REDIRECTS + 1):
+        # Every hop is checked, so a public URL can't redirect to localhost, agent ports or cloud metadata
+        address = await _check_url(url)
+        target, headers, extensions = (url, {}, {}) if address is None else _pinned(url, address)
+        async with providers.client("fetch").stream("GET", target, headers=headers, extensions=extensions,
+                                                     timeout=20.0) as response:
+            if httpx.codes.is_redirect(response.status_code):
+                location = response.headers.get("location")
+                if not location:
+                    raise ValueError(f"redirect without a Location header from {url[:100]}")
+                url = urljoin(url, location)
+                continue
+            response.raise_for_status()
+            chunks = []
+            size = 0
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if size > MAX_IMAGE_BYTES:
+                    raise ValueError(f"image larger than {MAX_IMAGE_BYTES} bytes")
+                chunks.append(chunk)
+            return b"".join(chunks)
+    raise UnsafeURL(f"more than {MAX_IMAGE_REDIRECTS} redirects for {photo_url[:100]}")
+
+
+async def fetch(photo_url: str) -> bytes:
+    """The photo's bytes; a download is shared by the stages that ask for it within IMAGE_CACHE_TTL"""
+    entry = _downloads.get(photo_url)
+    if entry is not None and time.monotonic() - entry[1] <= IMAGE_CACHE_TTL:
+        _downloads.move_to_end(photo_url)
+        return entry[0]
+    _forget(photo_url)
+    if photo_url in _in_flight:
+        # Another stage is already downloading it
+        return await asyncio.shield(_in_flight[photo_url])
+    future = asyncio.ensure_future(_download(photo_url))
+    _in_flight[photo_url] = future
+    try:
+        data = await asyncio.shield(future)
+    finally:
+        del _in_flight[photo_url]
+    _remember(photo_url, data)
+    return data
+
+
+def _tiles(width: int, height: int) -> int:
+    return math.ceil(width / TILE) * math.ceil(height / TILE)
+
+
+def _target_size(width: int, height: int):
+    """Apply OpenAI's own high-detail scaling, then shrink further until it fits IMAGE_MAX_TILES"""
+    scale = min(1.0, 2048 / max(width, height), 768 / min(width, height))
+    w, h = max(1, round(width * scale)), max(1, round(height * scale))
+    while _tiles(w, h) > IMAGE_MAX_TILES and max(w, h) > TILE:
+        # Step down to the next tile boundary on the long side
+        factor = (math.ceil(max(w, h) / TILE) - 1) * TILE / max(w, h)
+        w, h = max(1, int(w * factor)), max(1, int(h * factor))
+    return w, h
+
+
+def prepare(data: bytes) -> PreparedImage:
+    """Downscale, drop EXIF/ICC metadata (after applying the EXIF rotation) and re-encode as JPEG"""
+    started = time.perf_counter()
+    image = Image.open(io.BytesIO(data))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    detail = IMAGE_DETAIL
+    if detail == "auto":
+        detail = "low" if max(image.size) <= LOW_DETAIL_SIDE else "high"
+    if detail == "low":
+        image.thumbnail((LOW_DETAIL_SIDE, LOW_DETAIL_SIDE), Image.LANCZOS)
+    else:
+        size = _target_size(*image.size)
+        if size != image.size:
+            image = image.resize(size, Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    # A fresh save without exif=/icc_profile= writes no metadata
+    image.save(buffer, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    encoded = buffer.getvalue()
+    return PreparedImage(
+        data_url="data:image/jpeg;base64," + base64.b64encode(encoded).decode(),
+        detail=detail,
+        width=image.width,
+        height=image.height,
+        original_bytes=len(data),
+        size=len(encoded),
+        tiles=_tiles(image.width, image.height),
+        prep_ms=(time.perf_counter() - started) * 1000
+    )
+
+
+async def prepare_url(photo_url: str) -> PreparedImage:
+    """fetch() + prepare(), with the Pillow work off the event loop"""
+    prepared = await asyncio.to_thread(prepare, await fetch(photo_url))
+    stats.incr("image_prep_images")
+    stats.incr("image_prep_bytes_in", prepared.original_bytes)
+    stats.incr("image_prep_bytes_out", prepared.bytes)
+    return prepared
+
+
+def record_vision(mode: str, latency_ms: float):
+    """Vision call latency by input mode ("prepared" or "url"), for the before/after comparison in summary()"""
+    stats.incr(f"image_prep_vision_calls_{mode}")
+    stats.incr(f"image_prep_vision_ms_{mode}", int(latency_ms))
+
+
+def summary() -> Dict:
+    counters = stats.counters("image_prep_")
+    bytes_in = counters.get("image_prep_bytes_in", 0)
+    bytes_out = counters.get("image_prep_bytes_out", 0)
+    vision = {}
+    for mode in ("prepared", "url"):
+        calls = counters.get(f"image_prep_vision_calls_{mode}", 0)
+        vision[mode] = {
+            "calls": calls,
+            "avg_ms": round(counters.get(f"image_prep_vision_ms_{mode}", 0) / calls, 1) if calls else None
+        }
+    return {
+        "enabled": IMAGE_PREP_ENABLED,
+        "images": counters.get("image_prep_images", 0),
+        "bytes_in": bytes_in,
+        "bytes_out": bytes_out,
+        "bytes_saved": bytes_in - bytes_out,
+        "saved_ratio": round(1 - bytes_out / bytes_in, 3) if bytes_in else None,
+        "vision_latency": vision
+    }
@@ -0,0 +1,75 @@
+# job_events.py
+"""Per-session pipeline stage events (stage_started / stage_finished), written by the coordinator"""
+import time
+from typing import List, Dict, Optional
+from state_db import ensure_schema
+import job_queue
+import notify
+
+# Pipeline stage -> the numbered step shown to users; stages without one (ambient prep) run alongside
+STAGE_STEPS = {
+    "perception": 1, "emotion": 2, "narration": 3,
+    "narrator_voice": 4, "dialogue_voice": 4, "mix": 5
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    event TEXT NOT NULL,
+    ts REAL NOT NULL,
+    duration_ms REAL
+);
+CREATE INDEX IF NOT EXISTS job_events_session_idx ON job_events (session_id, id);
+CREATE INDEX IF NOT EXISTS job_events_ts_idx ON job_events (ts);
+"""
+
+
+def _db():
+    return ensure_schema("job_events", _SCHEMA)
+
+
+def stage_started(session_id: str, stage: str) -> int:
+    cur = _db().execute(
+        "INSERT INTO job_events (session_id, stage, event, ts) VALUES (?, ?, 'stage_started', ?)",
+        (session_id, stage, time.time())
+    )
+    notify.broadcast("gateway", {"key": session_id})
+    return cur.lastrowid
+
+
+def stage_finished(session_id: str, stage: str) -> Optional[float]:
+    """Record the end of a stage and return its duration in ms (None if its start wasn't recorded)"""
+    conn = _db()
+    now = time.time()
+    started = conn.execute(
+        "SELECT ts FROM job_events WHERE session_id = ? AND stage = ? AND event = 'stage_started' "
+        "ORDER BY id DESC LIMIT 1",
+        (session_id, stage)
+    ).fetchone()
+    duration_ms = (now - started["ts"]) * 1000 if started else None
+    conn.execute(
+        "INSERT INTO job_events (session_id, stage, event, ts, duration_ms) VALUES (?, ?, 'stage_finished', ?, ?)",
+        (session_id, stage, now, duration_ms)
+    )
+    notify.broadcast("gateway", {"key": session_id})
+    return duration_ms
+
+
+def since(session_id: str, after_id: int = 0) -> List[Dict]:
+    """Events for a session newer than `after_id`, oldest first"""
+    rows = _db().execute(
+        "SELECT id, stage, event, ts, duration_ms FROM job_events WHERE session_id = ? AND id > ? ORDER BY id",
+        (session_id, after_id)
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def prune(retention: float = job_queue.JOB_RETENTION) -> int:
+    """Delete events older than `retention` seconds, except those of sessions still queued or running"""
+    return _db().execute(
+        "DELETE FROM job_events WHERE ts < ? AND session_id NOT IN "
+        "(SELECT session_id FROM jobs WHERE status IN ('queued', 'processing'))",
+        (time.time() - retention,)
+    ).rowcount
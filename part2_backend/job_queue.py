@@ -0,0 +1,264 @@
+# job_queue.py
+"""Durable experience job queue (SQLite WAL) shared by gateway workers and the coordinator"""
+import os
+import json
+import time
+from typing import List, Dict, Optional
+from state_db import ensure_schema, add_missing_columns
+import notify
+import stats
+
+# A claimed job becomes visible again if the coordinator hasn't acked it within this window
+VISIBILITY_TIMEOUT = float(os.getenv("JOB_VISIBILITY_TIMEOUT", "330"))
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Queued jobs older than this are expired unprocessed - nobody is waiting for them any more.
+# Batch items are exempt: they are paced by their batch's concurrency cap on purpose.
+MAX_QUEUE_WAIT = float(os.getenv("JOB_MAX_QUEUE_WAIT", "300"))
+# Finished jobs (and their results) are kept this long for clients to fetch, then purged by prune()
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(24 * 3600)))
+
+TERMINAL_STATUSES = ("done", "failed", "expired")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL UNIQUE,
+    photo_url TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    visible_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    result TEXT,
+    batch_id TEXT,
+    error TEXT,
+    failed_step TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_claim_idx ON jobs (status, visible_at, id);
+CREATE TABLE IF NOT EXISTS batches (
+    batch_id TEXT PRIMARY KEY,
+    concurrency INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+def _migrate(conn):
+    add_missing_columns(conn, "jobs", {"result": "TEXT", "batch_id": "TEXT", "error": "TEXT", "failed_step": "TEXT"})
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_batch_idx ON jobs (batch_id, updated_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_updated_idx ON jobs (status, updated_at)")
+
+
+def _db():
+    return ensure_schema("job_queue", _SCHEMA, _migrate)
+
+
+def enqueue(session_id: str, photo_url: str) -> int:
+    """Append a job; safe to call concurrently from any number of gateway processes"""
+    now = time.time()
+    cur = _db().execute(
+        "INSERT INTO jobs (session_id, photo_url, status, visible_at, created_at, updated_at) "
+        "VALUES (?, ?, 'queued', ?, ?, ?)",
+        (session_id, photo_url, now, now, now)
+    )
+    notify.send("coordinator", {"key": "jobs"})
+    return cur.lastrowid
+
+
+def enqueue_batch(batch_id: str, items: List[Dict], concurrency: int):
+    """Append a batch of {session_id, photo_url} jobs atomically, at most `concurrency` of which run at once"""
+    conn = _db()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "INSERT INTO batches (batch_id, concurrency, created_at) VALUES (?, ?, ?)",
+            (batch_id, concurrency, now)
+        )
+        conn.executemany(
+            "INSERT INTO jobs (session_id, photo_url, status, visible_at, created_at, updated_at, batch_id) "
+            "VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+            [(item["session_id"], item["photo_url"], now, now, now, batch_id) for item in items]
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    notify.send("coordinator", {"key": "jobs"})
+
+
+def claim(limit: int = 10, visibility_timeout: float = VISIBILITY_TIMEOUT) -> List[Dict]:
+    """Claim up to `limit` jobs in FIFO order.
+
+    Queued jobs and processing jobs whose visibility timeout expired (e.g. the
+    coordinator died mid-session) are both eligible. Jobs that have used up
+    MAX_ATTEMPTS are marked failed instead of being handed out again, jobs that
+    waited longer than MAX_QUEUE_WAIT are expired, and jobs whose batch already
+    has `concurrency` sessions running are skipped.
+    """
+    conn = _db()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        exhausted = [row["session_id"] for row in conn.execute(
+            "SELECT session_id FROM jobs WHERE status = 'processing' AND visible_at <= ? AND attempts >= ?",
+            (now, MAX_ATTEMPTS)
+        )]
+        conn.executemany(
+            "UPDATE jobs SET status = 'failed', error = ?, failed_step = 'coordinator', updated_at = ? WHERE session_id = ?",
+            [(f"Not completed after {MAX_ATTEMPTS} attempts", now, session_id) for session_id in exhausted]
+        )
+        expired = [row["session_id"] for row in conn.execute(
+            "SELECT session_id FROM jobs WHERE status = 'queued' AND batch_id IS NULL AND created_at <= ?",
+            (now - MAX_QUEUE_WAIT,)
+        )]
+        conn.executemany(
+            "UPDATE jobs SET status = 'expired', updated_at = ? WHERE session_id = ?",
+            [(now, session_id) for session_id in expired]
+        )
+        # Free slots per batch = its concurrency minus its sessions still running
+        batch_slots = {row["batch_id"]: row["slots"] for row in conn.execute(
+            "SELECT b.batch_id, b.concurrency - COUNT(j.id) AS slots FROM batches b "
+            "LEFT JOIN jobs j ON j.batch_id = b.batch_id AND j.status = 'processing' AND j.visible_at > ? "
+            "WHERE b.batch_id IN (SELECT DISTINCT batch_id FROM jobs WHERE status IN ('queued', 'processing') AND visible_at <= ?) "
+            "GROUP BY b.batch_id",
+            (now, now)
+        )}
+        rows = []
+        for row in conn.execute(
+            "SELECT id, session_id, photo_url, attempts, created_at, batch_id FROM jobs "
+            "WHERE status IN ('queued', 'processing') AND visible_at <= ? ORDER BY id",
+            (now,)
+        ):
+            batch_id = row["batch_id"]
+            if batch_id is not None:
+                if batch_slots.get(batch_id, 0) <= 0:
+                    continue
+                batch_slots[batch_id] -= 1
+            rows.append(row)
+            if len(rows) >= limit:
+                break
+        if rows:
+            conn.executemany(
+                "UPDATE jobs SET status = 'processing', attempts = attempts + 1, "
+                "visible_at = ?, updated_at = ? WHERE id = ?",
+                [(now + visibility_timeout, now, row["id"]) for row in rows]
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if expired:
+        stats.incr("jobs_expired", len(expired))
+    for session_id in exhausted + expired:
+        notify.broadcast("gateway", {"key": session_id})
+    return [dict(row) for row in rows]
+
+
+def ack(session_id: str, result: Optional[Dict] = None):
+    """Mark a claimed job as finished (storing its result) so it is never redelivered.
+
+    A late ack for a job that already failed or expired leaves it as it is.
+    """
+    _db().execute(
+        "UPDATE jobs SET status = 'done', result = ?, updated_at = ? WHERE session_id = ? AND status = 'processing'",
+        (json.dumps(result) if result is not None else None, time.time(), session_id)
+    )
+    notify.broadcast("gateway", {"key": session_id})
+
+
+def fail(session_id: str, error: str, step: str):
+    """Mark a job failed for good and wake whoever is waiting on it"""
+    _db().execute(
+        "UPDATE jobs SET status = 'failed', error = ?, failed_step = ?, updated_at = ? "
+        "WHERE session_id = ? AND status NOT IN ('done', 'failed', 'expired')",
+        (error, step, time.time(), session_id)
+    )
+    notify.broadcast("gateway", {"key": session_id})
+
+
+def release(session_id: str, delay: float = 0.0):
+    """Give a claimed job back to the queue (optionally after `delay` seconds)"""
+    now = time.time()
+    _db().execute(
+        "UPDATE jobs SET status = 'queued', visible_at = ?, updated_at = ? "
+        "WHERE session_id = ? AND status = 'processing'",
+        (now + delay, now, session_id)
+    )
+
+
+def _decode(row) -> Dict:
+    job = dict(row)
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def get(session_id: str) -> Optional[Dict]:
+    """Job row with its result decoded, or None for an unknown session"""
+    row = _db().execute("SELECT * FROM jobs WHERE session_id = ?", (session_id,)).fetchone()
+    return _decode(row) if row else None
+
+
+def batch_items(batch_id: str, since: float = 0.0) -> List[Dict]:
+    """Jobs in a batch updated after `since` (in submission order), results decoded"""
+    rows = _db().execute(
+        "SELECT * FROM jobs WHERE batch_id = ? AND updated_at > ? ORDER BY id",
+        (batch_id, since)
+    ).fetchall()
+    return [_decode(row) for row in rows]
+
+
+def get_batch(batch_id: str) -> Optional[Dict]:
+    """Batch settings plus its per-status job counts, or None for an unknown batch"""
+    conn = _db()
+    row = conn.execute("SELECT * FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+    if row is None:
+        return None
+    batch = dict(row)
+    batch["counts"] = {r["status"]: r["n"] for r in conn.execute(
+        "SELECT status, COUNT(*) AS n FROM jobs WHERE batch_id = ? GROUP BY status", (batch_id,)
+    )}
+    return batch
+
+
+def in_flight() -> int:
+    """Jobs currently claimed and not yet past their visibility timeout"""
+    return _db().execute(
+        "SELECT COUNT(*) FROM jobs WHERE status = 'processing' AND visible_at > ?", (time.time(),)
+    ).fetchone()[0]
+
+
+def queued(batch: bool = False) -> int:
+    """Jobs waiting to be claimed - single jobs, or batch items (admission control bounds them separately)"""
+    condition = "batch_id IS NOT NULL" if batch else "batch_id IS NULL"
+    return _db().execute(f"SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND {condition}").fetchone()[0]
+
+
+def depth() -> Dict[str, int]:
+    """Number of jobs waiting and running (read from the claim index, so finished jobs cost nothing)"""
+    rows = _db().execute(
+        "SELECT status, COUNT(*) AS n FROM jobs WHERE status IN ('queued', 'processing') GROUP BY status"
+    ).fetchall()
+    return dict({"queued": 0, "processing": 0}, **{row["status"]: row["n"] for row in rows})
+
+
+def prune(retention: float = JOB_RETENTION) -> int:
+    """Delete finished jobs last updated more than `retention` seconds ago, and batches left empty"""
+    conn = _db()
+    cutoff = time.time() - retention
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        deleted = sum(
+            conn.execute("DELETE FROM jobs WHERE status = ? AND updated_at < ?", (status, cutoff)).rowcount
+            for status in TERMINAL_STATUSES
+        )
+        conn.execute(
+            "DELETE FROM batches WHERE created_at < ? AND NOT EXISTS "
+            "(SELECT 1 FROM jobs WHERE jobs.batch_id = batches.batch_id)",
+            (cutoff,)
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return deleted
@@ -0,0 +1,250 @@
+# json_repair.py
+"""Tolerant single-pass parser for the JSON that LLM agents return.
+
+Letta replies wrap the object in prose or ``` fences, mix single and double
+quotes, leave trailing commas and sometimes get cut off. extract() starts at
+the first '{' and parses exactly one object in one left-to-right pass:
+
+- single- or double-quoted strings, with unescaped quotes inside them kept
+  as text unless the quote is followed by , : } ] or the end
+- bare keys, and Python's True/False/None
+- trailing, doubled or missing commas
+- truncated input, by closing whatever is still open
+
+Well-formed JSON takes the C decoder's path. Trailing text after the
+object is ignored. validate() then builds the fetch_models schema, falling
+back to the given defaults for fields that are missing or the wrong type.
+"""
+import json
+import re
+from typing import Any, Dict, Type, TypeVar
+
+T = TypeVar("T")
+
+
+class JSONRepairError(ValueError):
+    """No JSON object could be recovered from the text"""
+
+
+_DECODER = json.JSONDecoder()
+_WS = re.compile(r"\s*")
+_NUMBER = re.compile(r"-?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?")
+_BAREWORD = re.compile(r"[A-Za-z_$][\w$-]*")
+_STRING_CHUNK = {'"': re.compile(r'[^"\\]*'), "'": re.compile(r"[^'\\]*")}
+_AFTER_STRING = frozenset(",:}]")
+_LITERALS = {"true": True, "false": False, "null": None, "True": True, "False": False, "None": None}
+_ESCAPES = {'"': '"', "'": "'", "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class _Parser:
+    __slots__ = ("text", "pos", "end", "truncated")
+
+    def __init__(self, text: str, pos: int):
+        self.text = text
+        self.pos = pos
+        self.end = len(text)
+        self.truncated = False
+
+    def _skip_ws(self) -> bool:
+        """Skip whitespace; False (and marks the input truncated) if that reached the end"""
+        self.pos = _WS.match(self.text, self.pos).end()
+        if self.pos >= self.end:
+            self.truncated = True
+            return False
+        return True
+
+    def value(self) -> Any:
+        if not self._skip_ws():
+            return None
+        char = self.text[self.pos]
+        if char == "{":
+            return self.object()
+        if char == "[":
+            return self.array()
+        if char in _STRING_CHUNK:
+            return self.string(char)
+        match = _NUMBER.match(self.text, self.pos)
+        if match:
+            self.pos = match.end()
+            number = match.group()
+            return float(number) if any(c in number for c in ".eE") else int(number)
+        match = _BAREWORD.match(self.text, self.pos)
+        if match:
+            self.pos = match.end()
+            return _LITERALS.get(match.group(), match.group())
+        raise JSONRepairError(f"Unexpected {char!r} at offset {self.pos}")
+
+    def string(self, quote: str) -> str:
+        text, end = self.text, self.end
+        chunk = _STRING_CHUNK[quote]
+        pos = self.pos + 1
+        parts = []
+        while True:
+            match = chunk.match(text, pos)
+            parts.append(match.group())
+            pos = match.end()
+            if pos >= end:
+                self.pos = end
+                self.truncated = True
+                return "".join(parts)
+            if text[pos] == "\\":
+                escape = text[pos + 1:pos + 2]
+                if escape == "u":
+                    try:
+                        parts.append(chr(int(text[pos + 2:pos + 6], 16)))
+                        pos += 6
+                        continue
+                    except ValueError:
+                        pass
+                parts.append(_ESCAPES.get(escape, escape))
+                pos += 2
+                continue
+            # A quote ends the string only where JSON structure can follow; otherwise it's part of the text
+            after = _WS.match(text, pos + 1).end()
+            if after >= end or text[after] in _AFTER_STRING:
+                self.pos = pos + 1
+                return "".join(parts)
+            parts.append(quote)
+            pos += 1
+
+    def key(self) -> str:
+        char = self.text[self.pos]
+        if char in _STRING_CHUNK:
+            return self.string(char)
+        match = _BAREWORD.match(self.text, self.pos) or _NUMBER.match(self.text, self.pos)
+        if not match:
+            raise JSONRepairError(f"Unexpected {char!r} at offset {self.pos}")
+        self.pos = match.end()
+        return match.group()
+
+    def object(self) -> Dict:
+        self.pos += 1
+        result = {}
+        while self._skip_ws():
+            char = self.text[self.pos]
+            if char == "}":
+                self.pos += 1
+                return result
+            if char == ",":
+                self.pos += 1
+                continue
+            key = self.key()
+            if not self._skip_ws():
+                return result
+            if self.text[self.pos] == ":":
+                self.pos += 1
+            result[key] = self.value()
+        return result
+
+    def array(self) -> list:
+        self.pos += 1
+        result = []
+        while self._skip_ws():
+            char = self.text[self.pos]
+            if char == "]":
+                self.pos += 1
+                return result
+            if char == ",":
+                self.pos += 1
+                continue
+            result.append(self.value())
+        return result
+
+
+def extract(text: str) -> Dict:
+    """The first JSON object in `text`, repaired; raises JSONRepairError if there is none"""
+    start = text.find("{")
+    if start < 0:
+        raise JSONRepairError("No JSON object found")
+    try:
+        # Well-formed output (the common case) goes through the C decoder
+        parsed, _ = _DECODER.raw_decode(text, start)
+        return parsed
+    except ValueError:
+        return _Parser(text, start).object()
+
+
+class StreamingObject:
+    """Incremental parse of a streamed reply: feed() chunks as they arrive and get each top-level field once its value closes.
+
+    A small scanner keeps its quote and nesting state between chunks, so each
+    character is scanned once (a closing quote at the very end of a chunk waits
+    for the next one). Only a finished `key: value` span goes to the tolerant
+    parser. Once the stream ends, parse the whole `text` with extract().
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.fields: Dict[str, Any] = {}
+        self._pos = 0
+        self._depth = 0
+        self._quote = None
+        self._escaped = False
+        self._field_start = None
+
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        """Append `chunk`; returns the top-level fields that completed within it"""
+        self.text += chunk
+        text = self.text
+        completed = {}
+        pos = self._pos
+        while pos < len(text):
+            char = text[pos]
+            if self._quote:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == self._quote:
+                    # Same rule as the parser: the quote closes only if structure follows
+                    after = _WS.match(text, pos + 1).end()
+                    if after >= len(text):
+                        break  # decide once the next chunk shows what follows
+                    if text[after] in _AFTER_STRING:
+                        self._quote = None
+            elif self._depth == 0:
+                # Prose before the object; quotes here are apostrophes
+                if char == "{" and self._field_start is None:
+                    self._depth = 1
+                    self._field_start = pos + 1
+            elif char in _STRING_CHUNK:
+                self._quote = char
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    completed.update(self._complete(pos))
+            elif char == "," and self._depth == 1:
+                completed.update(self._complete(pos))
+                self._field_start = pos + 1
+            pos += 1
+        self._pos = pos
+        self.fields.update(completed)
+        return completed
+
+    def _complete(self, end: int) -> Dict[str, Any]:
+        span = self.text[self._field_start:end]
+        if not span.strip():
+            return {}
+        try:
+            return _Parser("{" + span + "}", 0).object()
+        except JSONRepairError:
+            return {}
+
+
+def validate(model: Type[T], parsed: Dict, defaults: Dict, **fields) -> T:
+    """Build `model` from `parsed`, using `defaults` for missing fields and for fields that fail validation"""
+    known = model.__fields__
+    data = dict(defaults)
+    data.update((k, v) for k, v in parsed.items() if k in known and v is not None)
+    data.update(fields)
+    try:
+        return model(**data)
+    except ValueError as e:
+        invalid = {error["loc"][0] for error in e.errors()} if hasattr(e, "errors") else set()
+        if not invalid or not invalid <= set(defaults):
+            raise
+        for name in invalid:
+            data[name] = defaults[name]
+        return model(**data)
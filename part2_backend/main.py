@@ -1,7 +1,6 @@
 # main.py
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 import uvicorn
 import uuid
 from fetch_models import VisionAnalysisRequest, ExperienceComplete, ErrorMessage
@@ -13,80 +12,350 @@ load_dotenv()
 
 app = FastAPI(title="Photo-to-Audio Experience API")
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="storage/audio"), name="audio")
+# Generated audio (content-hash names, ETags, byte ranges)
+from audio_http import audio_response
 
-# Shared request queue for agent communication
+@app.api_route("/static/{filename}", methods=["GET", "HEAD"])
+async def serve_audio(filename: str, request: Request):
+    return audio_response(request, filename)
+
+# Shared job queue for agent communication
+import asyncio
 import json
-import os
-REQUEST_FILE = "storage/requests.json"
-RESPONSE_DIR = "storage/responses/"
+import time
+import job_queue
+import job_events
+import notify
+import agent_health
+import stats
+import result_cache
+import image_prep
+import phash_index
+import perception_runs
+import metrics
+import emotion_cache
 
-os.makedirs(RESPONSE_DIR, exist_ok=True)
+JOB_TIMEOUT = 300  # 5 minutes timeout for processing
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "100"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))  # default per-batch cap
 
-@app.post("/api/experience/create")
-async def create_experience(request: Request):
+# Admission control: bounded wait queues, overflow is rejected with 429 + Retry-After
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", "64"))
+MAX_QUEUED_BATCH_ITEMS = int(os.getenv("MAX_QUEUED_BATCH_ITEMS", "1000"))
+MAX_WAITING_REQUESTS = int(os.getenv("MAX_WAITING_REQUESTS", "256"))  # blocking /create calls per worker process
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "15"))
+waiting_requests = 0
+SSE_KEEPALIVE = 15  # seconds between keep-alive comments on an idle stream
+
+# The coordinator pushes a datagram to every worker whenever a session's state changes,
+# so whichever worker holds the waiting request (or SSE stream) wakes up
+notifier = notify.Notifier(f"gateway-{os.getpid()}")
+# Cached agent readiness, refreshed in the background from agent heartbeats
+health_monitor = agent_health.HealthMonitor()
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    with metrics.HTTP_IN_FLIGHT.track():
+        response = await call_next(request)
+    # Label by route template, not the raw path, so session ids don't each get their own series
+    route = request.scope.get("route")
+    metrics.HTTP_SECONDS.observe(time.perf_counter() - started, method=request.method,
+                                 route=getattr(route, "path", "unmatched"), status=response.status_code)
+    return response
+
+@app.on_event("startup")
+async def start_background_tasks():
+    if not await notifier.start():
+        print("⚠️  Push notifications unavailable - falling back to polling the job queue")
+    health_monitor.start()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    health_monitor.stop()
+    notifier.close()
+
+async def check_bureau():
+    """Raise 503 if any agent has stopped sending heartbeats or is overloaded (uses the cached snapshot)"""
+    if not health_monitor.ready:
+        down = ", ".join(health_monitor.unavailable_agents())
+        raise HTTPException(
+            status_code=503,
+            detail=f"Agents not running ({down}). Please start with: python3 run_agents.py",
+            headers={"Retry-After": str(int(agent_health.STALE_AFTER))}
+        )
+    overloaded = health_monitor.overloaded_agents()
+    if overloaded:
+        await asyncio.to_thread(stats.incr, "admission_rejected_agents_overloaded")
+        raise HTTPException(
+            status_code=503,
+            detail=f"Agents overloaded ({', '.join(overloaded)}) - retry later",
+            headers={"Retry-After": str(ADMISSION_RETRY_AFTER)}
+        )
+
+def reject(reason: str, detail: str):
+    """Count the rejection and raise 429; the count is a state DB write, so call this on a worker thread"""
+    stats.incr(f"admission_rejected_{reason}")
+    raise HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(ADMISSION_RETRY_AFTER)})
+
+def admit(count: int = 1, batch: bool = False):
+    """Reject early (429) when the wait queue is already full"""
+    if batch:
+        if job_queue.queued(batch=True) + count > MAX_QUEUED_BATCH_ITEMS:
+            reject("batch_queue_full", f"Batch queue is full ({MAX_QUEUED_BATCH_ITEMS} items) - retry later")
+    elif job_queue.queued() + count > MAX_QUEUED_JOBS:
+        reject("queue_full", f"Job queue is full ({MAX_QUEUED_JOBS} waiting) - retry later")
+    stats.incr("admission_accepted", count)
+
+async def submit_job(request: Request) -> str:
+    """Validate the request body and append it to the job queue, returning the session id"""
+    data = await request.json()
+    photo_url = data.get("photo_url")
+    user_id = data.get("user_id", "api_user")
+
+    if not photo_url:
+        raise HTTPException(status_code=400, detail="photo_url required")
+
+    await check_bureau()
+
+    session_id = f"{user_id}_{uuid.uuid4().hex[:8]}"
+    await asyncio.to_thread(admit_and_enqueue, session_id, photo_url)
+    return session_id
+
+def admit_and_enqueue(session_id: str, photo_url: str):
+    """Runs on a worker thread, like every state DB call in the handlers: a write lock can hold a query for up
+    to busy_timeout (10s), and on the event loop that would stall every request this worker is serving"""
+    admit()
+    job_queue.enqueue(session_id, photo_url)
+
+def job_status(job: dict) -> dict:
+    return {
+        "session_id": job["session_id"],
+        "photo_url": job["photo_url"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "result": job["result"],
+        "error": job["error"],
+        "failed_step": job["failed_step"]
+    }
+
+async def wait_for_job(session_id: str, timeout: float = JOB_TIMEOUT):
+    """Wait (without blocking the event loop) until the job is done or failed; None on timeout"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    with notifier.subscribe(session_id) as changed:
+        while loop.time() < deadline:
+            job = await asyncio.to_thread(job_queue.get, session_id)
+            if job and job["status"] in job_queue.TERMINAL_STATUSES:
+                return job
+            await notifier.wait(changed, min(notify.FALLBACK_POLL, deadline - loop.time()))
+    return None
+
+@app.post("/api/experience", status_code=202)
+async def submit_experience(request: Request):
+    """Queue an experience and return its job id immediately"""
+    try:
+        session_id = await submit_job(request)
+        return {
+            "session_id": session_id,
+            "status": "queued",
+            "status_url": f"/api/experience/{session_id}"
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+@app.post("/api/experience/batch", status_code=202)
+async def submit_batch(request: Request):
+    """Queue one experience per photo URL under a single batch id"""
     try:
         data = await request.json()
-        photo_url = data.get("photo_url")
+        photo_urls = data.get("photo_urls")
         user_id = data.get("user_id", "api_user")
 
-        if not photo_url:
-            raise HTTPException(status_code=400, detail="photo_url required")
+        if not isinstance(photo_urls, list) or not photo_urls or not all(isinstance(u, str) and u for u in photo_urls):
+            raise HTTPException(status_code=400, detail="photo_urls must be a non-empty list of URLs")
+        if len(photo_urls) > MAX_BATCH_SIZE:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} photos per batch")
+        try:
+            concurrency = int(data.get("concurrency", BATCH_CONCURRENCY))
+        except (TypeError, ValueError):
+            concurrency = 0
+        if concurrency < 1:
+            raise HTTPException(status_code=400, detail="concurrency must be a positive integer")
 
-        session_id = f"{user_id}_{uuid.uuid4().hex[:8]}"
+        await check_bureau()
 
-        # Check if agents are running
-        import socket
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        result = sock.connect_ex(('127.0.0.1', 8001))
-        sock.close()
+        batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+        items = [{"session_id": f"{user_id}_{uuid.uuid4().hex[:8]}", "photo_url": url} for url in photo_urls]
 
-        if result != 0:
-            raise HTTPException(
-                status_code=503,
-                detail="Agent bureau not running. Please start with: python3 run_agents.py"
-            )
+        def admit_and_enqueue_batch():
+            admit(len(photo_urls), batch=True)
+            job_queue.enqueue_batch(batch_id, items, concurrency)
 
-        # Write request to shared file for agents to pick up
-        request_data = {
-            "session_id": session_id,
-            "photo_url": photo_url,
-            "timestamp": str(uuid.uuid4())
+        await asyncio.to_thread(admit_and_enqueue_batch)
+        return {
+            "batch_id": batch_id,
+            "status_url": f"/api/experience/batch/{batch_id}",
+            "concurrency": concurrency,
+            "items": items
         }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
-        # Write to request queue
-        with open(REQUEST_FILE, "w") as f:
-            json.dump(request_data, f)
+@app.get("/api/experience/batch/{batch_id}")
+async def get_batch(batch_id: str, since: float = 0.0):
+    """Batch progress; pass the returned cursor as ?since= to fetch only items that changed"""
+    batch = await asyncio.to_thread(job_queue.get_batch, batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Unknown batch {batch_id}")
+    items = await asyncio.to_thread(job_queue.batch_items, batch_id, since)
+    counts = batch["counts"]
+    return {
+        "batch_id": batch_id,
+        "concurrency": batch["concurrency"],
+        "total": sum(counts.values()),
+        "counts": counts,
+        "finished": sum(counts.get(status, 0) for status in job_queue.TERMINAL_STATUSES) == sum(counts.values()),
+        "cursor": max((item["updated_at"] for item in items), default=since),
+        "items": [job_status(item) for item in items]
+    }
 
-        # Wait for response (poll the response file)
-        response_file = f"{RESPONSE_DIR}/{session_id}.json"
-        import time
-        timeout = 300  # 5 minutes timeout for processing
-        start_time = time.time()
+@app.get("/api/experience/{session_id}")
+async def get_experience(session_id: str):
+    """Job status, plus the final experience once it's done"""
+    job = await asyncio.to_thread(job_queue.get, session_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown session {session_id}")
+    return job_status(job)
 
-        while time.time() - start_time < timeout:
-            if os.path.exists(response_file):
-                with open(response_file, "r") as f:
-                    response_data = json.load(f)
-                os.remove(response_file)  # Clean up
-                return response_data
+def sse_event(event: str, data: dict, event_id: int = None) -> str:
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", f"data: {json.dumps(data)}"]
+    return "\n".join(lines) + "\n\n"
 
-            time.sleep(2)  # Check every 2 seconds
+@app.get("/api/experience/{session_id}/events")
+async def stream_experience_events(session_id: str, request: Request):
+    """Server-Sent Events: stage_started / stage_finished per stage, then complete or failed"""
+    if await asyncio.to_thread(job_queue.get, session_id) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown session {session_id}")
 
-        # Timeout
-        raise HTTPException(
-            status_code=504,
-            detail="Request timed out after 5 minutes - agents may be processing or there may be an error. Check agent logs."
-        )
+    # Browsers send Last-Event-ID when they reconnect, so resume after it (a malformed one replays everything)
+    try:
+        last_id = int(request.headers.get("last-event-id") or 0)
+    except ValueError:
+        last_id = 0
+
+    async def event_stream():
+        nonlocal last_id
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + JOB_TIMEOUT
+        last_sent = loop.time()
+
+        with notifier.subscribe(session_id) as changed:
+            while loop.time() < deadline:
+                if await request.is_disconnected():
+                    return
+
+                # Read the job before its events so a stage finishing in between isn't skipped
+                job = await asyncio.to_thread(job_queue.get, session_id)
+                for event in await asyncio.to_thread(job_events.since, session_id, last_id):
+                    last_id = event["id"]
+                    last_sent = loop.time()
+                    yield sse_event(event["event"], {
+                        "session_id": session_id,
+                        "stage": event["stage"],
+                        "step": job_events.STAGE_STEPS.get(event["stage"]),
+                        "ts": event["ts"],
+                        "duration_ms": event["duration_ms"]
+                    }, event["id"])
+
+                if job["status"] in job_queue.TERMINAL_STATUSES:
+                    yield sse_event("complete" if job["status"] == "done" else "failed", job_status(job))
+                    return
+
+                if loop.time() - last_sent > SSE_KEEPALIVE:
+                    last_sent = loop.time()
+                    yield ": keep-alive\n\n"
+                await notifier.wait(changed, min(notify.FALLBACK_POLL, deadline - loop.time()))
+
+        yield sse_event("timeout", {"session_id": session_id})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/experience/create")
+async def create_experience(request: Request):
+    """Blocking variant: queue an experience and wait for its result"""
+    global waiting_requests
+    try:
+        if waiting_requests >= MAX_WAITING_REQUESTS:
+            await asyncio.to_thread(reject, "too_many_waiting", f"Too many requests waiting ({MAX_WAITING_REQUESTS}) - use POST /api/experience or retry later")
+
+        session_id = await submit_job(request)
+        waiting_requests += 1
+        try:
+            job = await wait_for_job(session_id)
+        finally:
+            waiting_requests -= 1
+
+        if job is None:
+            raise HTTPException(
+                status_code=504,
+                detail=f"Request timed out after 5 minutes - poll /api/experience/{session_id} for the result or check agent logs."
+            )
+        if job["status"] == "expired":
+            raise HTTPException(status_code=503, detail=f"Session {session_id} expired in the queue before an agent slot freed up",
+                                headers={"Retry-After": str(ADMISSION_RETRY_AFTER)})
+        if job["status"] == "failed":
+            raise HTTPException(
+                status_code=502,
+                detail={"session_id": session_id, "step": job["failed_step"], "error": job["error"]}
+            )
+
+        return job["result"]
 
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+@app.get("/health")
+async def health():
+    """Per-agent readiness and load, plus job queue depths"""
+    snapshot = await asyncio.to_thread(health_snapshot)
+    return JSONResponse(snapshot, status_code=200 if snapshot["ready"] else 503)
+
+def health_snapshot() -> dict:
+    snapshot = dict(health_monitor.current or health_monitor.refresh())
+    snapshot["admission"] = {
+        "max_queued_jobs": MAX_QUEUED_JOBS,
+        "max_queued_batch_items": MAX_QUEUED_BATCH_ITEMS,
+        "max_waiting_requests": MAX_WAITING_REQUESTS,
+        "worker_pid": os.getpid(),
+        "waiting_requests": waiting_requests,
+        "counters": stats.counters("admission_"),
+        "jobs_expired": stats.counters("jobs_expired").get("jobs_expired", 0)
+    }
+    snapshot["result_cache"] = result_cache.summary()
+    snapshot["image_prep"] = image_prep.summary()
+    snapshot["phash_index"] = phash_index.summary()
+    snapshot["perception_modes"] = perception_runs.summary()
+    snapshot["emotion_cache"] = emotion_cache.summary()
+    return snapshot
+
+@app.get("/metrics")
+async def get_metrics():
+    """Latency histograms, error counters and in-flight gauges from the gateway workers and every agent"""
+    return PlainTextResponse(await asyncio.to_thread(metrics.render), media_type=metrics.CONTENT_TYPE)
 
 @app.get("/demo")
 async def demo_page():
@@ -97,8 +366,14 @@ async def root():
     return {"message": "Photo-to-Audio Experience API", "docs": "/docs"}
 
 if __name__ == "__main__":
+    # All session state lives in storage/state.db, so any number of workers can share the load
+    workers = int(os.getenv("GATEWAY_WORKERS", "1"))
     print("🚀 Starting FastAPI server...")
     print("🌐 API: http://localhost:9000")
     print("🎭 Demo: http://localhost:9000/demo")
+    print(f"👷 Workers: {workers}")
     print("🤖 IMPORTANT: Start agents first with 'python3 run_agents.py'")
-    uvicorn.run(app, host="0.0.0.0", port=9000)
+    if workers > 1:
+        uvicorn.run("main:app", host="0.0.0.0", port=9000, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=9000)
@@ -0,0 +1,291 @@
+# metrics.py
+"""Prometheus-style metrics for the gateway and the agent bureau, served as plain text at GET /metrics.
+
+Each process records into its own in-memory registry, so recording costs no
+I/O. At most every METRICS_FLUSH_INTERVAL seconds the process writes a JSON
+snapshot of the registry to the shared state DB. The agents do this from
+their heartbeat and the gateway from its health monitor. render() merges
+every process's latest snapshot, summing series that have the same labels,
+and adds the stats.py counters. The output is the Prometheus text
+exposition format, which any scraper can read directly.
+
+Every metric is declared at the bottom of this module.
+"""
+import json
+import os
+import re
+import socket
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+from state_db import ensure_schema
+import stats
+
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+# Gauges from a process that hasn't flushed for this long are dropped, since it has probably exited. Its counters stay.
+METRICS_STALE_AFTER = float(os.getenv("METRICS_STALE_AFTER", "30"))
+# Snapshots from processes that have been gone longer than this are deleted
+METRICS_RETENTION = float(os.getenv("METRICS_RETENTION", "86400"))
+
+PREFIX = "photo_audio_"
+CONTENT_TYPE = "text/plain; version=0.0.4"
+# Seconds; provider calls and pipeline stages range from ~50ms (cache hits) to minutes
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+# Cache name -> (hits counter, misses counter) in stats.py, exported as cache_lookups_total
+CACHE_COUNTERS = {
+    "result_cache": ("result_cache_hits", "result_cache_misses"),
+    "phash": ("phash_hits", "phash_misses"),
+    "emotion": ("emotion_cache_hits", "emotion_cache_misses"),
+}
+
+PROCESS = f"{socket.gethostname()}:{os.getpid()}"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metric_snapshots (
+    process TEXT PRIMARY KEY,
+    snapshot TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+def _db():
+    return ensure_schema("metrics", _SCHEMA)
+
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+_registry: Dict[str, "_Metric"] = {}
+_collectors: List[Callable[[], None]] = []
+# Some observations come from worker threads (image prep, audio encoding)
+_lock = threading.Lock()
+_last_flush = 0.0
+
+
+def _key(labels: Dict) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = PREFIX + name
+        self.help = help
+        self.series: Dict[LabelKey, object] = {}
+        _registry[self.name] = self
+
+    def export(self) -> Dict:
+        return {"kind": self.kind, "help": self.help,
+                "series": [[list(key), value] for key, value in self.series.items()]}
+
+
+class Counter(_Metric):
+    """Monotonic total, e.g. errors or bytes produced"""
+    kind = "counter"
+
+    def inc(self, n: float = 1, **labels):
+        key = _key(labels)
+        with _lock:
+            self.series[key] = self.series.get(key, 0) + n
+
+
+class Gauge(_Metric):
+    """Current level, e.g. requests in flight; summed across processes"""
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with _lock:
+            self.series[_key(labels)] = value
+
+    def inc(self, n: float = 1, **labels):
+        key = _key(labels)
+        with _lock:
+            self.series[key] = self.series.get(key, 0) + n
+
+    def dec(self, n: float = 1, **labels):
+        self.inc(-n, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        """Count the enclosed block as in flight"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    """Distribution over fixed buckets; each series is [per-bucket counts (last one +Inf), sum]"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = list(buckets)
+
+    def observe(self, value: float, **labels):
+        key = _key(labels)
+        index = bisect_left(self.buckets, value)
+        with _lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the enclosed block's duration in seconds; a cancelled block is not observed"""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.observe(time.perf_counter() - started, **labels)
+            raise
+        self.observe(time.perf_counter() - started, **labels)
+
+    def export(self) -> Dict:
+        return dict(super().export(), buckets=self.buckets)
+
+
+def collector(fn: Callable[[], None]) -> Callable[[], None]:
+    """Register `fn` to set gauges from live state (e.g. pipeline slots) just before each snapshot"""
+    _collectors.append(fn)
+    return fn
+
+
+def snapshot() -> str:
+    """This process's registry as JSON"""
+    for fn in _collectors:
+        fn()
+    with _lock:
+        return json.dumps({name: metric.export() for name, metric in _registry.items()})
+
+
+def flush(force: bool = False):
+    """Write this process's snapshot to the state DB, at most every METRICS_FLUSH_INTERVAL unless forced"""
+    global _last_flush
+    now = time.time()
+    if not force and now - _last_flush < METRICS_FLUSH_INTERVAL:
+        return
+    _last_flush = now
+    conn = _db()
+    conn.execute(
+        "INSERT OR REPLACE INTO metric_snapshots (process, snapshot, updated_at) VALUES (?, ?, ?)",
+        (PROCESS, snapshot(), now)
+    )
+    conn.execute("DELETE FROM metric_snapshots WHERE updated_at < ?", (now - METRICS_RETENTION,))
+
+
+def _merge(snapshots: Iterable[Tuple[Dict, bool]]) -> Dict:
+    """Sum series with the same name and labels across (snapshot, fresh) pairs; stale gauges are skipped"""
+    merged = {}
+    for data, fresh in snapshots:
+        for name, metric in data.items():
+            if metric["kind"] == "gauge" and not fresh:
+                continue
+            target = merged.setdefault(name, {"kind": metric["kind"], "help": metric["help"],
+                                              "buckets": metric.get("buckets"), "series": {}})
+            if metric.get("buckets") != target["buckets"]:
+                continue  # bucket layout changed between deploys; keep the first one seen
+            for labels, value in metric["series"]:
+                key = tuple(tuple(pair) for pair in labels)
+                current = target["series"].get(key)
+                if target["kind"] != "histogram":
+                    target["series"][key] = (current or 0) + value
+                elif current is None:
+                    target["series"][key] = [list(value[0]), value[1]]
+                else:
+                    current[0] = [a + b for a, b in zip(current[0], value[0])]
+                    current[1] += value[1]
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(key: LabelKey, extra: Tuple = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _family(lines: List[str], name: str, kind: str, help: str, series: Dict, buckets=None):
+    lines.append(f"# HELP {name} {help}")
+    lines.append(f"# TYPE {name} {kind}")
+    for key in sorted(series):
+        value = series[key]
+        if kind != "histogram":
+            lines.append(f"{name}{_labels(key)} {_number(value)}")
+            continue
+        counts, total = value
+        cumulative = 0
+        for bound, count in zip(list(buckets) + ["+Inf"], counts):
+            cumulative += count
+            le = bound if bound == "+Inf" else _number(float(bound))
+            lines.append(f"{name}_bucket{_labels(key, (('le', le),))} {cumulative}")
+        lines.append(f"{name}_sum{_labels(key)} {_number(total)}")
+        lines.append(f"{name}_count{_labels(key)} {cumulative}")
+
+
+_UNSAFE = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def render() -> str:
+    """Every process's metrics plus the stats.py counters, in the text exposition format"""
+    flush(force=True)
+    now = time.time()
+    rows = _db().execute("SELECT snapshot, updated_at FROM metric_snapshots").fetchall()
+    merged = _merge((json.loads(row["snapshot"]), now - row["updated_at"] <= METRICS_STALE_AFTER) for row in rows)
+
+    lines = []
+    for name in sorted(merged):
+        metric = merged[name]
+        _family(lines, name, metric["kind"], metric["help"], metric["series"], metric["buckets"])
+
+    counters = stats.counters()
+    lookups = {}
+    for cache, names in CACHE_COUNTERS.items():
+        for result, counter in zip(("hit", "miss"), names):
+            lookups[(("cache", cache), ("result", result))] = counters.get(counter, 0)
+    _family(lines, PREFIX + "cache_lookups_total", "counter", "Cache lookups by cache and result", lookups)
+    _family(lines, PREFIX + "stats_total", "counter", "Shared stats.py counters, by name",
+            {(("counter", _UNSAFE.sub("_", name)),): value for name, value in counters.items()})
+    return "\n".join(lines) + "\n"
+
+
+# Pipeline stages (coordinator and embedded runner)
+STAGE_SECONDS = Histogram("stage_duration_seconds", "Pipeline stage wall time, from dispatch to its reply")
+STAGE_FAILURES = Counter("stage_failures_total", "Failed stage attempts by stage and reason (error or timeout)")
+STAGE_RETRIES = Counter("stage_retries_total", "Stage attempts re-dispatched after an error or a missed deadline")
+STAGE_IN_FLIGHT = Gauge("stage_in_flight", "Sessions currently running each stage")
+STAGE_QUEUED = Gauge("stage_queued", "Sessions waiting for a stage's concurrency slot")
+SESSIONS = Counter("sessions_total", "Sessions handled by the coordinator, by outcome")
+SESSION_SECONDS = Histogram("session_duration_seconds", "Session wall time, from coordinator start to final audio")
+
+# Provider calls (OpenAI, Letta, Fish Audio), one observation per HTTP attempt
+PROVIDER_SECONDS = Histogram("provider_request_duration_seconds", "Provider request latency per attempt")
+PROVIDER_ERRORS = Counter("provider_errors_total", "Provider attempts that failed, by HTTP status or transport error")
+PROVIDER_IN_FLIGHT = Gauge("provider_requests_in_flight", "Provider requests currently waiting for an answer")
+
+# Agents (from their heartbeats)
+AGENT_IN_FLIGHT = Gauge("agent_messages_in_flight", "Messages each agent is currently handling")
+
+# Output
+AUDIO_BYTES = Counter("audio_bytes_total", "Bytes of generated audio written, by kind (voice, bed, mix)")
+
+# Gateway
+HTTP_SECONDS = Histogram("http_request_duration_seconds", "Gateway request latency until the response headers")
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Gateway requests currently being handled")
@@ -0,0 +1,135 @@
+# notify.py
+"""Push notifications between the gateway and the coordinator over local Unix datagram sockets.
+
+Writers call send() (or broadcast() to every gateway worker) right after
+committing state to the shared DB; readers run a Notifier and wait on a key (a
+session id, or "jobs" for new work) instead of polling. Delivery is best-effort - the DB stays the source of truth, so waiters
+still re-check it every FALLBACK_POLL seconds in case a datagram is lost.
+"""
+import asyncio
+import glob
+import json
+import os
+import socket
+from contextlib import contextmanager
+from typing import Dict, Set
+from state_db import BASE_DIR
+
+NOTIFY_DIR = os.getenv("NOTIFY_DIR", os.path.join(BASE_DIR, "storage", "notify"))
+FALLBACK_POLL = float(os.getenv("NOTIFY_FALLBACK_POLL", "5"))
+
+_send_sock = None
+
+
+def socket_path(name: str) -> str:
+    return os.path.join(NOTIFY_DIR, f"{name}.sock")
+
+
+def _sendto(path: str, payload: bytes):
+    global _send_sock
+    if _send_sock is None:
+        _send_sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        _send_sock.setblocking(False)
+    _send_sock.sendto(payload, path)
+
+
+def send(name: str, message: dict):
+    """Fire-and-forget a message to the listener called `name` (no-op if it isn't running)"""
+    if not hasattr(socket, "AF_UNIX"):
+        return
+    try:
+        _sendto(socket_path(name), json.dumps(message).encode())
+    except OSError:
+        # Listener not up (or its buffer is full) - it will catch up on its fallback poll
+        pass
+
+
+def broadcast(prefix: str, message: dict):
+    """send() to every listener named <prefix>-* - e.g. each gateway worker process"""
+    if not hasattr(socket, "AF_UNIX"):
+        return
+    payload = json.dumps(message).encode()
+    for path in glob.glob(os.path.join(NOTIFY_DIR, f"{prefix}-*.sock")):
+        try:
+            _sendto(path, payload)
+        except ConnectionRefusedError:
+            # Socket left behind by a worker that exited without cleaning up
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        except OSError:
+            pass
+
+
+class _Protocol(asyncio.DatagramProtocol):
+    def __init__(self, notifier):
+        self.notifier = notifier
+
+    def datagram_received(self, data, addr):
+        try:
+            message = json.loads(data)
+        except ValueError:
+            return
+        self.notifier.dispatch(message.get("key", ""))
+
+
+class Notifier:
+    """Receives datagrams on storage/notify/<name>.sock and wakes the matching waiters"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.path = socket_path(name)
+        self._waiters: Dict[str, Set[asyncio.Event]] = {}
+        self._transport = None
+
+    async def start(self) -> bool:
+        """Bind the socket; returns False (waiters fall back to polling) if that isn't possible"""
+        if not hasattr(socket, "AF_UNIX"):
+            return False
+        os.makedirs(NOTIFY_DIR, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        loop = asyncio.get_running_loop()
+        try:
+            self._transport, _ = await loop.create_datagram_endpoint(
+                lambda: _Protocol(self), local_addr=self.path, family=socket.AF_UNIX
+            )
+        except OSError:
+            return False
+        return True
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def dispatch(self, key: str):
+        for event in self._waiters.get(key, ()):
+            event.set()
+
+    @contextmanager
+    def subscribe(self, key: str):
+        """Register interest in `key` before checking state, so no notification slips in between"""
+        event = asyncio.Event()
+        self._waiters.setdefault(key, set()).add(event)
+        try:
+            yield event
+        finally:
+            waiters = self._waiters.get(key)
+            if waiters is not None:
+                waiters.discard(event)
+                if not waiters:
+                    del self._waiters[key]
+
+    async def wait(self, event: asyncio.Event, timeout: float = FALLBACK_POLL) -> bool:
+        """Wait for a subscribed event (at most `timeout` seconds); True if it fired"""
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            event.clear()
@@ -0,0 +1,63 @@
+# perception_runs.py
+"""Per-session latency and token usage of the perception stage, by mode (fused vs two_hop), in the shared state DB"""
+import os
+import time
+from typing import Dict
+from state_db import ensure_schema
+
+PERCEPTION_RUNS_MAX = int(os.getenv("PERCEPTION_RUNS_MAX", "10000"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS perception_runs (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    latency_ms REAL NOT NULL,
+    vision_ms REAL NOT NULL,
+    extraction_ms REAL NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+def _db():
+    return ensure_schema("perception_runs", _SCHEMA)
+
+
+def record(session_id: str, mode: str, vision_ms: float, extraction_ms: float,
+           prompt_tokens: int, completion_tokens: int):
+    """Store one run (extraction_ms is 0 in fused mode) and drop the oldest beyond PERCEPTION_RUNS_MAX"""
+    conn = _db()
+    conn.execute(
+        "INSERT INTO perception_runs (session_id, mode, latency_ms, vision_ms, extraction_ms, "
+        "prompt_tokens, completion_tokens, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (session_id, mode, vision_ms + extraction_ms, vision_ms, extraction_ms,
+         prompt_tokens, completion_tokens, time.time())
+    )
+    conn.execute(
+        "DELETE FROM perception_runs WHERE id IN ("
+        "SELECT id FROM perception_runs ORDER BY id DESC LIMIT -1 OFFSET ?)",
+        (PERCEPTION_RUNS_MAX,)
+    )
+
+
+def summary() -> Dict:
+    """Averages per mode over the stored runs"""
+    rows = _db().execute(
+        "SELECT mode, COUNT(*) AS runs, AVG(latency_ms) AS latency_ms, AVG(vision_ms) AS vision_ms, "
+        "AVG(extraction_ms) AS extraction_ms, AVG(prompt_tokens) AS prompt_tokens, "
+        "AVG(completion_tokens) AS completion_tokens FROM perception_runs GROUP BY mode"
+    ).fetchall()
+    return {
+        row["mode"]: {
+            "runs": row["runs"],
+            "avg_latency_ms": round(row["latency_ms"], 1),
+            "avg_vision_ms": round(row["vision_ms"], 1),
+            "avg_extraction_ms": round(row["extraction_ms"], 1),
+            "avg_prompt_tokens": round(row["prompt_tokens"], 1),
+            "avg_completion_tokens": round(row["completion_tokens"], 1)
+        }
+        for row in rows
+    }
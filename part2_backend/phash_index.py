@@ -0,0 +1,213 @@
+# phash_index.py
+"""Near-duplicate photo lookup: 64-bit dHash -> stored PerceptionData, so re-uploads skip GPT-4o and Letta.
+
+Crops, resizes and re-compressions of a photo change its bytes (and its
+result_cache key) but flip only a few bits of its difference hash. Matching
+uses multi-index hashing: the hash is split into PHASH_BANDS bands, and if two
+hashes differ in at most t bits, at least one band differs in at most
+t // PHASH_BANDS bits (pigeonhole). So a search probes each band's table with
+the query band and its neighbors within that radius, and only compares full
+hashes for those candidates. With 16-bit bands, a million entries leave about
+15 per bucket.
+
+Entries persist in the shared state DB. Each process keeps an in-memory index
+of hash -> row id and picks up rows added by other processes before each lookup.
+prune() (run by the coordinator's sweep) drops entries older than PHASH_TTL,
+which follows the result cache's TTL, and trims the table to PHASH_MAX_ENTRIES;
+a process that sees rows disappear rebuilds its index from what is left.
+"""
+import io
+import json
+import os
+import time
+from array import array
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+from PIL import Image, ImageOps
+from state_db import ensure_schema
+import result_cache
+import stats
+
+PHASH_ENABLED = os.getenv("PHASH_INDEX", "1") == "1"
+# Max differing bits (of 64) for two photos to count as the same scene
+PHASH_THRESHOLD = int(os.getenv("PHASH_THRESHOLD", "6"))
+PHASH_BANDS = 4
+PHASH_TTL = float(os.getenv("PHASH_TTL", str(result_cache.RESULT_CACHE_TTL)))
+PHASH_MAX_ENTRIES = int(os.getenv("PHASH_MAX_ENTRIES", "100000"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS phash_index (
+    id INTEGER PRIMARY KEY,
+    hash INTEGER NOT NULL,
+    config TEXT NOT NULL,
+    perception TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS phash_index_config_idx ON phash_index (config, id);
+"""
+
+
+def _db():
+    return ensure_schema("phash_index", _SCHEMA)
+
+
+def dhash(data: bytes) -> int:
+    """64-bit difference hash: 9x8 grayscale thumbnail, one bit per horizontally adjacent pixel pair"""
+    image = Image.open(io.BytesIO(data))
+    # JPEGs can decode at 1/8 scale straight away; the hash only needs 9x8 pixels
+    image.draft("L", (64, 64))
+    image = ImageOps.exif_transpose(image).convert("L").resize((9, 8), Image.LANCZOS)
+    pixels = image.tobytes()
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            value = (value << 1) | (left > pixels[row * 9 + col + 1])
+    return value
+
+
+# SQLite integers are signed 64-bit
+def _to_signed(value: int) -> int:
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _to_unsigned(value: int) -> int:
+    return value & 0xFFFFFFFFFFFFFFFF
+
+
+class PHashIndex:
+    """In-memory multi-index hash table over 64-bit hashes; maps a hash to the id it was added with"""
+
+    def __init__(self, bands: int = PHASH_BANDS):
+        self.bands = bands
+        self.band_bits = 64 // bands
+        self.hashes = array("Q")
+        self.ids = array("q")
+        # band number -> band value -> positions in hashes/ids
+        self.tables: List[Dict[int, List[int]]] = [{} for _ in range(bands)]
+        self._flips: Dict[int, List[int]] = {}
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def _bands(self, value: int):
+        mask = (1 << self.band_bits) - 1
+        return [(value >> (band * self.band_bits)) & mask for band in range(self.bands)]
+
+    def _flip_masks(self, radius: int) -> List[int]:
+        """Every band-sized mask with at most `radius` bits set"""
+        masks = self._flips.get(radius)
+        if masks is None:
+            masks = [sum(1 << bit for bit in bits)
+                     for r in range(radius + 1)
+                     for bits in combinations(range(self.band_bits), r)]
+            self._flips[radius] = masks
+        return masks
+
+    def add(self, value: int, entry_id: int):
+        position = len(self.hashes)
+        self.hashes.append(value)
+        self.ids.append(entry_id)
+        for band, key in enumerate(self._bands(value)):
+            self.tables[band].setdefault(key, []).append(position)
+
+    def search(self, value: int, max_distance: int) -> Optional[Tuple[int, int]]:
+        """(id, distance) of the closest hash within max_distance bits, or None"""
+        hashes = self.hashes
+        best_position, best_distance = -1, max_distance + 1
+        masks = self._flip_masks(max_distance // self.bands)
+        for band, key in enumerate(self._bands(value)):
+            get = self.tables[band].get
+            for mask in masks:
+                # A candidate can turn up in several bands; re-checking it is cheaper than tracking it
+                for position in get(key ^ mask, ()):
+                    distance = (hashes[position] ^ value).bit_count()
+                    if distance < best_distance:
+                        best_position, best_distance = position, distance
+                        if distance == 0:
+                            return self.ids[position], 0
+        if best_position < 0:
+            return None
+        return self.ids[best_position], best_distance
+
+
+_index = PHashIndex()
+_first_id = None
+_last_id = 0
+
+
+def _sync():
+    """Load rows added since the last call (by this or another process) for the current pipeline config"""
+    global _index, _first_id, _last_id
+    conn = _db()
+    config = result_cache.pipeline_fingerprint()
+    if _first_id is not None:
+        oldest = conn.execute("SELECT MIN(id) FROM phash_index WHERE config = ?", (config,)).fetchone()[0]
+        if oldest is None or oldest > _first_id:
+            # prune() removed rows this index still holds; the bands can't drop entries, so start over
+            _index, _first_id, _last_id = PHashIndex(), None, 0
+    rows = conn.execute(
+        "SELECT id, hash FROM phash_index WHERE config = ? AND id > ? ORDER BY id",
+        (config, _last_id)
+    ).fetchall()
+    for row in rows:
+        _index.add(_to_unsigned(row["hash"]), row["id"])
+        if _first_id is None:
+            _first_id = row["id"]
+        _last_id = row["id"]
+
+
+def lookup(value: int) -> Optional[Tuple[Dict, int]]:
+    """(perception payload, distance) for the nearest indexed photo within PHASH_THRESHOLD, or None"""
+    started = time.perf_counter()
+    _sync()
+    match = _index.search(value, PHASH_THRESHOLD)
+    stats.incr("phash_lookup_us", int((time.perf_counter() - started) * 1e6))
+    if match is None:
+        stats.incr("phash_misses")
+        return None
+    row = _db().execute(
+        "SELECT perception FROM phash_index WHERE id = ? AND created_at >= ?", (match[0], time.time() - PHASH_TTL)
+    ).fetchone()
+    if row is None:
+        # Expired, or pruned by another process since the last sync
+        stats.incr("phash_misses")
+        return None
+    stats.incr("phash_hits")
+    return json.loads(row["perception"]), match[1]
+
+
+def remember(value: int, perception: Dict):
+    """Index a freshly extracted perception payload (without session_id) under the photo's hash"""
+    _db().execute(
+        "INSERT INTO phash_index (hash, config, perception, created_at) VALUES (?, ?, ?, ?)",
+        (_to_signed(value), result_cache.pipeline_fingerprint(), json.dumps(perception), time.time())
+    )
+    _sync()
+
+
+def prune() -> int:
+    """Delete entries older than PHASH_TTL; past PHASH_MAX_ENTRIES, trim to 90% of it so rebuilds stay rare"""
+    conn = _db()
+    deleted = conn.execute("DELETE FROM phash_index WHERE created_at < ?", (time.time() - PHASH_TTL,)).rowcount
+    if conn.execute("SELECT COUNT(*) FROM phash_index").fetchone()[0] > PHASH_MAX_ENTRIES:
+        deleted += conn.execute(
+            "DELETE FROM phash_index WHERE id IN (SELECT id FROM phash_index ORDER BY id DESC LIMIT -1 OFFSET ?)",
+            (int(PHASH_MAX_ENTRIES * 0.9),)
+        ).rowcount
+    return deleted
+
+
+def summary() -> Dict:
+    counters = stats.counters("phash_")
+    hits = counters.get("phash_hits", 0)
+    misses = counters.get("phash_misses", 0)
+    return {
+        "enabled": PHASH_ENABLED,
+        "threshold": PHASH_THRESHOLD,
+        "entries": _db().execute("SELECT COUNT(*) FROM phash_index").fetchone()[0],
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+        "avg_lookup_us": round(counters.get("phash_lookup_us", 0) / (hits + misses), 1) if hits + misses else None
+    }
@@ -0,0 +1,224 @@
+# pipeline.py
+"""Small DAG executor for the coordinator: each stage declares its inputs and starts as soon as they are done.
+
+Stages only *dispatch* work (usually a ctx.send to an agent); the reply arrives
+later in a message handler, which stores the output on the session and calls
+Pipeline.finished(). Per-session progress lives in `state.timings`
+({stage: [started_at, finished_at]}) and `state.attempts` ({stage: [count,
+attempt_started_at]}), so the engine itself only keeps the per-stage
+concurrency slots.
+
+Each dispatch gets a deadline - the earlier of the session's `state.deadline`
+and the stage timeout - which the stage forwards to its agent. A stage that
+misses it (or reports an error) is re-dispatched while it has retries left;
+whichever reply arrives first wins and later duplicates are ignored.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+import metrics
+
+# Per-stage settings as "stage=value,..." - e.g. PIPELINE_STAGE_LIMITS="narration=4,dialogue_voice=2"
+# caps how many sessions run a stage at once; the others override the timeouts/retries declared in code
+PIPELINE_STAGE_LIMITS = os.getenv("PIPELINE_STAGE_LIMITS", "")
+PIPELINE_STAGE_TIMEOUTS = os.getenv("PIPELINE_STAGE_TIMEOUTS", "")
+PIPELINE_STAGE_RETRIES = os.getenv("PIPELINE_STAGE_RETRIES", "")
+
+
+def parse_stage_map(spec: str, cast=int) -> Dict:
+    settings = {}
+    for item in spec.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            settings[name.strip()] = cast(value)
+    return settings
+
+
+class Stage:
+    """One pipeline step: `run(ctx, state, deadline)` dispatches the work once every stage in `inputs` has finished"""
+
+    def __init__(self, name: str, run: Callable[..., Awaitable[None]], inputs: Sequence[str] = (),
+                 limit: Optional[int] = None, timeout: Optional[float] = None, retries: int = 0):
+        self.name = name
+        self.run = run
+        self.inputs = tuple(inputs)
+        self.limit = limit
+        self.timeout = timeout
+        self.retries = retries
+
+
+class Pipeline:
+    """Runs Stages in dependency order, overlapping every stage whose inputs are ready"""
+
+    def __init__(self, stages: List[Stage], limits: Optional[Dict[str, int]] = None,
+                 timeouts: Optional[Dict[str, float]] = None, retries: Optional[Dict[str, int]] = None,
+                 on_start: Optional[Callable[[object, str], None]] = None):
+        self.stages = {stage.name: stage for stage in stages}
+        for attr, overrides in (("limit", limits), ("timeout", timeouts), ("retries", retries)):
+            for name, value in (overrides or {}).items():
+                if name not in self.stages:
+                    raise ValueError(f"Stage {attr} set for unknown stage '{name}'")
+                setattr(self.stages[name], attr, value)
+        self.order = self._topological_order()
+        # Stages nothing else depends on - the session is complete when all of them are
+        self.sinks = [name for name in self.order
+                      if not any(name in stage.inputs for stage in self.stages.values())]
+        self.on_start = on_start
+        self.running = {name: 0 for name in self.stages}
+        self.waiting = {name: deque() for name in self.stages}
+
+    def _topological_order(self) -> List[str]:
+        order, visiting = [], set()
+
+        def visit(name, path):
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f"Pipeline cycle: {' -> '.join(path + [name])}")
+            if name not in self.stages:
+                raise ValueError(f"Stage '{path[-1]}' depends on unknown stage '{name}'")
+            visiting.add(name)
+            for dep in self.stages[name].inputs:
+                visit(dep, path + [name])
+            visiting.discard(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name, [])
+        return order
+
+    @staticmethod
+    def is_finished(state, name: str) -> bool:
+        timing = state.timings.get(name)
+        return timing is not None and timing[1] is not None
+
+    def done(self, state) -> bool:
+        return all(self.is_finished(state, name) for name in self.order)
+
+    async def advance(self, ctx, state):
+        """Start (or queue for a slot) every not-yet-started stage whose inputs have all finished"""
+        for name in self.order:
+            stage = self.stages[name]
+            if name in state.timings or not all(self.is_finished(state, dep) for dep in stage.inputs):
+                continue
+            if stage.limit is not None and self.running[name] >= stage.limit:
+                state.timings[name] = [None, None]  # queued
+                self.waiting[name].append((ctx, state))
+                continue
+            await self._start(ctx, state, stage)
+
+    async def _start(self, ctx, state, stage: Stage):
+        now = time.time()
+        self.running[stage.name] += 1
+        state.timings[stage.name] = [now, None]
+        state.attempts[stage.name] = [1, now]
+        if self.on_start is not None:
+            self.on_start(state, stage.name)
+        await stage.run(ctx, state, self.deadline(state, stage.name))
+
+    def deadline(self, state, name: str) -> Optional[float]:
+        """When the current attempt of `name` must be done by: stage timeout, capped by the session deadline"""
+        timeout = self.stages[name].timeout
+        deadlines = [d for d in (state.deadline, timeout and state.attempts[name][1] + timeout) if d]
+        return min(deadlines) if deadlines else None
+
+    def is_running(self, state, name: str) -> bool:
+        timing = state.timings.get(name)
+        return timing is not None and timing[0] is not None and timing[1] is None
+
+    async def retry(self, ctx, state, name: str) -> bool:
+        """Re-dispatch a running stage; False when it is out of retries (or the session out of time)"""
+        count = state.attempts[name][0]
+        now = time.time()
+        if count > self.stages[name].retries or (state.deadline is not None and now >= state.deadline):
+            return False
+        state.attempts[name] = [count + 1, now]
+        metrics.STAGE_RETRIES.inc(stage=name)
+        await self.stages[name].run(ctx, state, self.deadline(state, name))
+        return True
+
+    async def check_deadlines(self, ctx, state) -> Optional[str]:
+        """Retry stages that missed their deadline; returns the stage that timed out for good, if any"""
+        now = time.time()
+        for name in self.order:
+            timing = state.timings.get(name)
+            if timing is None or timing[1] is not None:
+                continue
+            if timing[0] is None:
+                # Still queued for a slot - only the session deadline applies
+                if state.deadline is not None and now >= state.deadline:
+                    return name
+                continue
+            deadline = self.deadline(state, name)
+            if deadline is None or now < deadline:
+                continue
+            metrics.STAGE_FAILURES.inc(stage=name, reason="timeout")
+            if not await self.retry(ctx, state, name):
+                return name
+        return None
+
+    async def finished(self, ctx, state, name: str) -> bool:
+        """Mark `name` done for this session and start what it unblocks; True once the whole DAG is done.
+
+        Replies for stages that aren't running (duplicates, late redeliveries) are ignored.
+        """
+        timing = state.timings.get(name)
+        if timing is None or timing[0] is None or timing[1] is not None:
+            return False
+        timing[1] = time.time()
+        self.running[name] -= 1
+        await self._start_waiting(name)
+        await self.advance(ctx, state)
+        return self.done(state)
+
+    async def _start_waiting(self, name: str):
+        while self.waiting[name] and self.running[name] < (self.stages[name].limit or float("inf")):
+            ctx, state = self.waiting[name].popleft()
+            await self._start(ctx, state, self.stages[name])
+
+    def cancel(self, state):
+        """Forget a failed or evicted session: free the slots it holds and drop it from the wait queues"""
+        freed = []
+        for name, timing in state.timings.items():
+            if timing[0] is not None and timing[1] is None:
+                self.running[name] -= 1
+                freed.append(name)
+            elif timing[0] is None:
+                self.waiting[name] = deque(item for item in self.waiting[name] if item[1] is not state)
+        for name in freed:
+            if self.waiting[name]:
+                asyncio.get_event_loop().create_task(self._start_waiting(name))
+
+    def critical_path(self, state) -> List[Dict]:
+        """Walk back from the last-finishing sink through whichever input finished last.
+
+        `wait_ms` is the gap between that input finishing and the stage starting
+        (queueing for a slot plus coordinator overhead).
+        """
+        finished = [name for name in self.sinks if self.is_finished(state, name)]
+        if not finished:
+            return []
+        path = []
+        name = max(finished, key=lambda n: state.timings[n][1])
+        while name is not None:
+            started, ended = state.timings[name]
+            inputs = [dep for dep in self.stages[name].inputs if self.is_finished(state, dep)]
+            previous = max(inputs, key=lambda n: state.timings[n][1]) if inputs else None
+            ready = state.timings[previous][1] if previous else started
+            path.append({
+                "stage": name,
+                "ms": round((ended - started) * 1000, 1),
+                "wait_ms": round((started - ready) * 1000, 1)
+            })
+            name = previous
+        path.reverse()
+        return path
+
+    def stats(self) -> Dict:
+        return {
+            name: {"running": self.running[name], "waiting": len(self.waiting[name]), "limit": stage.limit,
+                   "timeout": stage.timeout, "retries": stage.retries}
+            for name, stage in self.stages.items()
+        }
@@ -0,0 +1,112 @@
+# providers.py
+"""Long-lived, pooled HTTP clients for the external providers (OpenAI, Letta, Fish Audio).
+
+One httpx.AsyncClient per provider host, shared by every agent in the process,
+so calls reuse kept-alive (optionally HTTP/2) connections instead of paying a
+TCP+TLS handshake each time. Each host has its own connection limit, and
+warm_up() opens connections at agent startup before the first session needs them.
+stream_events() reads streaming (server-sent events) responses as they arrive.
+"""
+import asyncio
+import json
+import os
+import time
+from typing import AsyncIterator, Dict, Tuple
+import httpx
+import metrics
+
+PROVIDERS = {
+    "openai": "https://api.openai.com",
+    "letta": "https://api.letta.com",
+    "fish": "https://api.fish.audio",
+    # Photo downloads: any host, so no base URL (image_prep follows redirects itself, vetting each hop)
+    "fetch": None,
+}
+
+PROVIDER_MAX_CONNECTIONS = int(os.getenv("PROVIDER_MAX_CONNECTIONS", "20"))
+PROVIDER_KEEPALIVE_EXPIRY = float(os.getenv("PROVIDER_KEEPALIVE_EXPIRY", "120"))
+PROVIDER_WARM_CONNECTIONS = int(os.getenv("PROVIDER_WARM_CONNECTIONS", "2"))
+# HTTP/2 multiplexes concurrent calls over one connection; needs the optional `h2` package
+PROVIDER_HTTP2 = os.getenv("PROVIDER_HTTP2", "0") == "1"
+
+try:
+    import h2  # noqa: F401
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+# name -> (client, event loop it was created on); clients can't be shared across loops
+_clients: Dict[str, Tuple[httpx.AsyncClient, asyncio.AbstractEventLoop]] = {}
+
+
+def _http2() -> bool:
+    if PROVIDER_HTTP2 and not _HTTP2_AVAILABLE:
+        print("⚠️  PROVIDER_HTTP2=1 but the h2 package isn't installed - using HTTP/1.1")
+    return PROVIDER_HTTP2 and _HTTP2_AVAILABLE
+
+
+def client(name: str) -> httpx.AsyncClient:
+    """The shared client for provider `name` (created on first use in the running event loop)"""
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(name)
+    if entry is not None and entry[1] is loop and not entry[0].is_closed:
+        return entry[0]
+    base_url = PROVIDERS[name]
+    new_client = httpx.AsyncClient(
+        base_url=base_url or "",
+        http2=_http2(),
+        limits=httpx.Limits(
+            max_connections=PROVIDER_MAX_CONNECTIONS,
+            max_keepalive_connections=PROVIDER_MAX_CONNECTIONS,
+            keepalive_expiry=PROVIDER_KEEPALIVE_EXPIRY
+        ),
+        timeout=60.0
+    )
+    _clients[name] = (new_client, loop)
+    return new_client
+
+
+async def stream_events(name: str, path: str, timeout: float, **kwargs) -> AsyncIterator[Dict]:
+    """POST to a streaming (server-sent events) endpoint and yield each event's JSON payload until [DONE].
+
+    Raises httpx.HTTPStatusError for a non-2xx status before anything is yielded.
+    """
+    provider = f"{name}_stream"
+    started = time.perf_counter()
+    with metrics.PROVIDER_IN_FLIGHT.track(provider=provider):
+        async with client(name).stream("POST", path, timeout=timeout, **kwargs) as response:
+            # Latency here is time to the response headers; the stream itself can run much longer
+            metrics.PROVIDER_SECONDS.observe(time.perf_counter() - started, provider=provider)
+            if response.is_error:
+                metrics.PROVIDER_ERRORS.inc(provider=provider, reason=str(response.status_code))
+                await response.aread()
+                response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    return
+                if data:
+                    yield json.loads(data)
+
+
+async def warm_up(*names: str):
+    """Open PROVIDER_WARM_CONNECTIONS connections to each provider; failures are only logged.
+
+    Agents call this at startup so the first session doesn't pay the TLS handshakes.
+    """
+    async def touch(name):
+        try:
+            # Any response will do - the point is the handshake, which leaves a pooled connection behind
+            await client(name).head("/", timeout=10.0)
+        except httpx.HTTPError as e:
+            print(f"⚠️  Could not pre-connect to {name}: {e}")
+
+    await asyncio.gather(*(touch(name) for name in names for _ in range(PROVIDER_WARM_CONNECTIONS)))
+
+
+async def aclose():
+    for http_client, _ in list(_clients.values()):
+        await http_client.aclose()
+    _clients.clear()
@@ -0,0 +1,145 @@
+# resilience.py
+"""Deadlines, retries and hedged requests for the agents' provider calls (OpenAI, Letta, Fish Audio)"""
+import asyncio
+import os
+import random
+import time
+from typing import Awaitable, Callable, Optional
+import httpx
+import metrics
+import stats
+
+# Statuses worth another attempt; anything else is returned to the caller as-is
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed before the work could be done"""
+
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else deadline - time.time()
+
+
+def expired(deadline: Optional[float]) -> bool:
+    return deadline is not None and time.time() >= deadline
+
+
+def budget(deadline: Optional[float], timeout: float) -> float:
+    """Timeout for one call: `timeout`, capped by what is left of `deadline`"""
+    left = remaining(deadline)
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded("deadline exceeded")
+    return min(timeout, left)
+
+
+class RetryPolicy:
+    """How one provider is called: per-attempt timeout, attempts with jittered backoff, optional hedging"""
+
+    def __init__(self, attempts: int = 3, timeout: float = 60.0, base_delay: float = 0.5,
+                 max_delay: float = 4.0, hedge_after: Optional[float] = None):
+        self.attempts = attempts
+        self.timeout = timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # Send a duplicate request if the first hasn't answered after this many seconds (None disables)
+        self.hedge_after = hedge_after
+
+    @classmethod
+    def from_env(cls, name: str, **defaults) -> "RetryPolicy":
+        """Defaults overridable with <NAME>_ATTEMPTS, <NAME>_TIMEOUT, <NAME>_RETRY_DELAY and <NAME>_HEDGE_AFTER"""
+        policy = cls(**defaults)
+        policy.attempts = int(os.getenv(f"{name}_ATTEMPTS", policy.attempts))
+        policy.timeout = float(os.getenv(f"{name}_TIMEOUT", policy.timeout))
+        policy.base_delay = float(os.getenv(f"{name}_RETRY_DELAY", policy.base_delay))
+        hedge_after = os.getenv(f"{name}_HEDGE_AFTER")
+        if hedge_after is not None:
+            policy.hedge_after = float(hedge_after) or None
+        return policy
+
+    def backoff(self, attempt: int) -> float:
+        return min(self.max_delay, self.base_delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+
+# Letta agents keep conversation state, so they aren't hedged by default
+LETTA_POLICY = RetryPolicy.from_env("LETTA", attempts=3, timeout=60.0)
+
+
+def retry_delay(policy: RetryPolicy, attempt: int, deadline: Optional[float]) -> Optional[float]:
+    """Backoff before the attempt after `attempt`, or None when out of attempts or the delay would pass `deadline`"""
+    delay = policy.backoff(attempt)
+    left = remaining(deadline)
+    if attempt >= policy.attempts or (left is not None and delay >= left):
+        return None
+    return delay
+
+
+def _ok(task: asyncio.Task) -> bool:
+    return task.exception() is None and task.result().status_code not in RETRYABLE_STATUSES
+
+
+async def _hedged(name: str, send: Callable[[float], Awaitable[httpx.Response]], timeout: float,
+                  hedge_after: Optional[float]) -> httpx.Response:
+    """send(timeout), plus one duplicate if the first is still running after `hedge_after`; first good answer wins"""
+    if not hedge_after or hedge_after >= timeout:
+        return await send(timeout)
+    first = asyncio.ensure_future(send(timeout))
+    done, _ = await asyncio.wait({first}, timeout=hedge_after)
+    if done:
+        return first.result()
+
+    stats.incr(f"hedged_{name}")
+    pending = {first, asyncio.ensure_future(send(timeout - hedge_after))}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if _ok(task):
+                    if task is not first:
+                        stats.incr(f"hedge_wins_{name}")
+                    return task.result()
+                last = task
+        return last.result()  # both failed: surface the later error/response
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def call(name: str, send: Callable[[float], Awaitable[httpx.Response]], policy: RetryPolicy,
+               deadline: Optional[float] = None) -> httpx.Response:
+    """Run `send(timeout)` under `policy` without going past `deadline`.
+
+    Transport errors and RETRYABLE_STATUSES are retried; the final response is
+    returned whatever its status, so callers keep their own status handling.
+    """
+    async def measured(timeout: float) -> httpx.Response:
+        with metrics.PROVIDER_IN_FLIGHT.track(provider=name), metrics.PROVIDER_SECONDS.time(provider=name):
+            try:
+                response = await send(timeout)
+            except httpx.TransportError as e:
+                metrics.PROVIDER_ERRORS.inc(provider=name, reason=type(e).__name__)
+                raise
+        if response.is_error:
+            metrics.PROVIDER_ERRORS.inc(provider=name, reason=str(response.status_code))
+        return response
+
+    for attempt in range(1, policy.attempts + 1):
+        timeout = budget(deadline, policy.timeout)
+        try:
+            response = await _hedged(name, measured, timeout, policy.hedge_after)
+            if response.status_code not in RETRYABLE_STATUSES:
+                return response
+            error = None
+        except httpx.TransportError as e:
+            response, error = None, e
+
+        delay = retry_delay(policy, attempt, deadline)
+        if delay is None:
+            if error is not None:
+                raise error
+            return response
+        stats.incr(f"retries_{name}")
+        print(f"🔁 {name}: attempt {attempt} failed ({error or response.status_code}), retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
@@ -0,0 +1,97 @@
+# result_cache.py
+"""Whole-pipeline result cache: image content hash + pipeline config -> final experience response"""
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Optional
+from state_db import ensure_schema, BASE_DIR
+import stats
+
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", str(7 * 24 * 3600)))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "500"))
+AUDIO_DIR = os.path.join(BASE_DIR, "storage", "audio")
+
+# Bump PIPELINE_VERSION whenever prompts, models or mixing change the output for the same photo
+PIPELINE_VERSION = os.getenv("PIPELINE_VERSION", "1")
+_CONFIG_ENV = ["PERCEPTION_MODE", "PERCEPTION_AGENT_ID", "EMOTION_AGENT_ID", "NARRATION_AGENT_ID", "FISH_AUDIO_REFERENCE_ID"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS result_cache (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    final_audio_url TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS result_cache_lru_idx ON result_cache (last_access);
+"""
+
+
+def _db():
+    return ensure_schema("result_cache", _SCHEMA)
+
+
+def pipeline_fingerprint() -> str:
+    """PIPELINE_VERSION plus the agent/voice config that shapes the output"""
+    parts = [PIPELINE_VERSION] + [os.getenv(name, "") for name in _CONFIG_ENV]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()[:16]
+
+
+def cache_key(image_bytes: bytes) -> str:
+    return f"{hashlib.sha256(image_bytes).hexdigest()}:{pipeline_fingerprint()}"
+
+
+def _audio_exists(url: str) -> bool:
+    return os.path.exists(os.path.join(AUDIO_DIR, os.path.basename(url)))
+
+
+def get(key: str) -> Optional[Dict]:
+    """Cached response for `key`, or None if missing, expired or its audio file is gone"""
+    conn = _db()
+    now = time.time()
+    row = conn.execute("SELECT response, final_audio_url, created_at FROM result_cache WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        stats.incr("result_cache_misses")
+        return None
+    if now - row["created_at"] > RESULT_CACHE_TTL or not _audio_exists(row["final_audio_url"]):
+        conn.execute("DELETE FROM result_cache WHERE key = ?", (key,))
+        stats.incr("result_cache_evictions")
+        stats.incr("result_cache_misses")
+        return None
+    conn.execute("UPDATE result_cache SET last_access = ? WHERE key = ?", (now, key))
+    stats.incr("result_cache_hits")
+    return json.loads(row["response"])
+
+
+def put(key: str, response: Dict):
+    """Store a finished response, then drop expired entries and the least recently used overflow"""
+    conn = _db()
+    now = time.time()
+    conn.execute(
+        "INSERT OR REPLACE INTO result_cache (key, response, final_audio_url, created_at, last_access) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (key, json.dumps(response), response["final_audio_url"], now, now)
+    )
+    evicted = conn.execute("DELETE FROM result_cache WHERE created_at < ?", (now - RESULT_CACHE_TTL,)).rowcount
+    evicted += conn.execute(
+        "DELETE FROM result_cache WHERE key IN ("
+        "SELECT key FROM result_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+        (RESULT_CACHE_MAX_ENTRIES,)
+    ).rowcount
+    if evicted:
+        stats.incr("result_cache_evictions", evicted)
+
+
+def summary() -> Dict:
+    counters = stats.counters("result_cache_")
+    hits = counters.get("result_cache_hits", 0)
+    misses = counters.get("result_cache_misses", 0)
+    return {
+        "entries": _db().execute("SELECT COUNT(*) FROM result_cache").fetchone()[0],
+        "max_entries": RESULT_CACHE_MAX_ENTRIES,
+        "hits": hits,
+        "misses": misses,
+        "evictions": counters.get("result_cache_evictions", 0),
+        "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None
+    }
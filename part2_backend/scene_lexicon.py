@@ -0,0 +1,233 @@
+# scene_lexicon.py
+"""Local scene classifier: turns a GPT-4o scene description into PerceptionData fields without calling Letta.
+
+Every keyword and phrase in the lexicon below is compiled once into an
+Aho-Corasick automaton, so classify() reads the description in a single pass
+whatever the lexicon size. A match counts only as a whole word, optionally
+with a plural "s"/"es": "wave" covers "waves", but "man" doesn't fire inside
+"woman" or "many". People mentioned after a negator ("no people", "empty of
+people") are not counted.
+"""
+import re
+from collections import Counter
+from typing import Dict, Iterator, List, Tuple
+
+# Trigger terms -> object labels reported for them
+OBJECTS = [
+    (("wave", "ocean", "water", "sea", "surf"), ["waves", "ocean", "water"]),
+    (("sand", "beach", "shore"), ["sand", "beach"]),
+    (("cloud", "cloudy", "sky"), ["clouds", "sky"]),
+    (("palm", "tree"), ["palm trees", "trees"]),
+    (("sun", "sunlight", "sunset", "sunrise"), ["sun"]),
+    (("mountain", "peak", "summit"), ["mountains", "peaks"]),
+    (("building", "city", "skyscraper"), ["buildings", "city"]),
+    (("car", "vehicle", "bus", "taxi"), ["cars", "vehicles"]),
+    (("boat", "sailboat", "ship"), ["boats"]),
+    (("bird", "seagull", "gull"), ["birds"]),
+    (("dog", "puppy"), ["dog"]),
+    (("flower", "garden"), ["flowers"]),
+    (("grass", "field", "meadow"), ["grass"]),
+    (("river", "stream", "lake", "waterfall"), ["water"]),
+    (("snow",), ["snow"]),
+    (("table", "chair", "bench"), ["furniture"]),
+    (("cup", "coffee", "mug"), ["coffee cups"]),
+    (("lamp", "candle", "light fixture"), ["lamps"]),
+]
+
+# (scene_type, setting, ambient_sounds, triggers); ties in match count go to the earlier scene
+SCENES = [
+    ("outdoor_beach", "tropical beach at sunset", ["waves", "seagulls", "wind"], ("beach", "ocean", "wave", "shore", "surf", "seaside")),
+    ("outdoor_mountain", "mountain landscape", ["wind", "birds"], ("mountain", "peak", "summit", "alpine", "cliff")),
+    ("urban_city", "urban cityscape", ["traffic", "people"], ("city", "urban", "building", "street", "skyscraper", "downtown")),
+    ("outdoor_forest", "peaceful forest", ["birds", "wind", "leaves"], ("forest", "tree", "woods", "woodland")),
+    ("indoor_cafe", "cozy cafe", ["cafe chatter", "clinking cups"], ("cafe", "café", "coffee shop", "restaurant", "bar counter")),
+    ("indoor_home", "quiet room at home", ["clock ticking", "soft room tone"], ("living room", "bedroom", "kitchen", "sofa", "couch")),
+]
+DEFAULT_SCENE = ("outdoor_nature", "natural outdoor scene", ["nature sounds"])
+
+COLORS = ["blue", "green", "yellow", "orange", "red", "purple", "pink", "white", "black", "brown", "gold", "silver"]
+
+# First lighting (in this order) with any trigger wins
+LIGHTING = [
+    ("warm golden hour", ("sunset", "sunrise", "golden hour", "sun")),
+    ("nighttime", ("night", "nighttime", "dark", "darkness", "moonlight")),
+    ("diffuse natural light", ("cloud", "cloudy", "overcast", "fog", "foggy", "mist", "misty")),
+    ("soft indoor light", ("lamp", "candle", "indoor")),
+]
+DEFAULT_LIGHTING = "natural daylight"
+
+# Nouns for people -> how many a bare mention counts as
+PEOPLE = {"person": 1, "people": 1, "man": 1, "men": 1, "woman": 1, "women": 1, "child": 1, "children": 1,
+          "boy": 1, "girl": 1, "kid": 1, "couple": 2, "family": 3}
+NUMBERS = {str(n): n for n in range(1, 21)}
+NUMBERS.update({"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+                "nine": 9, "ten": 10, "a pair of": 2, "several": 3, "a group of": 4})
+# A number attaches to a people noun starting at most this many characters after it ("two young women")
+NUMBER_REACH = 16
+# A people noun right after one of these (only filler words in between) is not there: "no people", "without any other people"
+NEGATORS = ("no", "not", "without", "nobody", "none", "empty of", "devoid of", "free of", "absence of")
+_NEGATION_GAP = re.compile(r"(?:\s+(?:any|other|more|single|sign|signs|trace|traces|of|visible|human|humans|living|a))*\s+$")
+
+MAX_OBJECTS = 8
+MAX_COLORS = 5
+MAX_PEOPLE_DETAILS = 3
+
+
+class AhoCorasick:
+    """Multi-pattern matcher: finds every (start, end, value) for the added patterns in one scan"""
+
+    def __init__(self):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[List[Tuple[int, object]]] = [[]]
+
+    def add(self, pattern: str, value):
+        node = 0
+        for char in pattern:
+            nxt = self.goto[node].get(char)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][char] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            node = nxt
+        self.out[node].append((len(pattern), value))
+
+    def build(self):
+        """Compute failure links breadth-first; call after the last add()"""
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and char not in self.goto[state]:
+                    state = self.fail[state]
+                target = self.goto[state].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+    def scan(self, text: str) -> Iterator[Tuple[int, int, object]]:
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for length, value in out[node]:
+                start = index - length + 1
+                if (start == 0 or not text[start - 1].isalnum()) and _word_ends(text, index + 1):
+                    yield start, index + 1, value
+
+
+def _word_ends(text: str, end: int) -> bool:
+    for suffix in ("", "s", "es"):
+        after = end + len(suffix)
+        if text.startswith(suffix, end) and (after >= len(text) or not text[after].isalnum()):
+            return True
+    return False
+
+
+def _compile() -> AhoCorasick:
+    matcher = AhoCorasick()
+    for number, (triggers, _) in enumerate(OBJECTS):
+        for term in triggers:
+            matcher.add(term, ("object", number))
+    for number, scene in enumerate(SCENES):
+        for term in scene[3]:
+            matcher.add(term, ("scene", number))
+    for color in COLORS:
+        matcher.add(color, ("color", color))
+    for number, (_, triggers) in enumerate(LIGHTING):
+        for term in triggers:
+            matcher.add(term, ("lighting", number))
+    for noun, count in PEOPLE.items():
+        matcher.add(noun, ("people", count))
+    for word, count in NUMBERS.items():
+        matcher.add(word, ("number", count))
+    for word in NEGATORS:
+        matcher.add(word, ("negation", None))
+    matcher.build()
+    return matcher
+
+
+_MATCHER = _compile()
+
+
+def classify(text: str) -> Dict:
+    """PerceptionData fields (without session_id) inferred from a free-text scene description"""
+    object_hits = []
+    scene_hits = Counter()
+    colors = []
+    lighting = None
+    people_count = 0
+    # Without any counted mention, the largest bare one ("a couple" -> 2); bare nouns often repeat earlier people
+    people_bare = 0
+    last_number = None  # (end offset, value)
+    last_negation = None  # end offset
+
+    text = text.lower()
+    for start, end, (kind, value) in _MATCHER.scan(text):
+        if kind == "object":
+            if value not in object_hits:
+                object_hits.append(value)
+        elif kind == "scene":
+            scene_hits[value] += 1
+        elif kind == "color":
+            if value not in colors:
+                colors.append(value)
+        elif kind == "lighting":
+            lighting = value if lighting is None else min(lighting, value)
+        elif kind == "number":
+            last_number = (end, value)
+        elif kind == "negation":
+            last_negation = end
+        elif kind == "people":
+            if last_negation is not None and _NEGATION_GAP.match(text, last_negation, start):
+                last_number = None
+                continue
+            people_bare = max(people_bare, value)
+            if last_number and start - last_number[0] <= NUMBER_REACH:
+                people_count += last_number[1]
+                last_number = None
+
+    if not people_count:
+        people_count = people_bare
+
+    objects = []
+    for number in object_hits:
+        for label in OBJECTS[number][1]:
+            if label not in objects:
+                objects.append(label)
+
+    if scene_hits:
+        best = max(scene_hits, key=lambda number: (scene_hits[number], -number))
+        scene_type, setting, ambient_sounds, _ = SCENES[best]
+    else:
+        scene_type, setting, ambient_sounds = DEFAULT_SCENE
+
+    people_details = []
+    for i in range(min(people_count, MAX_PEOPLE_DETAILS)):
+        people_details.append({
+            "position": ("center", "left", "right")[i],
+            "description": f"person {i + 1}",
+            "apparent_age": "adult",
+            "apparent_mood": "neutral"
+        })
+
+    where, _, kind = scene_type.partition("_")
+    return {
+        "objects": objects[:MAX_OBJECTS],
+        "people_count": people_count,
+        "people_details": people_details,
+        "layout": {
+            "foreground": " | ".join(objects[:3]),
+            "center": f"main {kind} scene",
+            "background": f"distant {where} elements"
+        },
+        "scene_type": scene_type,
+        "setting": setting,
+        "colors": colors[:MAX_COLORS],
+        "lighting": LIGHTING[lighting][0] if lighting is not None else DEFAULT_LIGHTING,
+        "ambient_sounds": list(ambient_sounds)
+    }
@@ -0,0 +1,133 @@
+# session_store.py
+"""Coordinator's per-session pipeline state, bounded by TTL and max size"""
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+SESSION_TTL = float(os.getenv("SESSION_TTL", "600"))
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "1000"))
+
+STAGE_FIELDS = ("perception", "emotion", "ambient", "narration_lead", "narration", "narrator_voice", "dialogue_voice", "mix")
+
+
+class SessionState:
+    """One session's stage outputs; slots keep the record small and attribute lookups direct"""
+
+    __slots__ = ("session_id", "photo_url", "cache_key", "stage", "created_at", "updated_at", "approx_bytes",
+                 "deadline", "timings", "attempts", "refs", "sizes") + STAGE_FIELDS
+
+    def __init__(self, session_id: str, photo_url: str = "", cache_key: Optional[str] = None,
+                 deadline: Optional[float] = None):
+        now = time.time()
+        self.session_id = session_id
+        self.photo_url = photo_url
+        self.cache_key = cache_key
+        self.stage = "created"
+        self.created_at = now
+        self.updated_at = now
+        self.approx_bytes = len(session_id) + len(photo_url)
+        # Epoch seconds by which the whole session must finish (None: no limit)
+        self.deadline = deadline
+        # {stage: [started_at, finished_at]} and {stage: [attempt, attempt_started_at]}, maintained by pipeline.Pipeline
+        self.timings = {}
+        self.attempts = {}
+        # {stage: blob_store digest} for outputs that later stages receive by reference
+        self.refs = {}
+        # {stage: serialized size of its output}, counted into approx_bytes
+        self.sizes = {}
+        for field in STAGE_FIELDS:
+            setattr(self, field, None)
+
+
+class SessionStore:
+    """Sessions ordered by last update; stale ones expire after `ttl`, the oldest go first past `max_sessions`"""
+
+    def __init__(self, ttl: float = SESSION_TTL, max_sessions: int = MAX_SESSIONS,
+                 on_evict: Optional[Callable[[SessionState, str], None]] = None):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.on_evict = on_evict
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._bytes = 0
+        self.evicted = {"ttl": 0, "capacity": 0, "replaced": 0}
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str):
+        return session_id in self._sessions
+
+    def create(self, session_id: str, photo_url: str = "", cache_key: Optional[str] = None,
+               deadline: Optional[float] = None) -> SessionState:
+        if session_id in self._sessions:
+            # A redelivered job restarting its session
+            self._evict(session_id, "replaced")
+        state = SessionState(session_id, photo_url, cache_key, deadline)
+        self._sessions[session_id] = state
+        self._bytes += state.approx_bytes
+        while len(self._sessions) > self.max_sessions:
+            self._evict(next(iter(self._sessions)), "capacity")
+        return state
+
+    def get(self, session_id: str) -> Optional[SessionState]:
+        return self._sessions.get(session_id)
+
+    def values(self) -> List[SessionState]:
+        return list(self._sessions.values())
+
+    def record(self, session_id: str, stage: str, msg, size: Optional[int] = None) -> Optional[SessionState]:
+        """Store a stage output; returns None if the session is unknown (finished or evicted).
+
+        Pass `size` when the output was already serialized (e.g. by blob_store.put) to skip measuring it again.
+        """
+        state = self._sessions.get(session_id)
+        if state is None:
+            return None
+        if size is None:
+            size = len(msg.json()) if hasattr(msg, "json") else 0
+        previous_size = state.sizes.get(stage, 0)
+        state.sizes[stage] = size
+        size -= previous_size
+        setattr(state, stage, msg)
+        state.stage = stage
+        state.updated_at = time.time()
+        state.approx_bytes += size
+        self._bytes += size
+        self._sessions.move_to_end(session_id)
+        return state
+
+    def pop(self, session_id: str) -> Optional[SessionState]:
+        state = self._sessions.pop(session_id, None)
+        if state is not None:
+            self._bytes -= state.approx_bytes
+        return state
+
+    def _evict(self, session_id: str, reason: str):
+        state = self.pop(session_id)
+        self.evicted[reason] += 1
+        if state is not None and self.on_evict is not None:
+            self.on_evict(state, reason)
+
+    def evict_expired(self) -> List[str]:
+        """Drop sessions with no stage update for `ttl` seconds; returns their ids"""
+        cutoff = time.time() - self.ttl
+        expired = []
+        for session_id, state in self._sessions.items():
+            if state.updated_at > cutoff:
+                break  # ordered by last update, so the rest are newer
+            expired.append(session_id)
+        for session_id in expired:
+            self._evict(session_id, "ttl")
+        return expired
+
+    def stats(self) -> Dict:
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl_s": self.ttl,
+            "approx_bytes": self._bytes,
+            "evicted_ttl": self.evicted["ttl"],
+            "evicted_capacity": self.evicted["capacity"],
+            "evicted_replaced": self.evicted["replaced"]
+        }
@@ -0,0 +1,59 @@
+# state_db.py
+"""Shared SQLite state for the gateway and the agent bureau (WAL mode, one connection per thread)."""
+import os
+import sqlite3
+import threading
+from typing import Callable, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.getenv("STATE_DB_PATH", os.path.join(BASE_DIR, "storage", "state.db"))
+
+_local = threading.local()
+# Names of the schemas ensure_schema() has already set up in this process
+_schemas = set()
+_schemas_lock = threading.Lock()
+
+
+def connect() -> sqlite3.Connection:
+    """Return this thread's connection, opening it (and enabling WAL) on first use"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+        # isolation_level=None -> autocommit; writers that need atomicity use BEGIN IMMEDIATE
+        conn = sqlite3.connect(DB_PATH, timeout=10.0, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=10000")
+        _local.conn = conn
+    return conn
+
+
+def ensure_schema(name: str, ddl: str,
+                  migrate: Optional[Callable[[sqlite3.Connection], None]] = None) -> sqlite3.Connection:
+    """This thread's connection, after running `ddl` (then `migrate`) once per process for schema `name`.
+
+    The DDL must be idempotent (CREATE ... IF NOT EXISTS): every process runs it on first use.
+    """
+    conn = connect()
+    if name not in _schemas:
+        with _schemas_lock:
+            if name not in _schemas:
+                conn.executescript(ddl)
+                if migrate is not None:
+                    migrate(conn)
+                _schemas.add(name)
+    return conn
+
+
+def add_missing_columns(conn: sqlite3.Connection, table: str, columns: dict):
+    """Add columns that databases created by older code don't have yet ({name: sql_type})"""
+    existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, sql_type in columns.items():
+        if name not in existing:
+            try:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}")
+            except sqlite3.OperationalError as e:
+                # Another process (e.g. a second gateway worker) added it first
+                if "duplicate column" not in str(e):
+                    raise
@@ -0,0 +1,28 @@
+# stats.py
+"""Named counters in the shared state DB, so every gateway worker and the bureau add to the same totals"""
+from typing import Dict
+from state_db import ensure_schema
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def _db():
+    return ensure_schema("stats", _SCHEMA)
+
+
+def incr(name: str, n: int = 1):
+    _db().execute(
+        "INSERT INTO counters (name, value) VALUES (?, ?) "
+        "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+        (name, n)
+    )
+
+
+def counters(prefix: str = "") -> Dict[str, int]:
+    rows = _db().execute("SELECT name, value FROM counters WHERE name LIKE ? ORDER BY name", (prefix + "%",))
+    return {row["name"]: row["value"] for row in rows}
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Test script for Range parsing and ETags in the audio file responses (audio_http)
+Usage: python3 test_audio_http.py   (or: python3 -m pytest test_audio_http.py)
+"""
+import sys
+import os
+import tempfile
+
+# Add the project root to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from audio_http import _etag, _parse_range
+
+SIZE = 1000
+
+
+def _unsatisfiable(header):
+    try:
+        _parse_range(header, SIZE)
+    except ValueError:
+        return True
+    return False
+
+
+def test_explicit_and_open_ranges():
+    assert _parse_range("bytes=0-499", SIZE) == (0, 499)
+    assert _parse_range("bytes=500-", SIZE) == (500, 999)
+    # An end past the file is clamped to its last byte
+    assert _parse_range("bytes=900-5000", SIZE) == (900, 999)
+
+
+def test_suffix_ranges():
+    assert _parse_range("bytes=-100", SIZE) == (900, 999)
+    assert _parse_range("bytes=-5000", SIZE) == (0, 999)
+
+
+def test_unsupported_headers_serve_the_whole_file():
+    for header in ("", "items=0-10", "bytes=0-10,20-30", "bytes=abc-"):
+        assert _parse_range(header, SIZE) is None, header
+
+
+def test_unsatisfiable_ranges_raise():
+    for header in ("bytes=1000-", "bytes=500-100", "bytes=-0", "bytes=5-x"):
+        assert _unsatisfiable(header), header
+
+
+def test_etag_of_unhashed_files_follows_size_and_mtime():
+    with tempfile.NamedTemporaryFile() as f:
+        f.write(b"a" * 10)
+        f.flush()
+        first = _etag("mix.mp3", os.stat(f.name))
+        assert first == _etag("mix.mp3", os.stat(f.name))
+        f.write(b"b")
+        f.flush()
+        assert _etag("mix.mp3", os.stat(f.name)) != first
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Test script for the content-addressed stage payload store (blob_store)
+Usage: python3 test_blob_store.py   (or: python3 -m pytest test_blob_store.py)
+"""
+import sys
+import os
+import tempfile
+
+# Add the project root to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Blobs live in the state DB, which is found through STATE_DB_PATH at import
+os.environ["STATE_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="blob_store_test_"), "state.db")
+
+import blob_store
+
+PERCEPTION = {"scene_type": "outdoor_beach", "objects": ["waves", "gulls"], "people_count": 2}
+
+
+def test_put_then_get_round_trips_through_the_db():
+    digest, size = blob_store.put(PERCEPTION)
+    assert size > 0
+    assert blob_store.get(digest) == PERCEPTION
+    # Another process starts with an empty cache and reads the row
+    blob_store._cache.clear()
+    assert blob_store.get(digest) == PERCEPTION
+
+
+def test_same_content_has_the_same_digest():
+    reordered = {key: PERCEPTION[key] for key in reversed(list(PERCEPTION))}
+    assert blob_store.put(reordered) == blob_store.put(PERCEPTION)
+    assert blob_store.put(dict(PERCEPTION, people_count=3))[0] != blob_store.put(PERCEPTION)[0]
+
+
+def test_unknown_digest_raises():
+    try:
+        blob_store.get("0" * 64)
+    except KeyError:
+        return
+    raise AssertionError("expected KeyError")
+
+
+def test_resolve_prefers_the_inline_payload():
+    digest, _ = blob_store.put(PERCEPTION)
+    inline = {"scene_type": "indoor_kitchen"}
+    assert blob_store.resolve(inline, digest) is inline
+    assert blob_store.resolve(None, digest) == PERCEPTION
+    try:
+        blob_store.resolve(None, None)
+    except ValueError:
+        return
+    raise AssertionError("expected ValueError")
+
+
+def test_prune_drops_old_blobs_only():
+    old, _ = blob_store.put({"stage": "old"})
+    blob_store._db().execute("UPDATE blobs SET stored_at = stored_at - 100 WHERE digest = ?", (old,))
+    fresh, _ = blob_store.put({"stage": "fresh"})
+    assert blob_store.prune(older_than=50) == 1
+    blob_store._cache.clear()
+    assert blob_store.get(fresh) == {"stage": "fresh"}
+    try:
+        blob_store.get(old)
+    except KeyError:
+        return
+    raise AssertionError("pruned blob is still stored")
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Test script for how the coordinator handles stage replies (first reply wins, late duplicates are dropped)
+Usage: python3 test_coordinator_replies.py   (or: python3 -m pytest test_coordinator_replies.py)
+"""
+import sys
+import os
+import asyncio
+import logging
+import tempfile
+
+# Add the project root and the agents to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "agents"))
+
+# state_db and notify read these at import, so point them at a scratch directory first
+_scratch = tempfile.mkdtemp(prefix="coordinator_test_")
+os.environ["STATE_DB_PATH"] = os.path.join(_scratch, "state.db")
+os.environ["NOTIFY_DIR"] = os.path.join(_scratch, "notify")
+
+import coordinator_agent as coordinator
+import job_events
+from fetch_models import PerceptionData, EmotionData, NarrationLead, NarrationData
+
+
+class FakeContext:
+    """Records what the coordinator sends instead of delivering it"""
+
+    def __init__(self):
+        self.logger = logging.getLogger("test_coordinator_replies")
+        self.sent = []
+
+    async def send(self, address, msg):
+        self.sent.append(msg)
+
+
+def _perception(session_id, setting):
+    return PerceptionData(
+        session_id=session_id, objects=["waves"], people_count=0, people_details=[], layout={},
+        scene_type="outdoor_beach", setting=setting, colors=["blue"], lighting="natural daylight",
+        ambient_sounds=["waves"]
+    )
+
+
+def _emotion(session_id):
+    return EmotionData(
+        session_id=session_id, mood="calm", emotion_tags=["peaceful"], tone="gentle", intensity="low",
+        voice_characteristics={}, ambient_mood="soft"
+    )
+
+
+def _finished_events(session_id, stage):
+    return [e for e in job_events.since(session_id) if e["stage"] == stage and e["event"] == "stage_finished"]
+
+
+async def _start(session_id):
+    ctx = FakeContext()
+    state = coordinator.sessions.create(session_id, "https://example.com/beach.jpg")
+    await coordinator.pipeline.advance(ctx, state)
+    return ctx, state
+
+
+def test_late_duplicate_reply_is_ignored():
+    async def scenario():
+        ctx, state = await _start("dup_perception")
+        first = _perception("dup_perception", "first attempt")
+        await coordinator.stage_done(ctx, "perception", first)
+        ref, sent = state.refs["perception"], len(ctx.sent)
+
+        # The retried attempt answers too, after the first reply already moved the session on
+        await coordinator.stage_done(ctx, "perception", _perception("dup_perception", "second attempt"))
+        assert state.perception is first
+        assert state.refs["perception"] == ref
+        assert len(ctx.sent) == sent
+        assert len(_finished_events("dup_perception", "perception")) == 1
+        coordinator.pipeline.cancel(coordinator.sessions.pop("dup_perception"))
+    asyncio.run(scenario())
+
+
+def test_retried_narration_keeps_the_voiced_lead():
+    async def scenario():
+        ctx, state = await _start("dup_narration")
+        await coordinator.stage_done(ctx, "perception", _perception("dup_narration", "beach"))
+        await coordinator.stage_done(ctx, "emotion", _emotion("dup_narration"))
+        await coordinator.handle_narration_lead(ctx, "narration", NarrationLead(
+            session_id="dup_narration", main_narration="The tide rolls in."))
+
+        # Attempt 1 stalls after its lead; attempt 2 streams a different narration
+        await coordinator.handle_narration_lead(ctx, "narration", NarrationLead(
+            session_id="dup_narration", main_narration="Gulls circle overhead."))
+        await coordinator.handle_narration_response(ctx, "narration", NarrationData(
+            session_id="dup_narration", main_narration="Gulls circle overhead.",
+            person_dialogues=[], ambient_descriptions=[]))
+        assert state.narration_lead.main_narration == "The tide rolls in."
+        assert state.narration.main_narration == "The tide rolls in."
+        assert len(_finished_events("dup_narration", "narration_lead")) == 1
+        coordinator.pipeline.cancel(coordinator.sessions.pop("dup_narration"))
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Test script for the scene-keyed emotion cache (emotion_cache fingerprints, get and put)
+Usage: python3 test_emotion_cache.py   (or: python3 -m pytest test_emotion_cache.py)
+"""
+import sys
+import os
+import tempfile
+
+# Add the project root to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# The persistent cache lives in the state DB, which is found through STATE_DB_PATH at import
+os.environ["STATE_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="emotion_cache_test_"), "state.db")
+
+import emotion_cache
+
+PERCEPTION = {
+    "session_id": "session_a",
+    "objects": ["waves", "beach umbrella", "gulls"],
+    "people_count": 2,
+    "people_details": [{"position": "left", "action": "walking"}, {"position": "right", "action": "sitting"}],
+    "scene_type": "outdoor_beach",
+    "lighting": "natural daylight",
+}
+EMOTION = {"mood": "calm", "emotion_tags": ["peaceful"], "tone": "gentle", "intensity": "low"}
+
+
+def test_fingerprint_ignores_ordering_casing_whitespace_and_session():
+    reshuffled = {
+        "lighting": "  Natural\tDaylight ",
+        "scene_type": "OUTDOOR_BEACH",
+        "people_details": [{"action": "sitting", "position": "right"}, {"position": "Left", "action": "walking"}],
+        "people_count": 2,
+        "objects": ["gulls", "Waves", "beach  umbrella"],
+        "session_id": "session_b",
+    }
+    assert emotion_cache.fingerprint(reshuffled) == emotion_cache.fingerprint(PERCEPTION)
+
+
+def test_fingerprint_changes_with_the_scene():
+    assert emotion_cache.fingerprint(dict(PERCEPTION, people_count=3)) != emotion_cache.fingerprint(PERCEPTION)
+    assert emotion_cache.fingerprint(dict(PERCEPTION, objects=["waves"])) != emotion_cache.fingerprint(PERCEPTION)
+
+
+def test_put_then_get_survives_a_restart():
+    key = emotion_cache.fingerprint(PERCEPTION)
+    assert emotion_cache.get(key) is None
+    emotion_cache.put(key, EMOTION)
+    assert emotion_cache.get(key) == EMOTION
+    # A fresh process has an empty LRU and reads the shared DB
+    emotion_cache._memory.clear()
+    assert emotion_cache.get(key) == EMOTION
+
+
+def test_expired_entries_are_misses():
+    key = emotion_cache.fingerprint(dict(PERCEPTION, scene_type="indoor_kitchen"))
+    emotion_cache.put(key, EMOTION)
+    ttl = emotion_cache.EMOTION_CACHE_TTL
+    emotion_cache.EMOTION_CACHE_TTL = -1
+    try:
+        assert emotion_cache.get(key) is None
+    finally:
+        emotion_cache.EMOTION_CACHE_TTL = ttl
+    # The expired row was deleted, not just skipped
+    emotion_cache._memory.clear()
+    assert emotion_cache.get(key) is None
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Test script for photo downloads (image_prep.fetch): SSRF vetting, redirects and the short-lived download memo
+Usage: python3 test_image_prep.py   (or: python3 -m pytest test_image_prep.py)
+"""
+import sys
+import os
+import asyncio
+
+# Add the project root to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+import image_prep
+import providers
+
+PUBLIC_IP = "93.184.216.34"
+OTHER_PUBLIC_IP = "151.101.1.69"
+
+
+def _serve(handler):
+    """Run fetches through `handler` (a request -> response function) instead of the network"""
+    requests = []
+
+    def record(request):
+        requests.append(request)
+        return handler(request)
+
+    providers._clients["fetch"] = (httpx.AsyncClient(transport=httpx.MockTransport(record)),
+                                   asyncio.get_running_loop())
+    return requests
+
+
+def test_download_is_reused_only_within_the_ttl():
+    async def scenario():
+        url = f"http://{PUBLIC_IP}/memo.jpg"
+        versions = iter([b"first", b"second"])
+        requests = _serve(lambda request: httpx.Response(200, content=next(versions)))
+        assert await image_prep.fetch(url) == b"first"
+        assert await image_prep.fetch(url) == b"first"
+        assert len(requests) == 1
+
+        ttl = image_prep.IMAGE_CACHE_TTL
+        image_prep.IMAGE_CACHE_TTL = 0
+        try:
+            # The photo behind the URL changed; a later session must hash the new bytes
+            assert await image_prep.fetch(url) == b"second"
+        finally:
+            image_prep.IMAGE_CACHE_TTL = ttl
+        assert len(requests) == 2
+    asyncio.run(scenario())
+
+
+def _rejects(url):
+    async def check():
+        try:
+            await image_prep._check_url(url)
+        except image_prep.UnsafeURL:
+            return True
+        return False
+    return asyncio.run(check())
+
+
+def test_private_loopback_and_link_local_hosts_are_rejected():
+    for url in ("http://127.0.0.1/a.jpg", "http://localhost:8000/a.jpg", "http://10.0.0.5/a.jpg",
+                "http://192.168.1.10/a.jpg", "http://169.254.169.254/latest/meta-data/", "http://[::1]/a.jpg",
+                "http://[::ffff:127.0.0.1]/a.jpg", "http://0.0.0.0/a.jpg", "file:///etc/passwd",
+                "ftp://example.com/a.jpg"):
+        assert _rejects(url), url
+    assert not _rejects(f"https://{PUBLIC_IP}/a.jpg")
+
+
+def test_every_redirect_hop_is_vetted():
+    async def scenario():
+        def handler(request):
+            if request.url.path == "/start.jpg":
+                return httpx.Response(302, headers={"Location": f"http://{OTHER_PUBLIC_IP}/moved.jpg"})
+            if request.url.path == "/moved.jpg":
+                return httpx.Response(301, headers={"Location": "http://169.254.169.254/latest/meta-data/"})
+            return httpx.Response(200, content=b"secret")
+        requests = _serve(handler)
+        try:
+            await image_prep.fetch(f"http://{PUBLIC_IP}/start.jpg")
+        except image_prep.UnsafeURL:
+            pass
+        else:
+            raise AssertionError("followed a redirect to the metadata service")
+        assert [str(r.url) for r in requests] == [f"http://{PUBLIC_IP}/start.jpg", f"http://{OTHER_PUBLIC_IP}/moved.jpg"]
+    asyncio.run(scenario())
+
+
+def test_redirect_without_location_is_rejected():
+    async def scenario():
+        _serve(lambda request: httpx.Response(302))
+        try:
+            await image_prep.fetch(f"http://{PUBLIC_IP}/no-location.jpg")
+        except ValueError as e:
+            assert "Location" in str(e)
+            return
+        raise AssertionError("expected ValueError")
+    asyncio.run(scenario())
+
+
+def test_connection_goes_to_the_vetted_address():
+    async def scenario():
+        # A rebinding DNS server: public for the check, loopback for any later lookup
+        answers = iter([[PUBLIC_IP], ["127.0.0.1"]])
+
+        async def resolve(host, port):
+            return next(answers)
+
+        requests = _serve(lambda request: httpx.Response(200, content=b"photo"))
+        resolve_before, image_prep._resolve = image_prep._resolve, resolve
+        try:
+            assert await image_prep.fetch("https://photos.example.com/rebind.jpg") == b"photo"
+        finally:
+            image_prep._resolve = resolve_before
+        request = requests[0]
+        assert request.url.host == PUBLIC_IP
+        assert request.headers["host"] == "photos.example.com"
+        assert request.extensions["sni_hostname"] == "photos.example.com"
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
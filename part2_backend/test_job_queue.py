@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Test script for the durable job queue (job_queue) against a throwaway state DB
+Usage: python3 test_job_queue.py   (or: python3 -m pytest test_job_queue.py)
+"""
+import sys
+import os
+import tempfile
+
+# Add the project root to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# state_db and notify read these at import, so point them at a scratch directory first
+_scratch = tempfile.mkdtemp(prefix="job_queue_test_")
+os.environ["STATE_DB_PATH"] = os.path.join(_scratch, "state.db")
+os.environ["NOTIFY_DIR"] = os.path.join(_scratch, "notify")
+
+import job_queue
+
+
+def _reset():
+    conn = job_queue._db()
+    conn.execute("DELETE FROM jobs")
+    conn.execute("DELETE FROM batches")
+
+
+def test_claim_is_fifo_and_exclusive():
+    _reset()
+    for session_id in ("a", "b", "c"):
+        job_queue.enqueue(session_id, f"https://example.com/{session_id}.jpg")
+    first = job_queue.claim(limit=2)
+    assert [job["session_id"] for job in first] == ["a", "b"]
+    second = job_queue.claim(limit=2)
+    assert [job["session_id"] for job in second] == ["c"]
+    assert job_queue.claim() == []
+    assert job_queue.depth() == {"queued": 0, "processing": 3}
+
+
+def test_unacked_job_is_redelivered_after_visibility_timeout():
+    _reset()
+    job_queue.enqueue("a", "https://example.com/a.jpg")
+    assert [job["session_id"] for job in job_queue.claim(visibility_timeout=0)] == ["a"]
+    redelivered = job_queue.claim(visibility_timeout=60)
+    assert [job["session_id"] for job in redelivered] == ["a"]
+    assert job_queue.get("a")["attempts"] == 2
+    # Still inside its new visibility window
+    assert job_queue.claim() == []
+
+
+def test_job_fails_after_max_attempts():
+    _reset()
+    job_queue.enqueue("a", "https://example.com/a.jpg")
+    for _ in range(job_queue.MAX_ATTEMPTS):
+        assert len(job_queue.claim(visibility_timeout=0)) == 1
+    assert job_queue.claim() == []
+    job = job_queue.get("a")
+    assert job["status"] == "failed"
+    assert job["failed_step"] == "coordinator"
+
+
+def test_batch_runs_at_most_concurrency_items():
+    _reset()
+    items = [{"session_id": f"b{i}", "photo_url": f"https://example.com/{i}.jpg"} for i in range(3)]
+    job_queue.enqueue_batch("batch-1", items, concurrency=1)
+    assert [job["session_id"] for job in job_queue.claim()] == ["b0"]
+    assert job_queue.claim() == []
+    job_queue.ack("b0", {"ok": True})
+    assert [job["session_id"] for job in job_queue.claim()] == ["b1"]
+    batch = job_queue.get_batch("batch-1")
+    assert batch["counts"] == {"done": 1, "processing": 1, "queued": 1}
+
+
+def test_late_ack_leaves_failed_job_alone():
+    _reset()
+    job_queue.enqueue("a", "https://example.com/a.jpg")
+    job_queue.claim()
+    job_queue.fail("a", "boom", "perception")
+    job_queue.ack("a", {"ok": True})
+    job = job_queue.get("a")
+    assert job["status"] == "failed"
+    assert job["result"] is None
+
+
+def test_prune_drops_only_old_finished_jobs():
+    _reset()
+    job_queue.enqueue("done", "https://example.com/1.jpg")
+    job_queue.enqueue("waiting", "https://example.com/2.jpg")
+    job_queue.claim(limit=1)
+    job_queue.ack("done", {"ok": True})
+    assert job_queue.prune(retention=0) == 1
+    assert job_queue.get("done") is None
+    assert job_queue.get("waiting")["status"] == "queued"
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Test script for the tolerant LLM JSON parser (json_repair.extract and StreamingObject)
+Usage: python3 test_json_repair.py   (or: python3 -m pytest test_json_repair.py)
+"""
+import sys
+import os
+
+# Add the project root to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from json_repair import JSONRepairError, StreamingObject, extract
+
+
+def test_well_formed_object_inside_prose():
+    text = 'Here you go:\n```json\n{"mood": "calm", "intensity": 0.4}\n```\nAnything else?'
+    assert extract(text) == {"mood": "calm", "intensity": 0.4}
+
+
+def test_malformed_object_is_repaired():
+    text = "{'mood': 'calm', tone: \"warm\",, \"tags\": [\"sea\", \"sky\",], \"ok\": True, \"extra\": None}"
+    assert extract(text) == {"mood": "calm", "tone": "warm", "tags": ["sea", "sky"], "ok": True, "extra": None}
+
+
+def test_unescaped_quotes_stay_in_the_string():
+    text = '{"main_narration": "She said "hi" to me", "count": 2}'
+    assert extract(text) == {"main_narration": 'She said "hi" to me', "count": 2}
+
+
+def test_truncated_object_is_closed():
+    assert extract('{"a": {"b": [1, 2') == {"a": {"b": [1, 2]}}
+    assert extract('{"main_narration": "The waves roll') == {"main_narration": "The waves roll"}
+
+
+def test_text_without_an_object_raises():
+    try:
+        extract("I could not analyze this photo.")
+    except JSONRepairError:
+        return
+    raise AssertionError("expected JSONRepairError")
+
+
+def test_streaming_fields_complete_as_their_values_close():
+    chunks = ['Sure: {"main_narr', 'ation": "The sea', '", "person_dialogues": [{"person_id": 1, "dia',
+              'logue": "Hi, there"}], "mood": "cal', 'm"}']
+    stream = StreamingObject()
+    completed = [stream.feed(chunk) for chunk in chunks]
+    assert completed == [
+        {}, {},
+        {"main_narration": "The sea"},
+        {"person_dialogues": [{"person_id": 1, "dialogue": "Hi, there"}]},
+        {"mood": "calm"},
+    ]
+    assert extract(stream.text) == stream.fields
+
+
+def test_streaming_waits_to_see_what_follows_a_quote():
+    stream = StreamingObject()
+    # The closing quote ends the chunk, so the field isn't complete until the comma arrives
+    assert stream.feed('{"a": "x"') == {}
+    assert stream.feed(', "b": 1') == {"a": "x"}
+    # A stream cut off mid-object still yields everything through result()
+    assert extract(stream.text) == {"a": "x", "b": 1}
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test script for merging per-process metric snapshots and rendering them for Prometheus (metrics)
+Usage: python3 test_metrics.py   (or: python3 -m pytest test_metrics.py)
+"""
+import sys
+import os
+import json
+import tempfile
+import time
+
+# Add the project root to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Snapshots live in the state DB, which is found through STATE_DB_PATH at import
+os.environ["STATE_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="metrics_test_"), "state.db")
+
+import metrics
+import stats
+
+STAGE = [["stage", "perception"]]
+
+
+def _process(errors, in_flight, counts, total, buckets=(1, 5)):
+    """A snapshot as another process would have flushed it"""
+    return {
+        "photo_audio_errors_total": {"kind": "counter", "help": "Errors", "series": [[STAGE, errors]]},
+        "photo_audio_in_flight": {"kind": "gauge", "help": "In flight", "series": [[STAGE, in_flight]]},
+        "photo_audio_seconds": {"kind": "histogram", "help": "Latency", "buckets": list(buckets),
+                                "series": [[STAGE, [counts, total]]]},
+    }
+
+
+def test_merge_sums_series_across_processes():
+    merged = metrics._merge([(_process(2, 1, [1, 0, 0], 0.5), True), (_process(3, 4, [0, 2, 1], 9.0), True)])
+    key = (("stage", "perception"),)
+    assert merged["photo_audio_errors_total"]["series"][key] == 5
+    assert merged["photo_audio_in_flight"]["series"][key] == 5
+    assert merged["photo_audio_seconds"]["series"][key] == [[1, 2, 1], 9.5]
+
+
+def test_merge_keeps_counters_but_not_gauges_of_stale_processes():
+    merged = metrics._merge([(_process(2, 1, [1, 0, 0], 0.5), True), (_process(3, 4, [0, 2, 1], 9.0), False)])
+    key = (("stage", "perception"),)
+    assert merged["photo_audio_errors_total"]["series"][key] == 5
+    assert merged["photo_audio_in_flight"]["series"][key] == 1
+    assert merged["photo_audio_seconds"]["series"][key] == [[1, 2, 1], 9.5]
+
+
+def test_merge_skips_histograms_with_another_bucket_layout():
+    merged = metrics._merge([(_process(0, 0, [1, 0, 0], 0.5), True),
+                             (_process(0, 0, [0, 0, 0, 3], 90.0, buckets=(1, 5, 60)), True)])
+    assert merged["photo_audio_seconds"]["series"][(("stage", "perception"),)] == [[1, 0, 0], 0.5]
+
+
+def test_render_merges_other_processes_into_the_exposition_format():
+    metrics.STAGE_FAILURES.inc(stage="emotion", reason="timeout")
+    metrics.STAGE_SECONDS.observe(0.3, stage="emotion")
+    other = json.loads(metrics.snapshot())
+    metrics._db().execute(
+        "INSERT OR REPLACE INTO metric_snapshots (process, snapshot, updated_at) VALUES (?, ?, ?)",
+        ("other-host:1", json.dumps(other), time.time())
+    )
+    stats.incr("result_cache_hits")
+
+    text = metrics.render()
+    assert text.endswith("\n")
+    assert "# TYPE photo_audio_stage_failures_total counter" in text
+    assert 'photo_audio_stage_failures_total{reason="timeout",stage="emotion"} 2' in text
+    # Cumulative buckets: 0.3s lands in le=0.5 and every bucket above it
+    assert 'photo_audio_stage_duration_seconds_bucket{stage="emotion",le="0.25"} 0' in text
+    assert 'photo_audio_stage_duration_seconds_bucket{stage="emotion",le="0.5"} 2' in text
+    assert 'photo_audio_stage_duration_seconds_bucket{stage="emotion",le="+Inf"} 2' in text
+    assert 'photo_audio_stage_duration_seconds_count{stage="emotion"} 2' in text
+    assert 'photo_audio_cache_lookups_total{cache="result_cache",result="hit"} 1' in text
+
+
+def test_label_values_are_escaped():
+    assert metrics._labels((("path", 'a"b\\c\nd'),)) == '{path="a\\"b\\\\c\\nd"}'
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
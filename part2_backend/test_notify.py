@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Test script for the Unix datagram notifications between the gateway and the coordinator (notify)
+Usage: python3 test_notify.py   (or: python3 -m pytest test_notify.py)
+"""
+import sys
+import os
+import asyncio
+import socket
+import tempfile
+
+# Add the project root to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# notify reads NOTIFY_DIR at import, so point it at a scratch directory first
+os.environ["NOTIFY_DIR"] = tempfile.mkdtemp(prefix="notify_test_")
+
+import notify
+
+
+def test_send_wakes_only_the_matching_key():
+    async def scenario():
+        notifier = notify.Notifier("coordinator")
+        assert await notifier.start()
+        try:
+            with notifier.subscribe("jobs") as jobs, notifier.subscribe("s1") as session:
+                notify.send("coordinator", {"key": "jobs"})
+                assert await notifier.wait(jobs, 1.0)
+                assert not await notifier.wait(session, 0.05)
+                # wait() clears the event, so the next wait needs a new notification
+                assert not await notifier.wait(jobs, 0.05)
+        finally:
+            notifier.close()
+        assert not os.path.exists(notifier.path)
+    asyncio.run(scenario())
+
+
+def test_broadcast_reaches_every_worker_and_drops_stale_sockets():
+    async def scenario():
+        workers = [notify.Notifier(f"gateway-{n}") for n in (1, 2)]
+        for worker in workers:
+            assert await worker.start()
+        # A socket file nobody listens on, as left behind by a killed worker
+        stale = notify.socket_path("gateway-3")
+        leftover = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        leftover.bind(stale)
+        leftover.close()
+        try:
+            with workers[0].subscribe("s1") as first, workers[1].subscribe("s1") as second:
+                notify.broadcast("gateway", {"key": "s1"})
+                assert await workers[0].wait(first, 1.0)
+                assert await workers[1].wait(second, 1.0)
+            assert not os.path.exists(stale)
+        finally:
+            for worker in workers:
+                worker.close()
+    asyncio.run(scenario())
+
+
+def test_send_without_a_listener_is_a_no_op():
+    notify.send("nobody-listening", {"key": "jobs"})
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
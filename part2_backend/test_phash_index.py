@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Test script for near-duplicate photo lookup (phash_index.PHashIndex and dhash)
+Usage: python3 test_phash_index.py   (or: python3 -m pytest test_phash_index.py)
+"""
+import sys
+import os
+import io
+import random
+import tempfile
+
+# Add the project root to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# The shared index lives in the state DB, which is found through STATE_DB_PATH at import
+os.environ["STATE_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="phash_test_"), "state.db")
+
+from PIL import Image
+import phash_index
+import state_db
+from phash_index import PHashIndex, dhash
+
+
+def _flip(value, bits):
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+def test_search_finds_hashes_within_the_threshold():
+    rng = random.Random(7)
+    index = PHashIndex()
+    base = rng.getrandbits(64)
+    index.add(base, 1)
+    index.add(rng.getrandbits(64), 2)
+    assert index.search(base, 6) == (1, 0)
+    # Flips spread over several bands, and all in one band
+    assert index.search(_flip(base, [0, 17, 33, 50, 63]), 6) == (1, 5)
+    assert index.search(_flip(base, range(6)), 6) == (1, 6)
+    assert index.search(_flip(base, range(7)), 6) is None
+
+
+def test_search_returns_the_closest_match():
+    index = PHashIndex()
+    base = 0x0123456789ABCDEF
+    index.add(_flip(base, [1, 20, 40]), 1)
+    index.add(_flip(base, [5]), 2)
+    assert index.search(base, 6) == (2, 1)
+
+
+def test_search_agrees_with_a_linear_scan():
+    rng = random.Random(11)
+    index = PHashIndex()
+    hashes = []
+    for entry_id in range(500):
+        # Half are near copies of earlier hashes, like re-uploads of the same photo
+        if hashes and entry_id % 2:
+            value = _flip(rng.choice(hashes), rng.sample(range(64), rng.randint(1, 8)))
+        else:
+            value = rng.getrandbits(64)
+        hashes.append(value)
+        index.add(value, entry_id)
+    for _ in range(200):
+        query = _flip(rng.choice(hashes), rng.sample(range(64), rng.randint(0, 9)))
+        best = min((bin(value ^ query).count("1") for value in hashes))
+        match = index.search(query, 6)
+        if best > 6:
+            assert match is None
+        else:
+            assert match is not None and match[1] == best
+            assert bin(hashes[match[0]] ^ query).count("1") == best
+
+
+def test_dhash_survives_resizing_and_recompression():
+    image = Image.new("RGB", (320, 240))
+    image.putdata([(x % 256, (x * y) % 256, y % 256) for y in range(240) for x in range(320)])
+
+    def encode(img, quality):
+        buffer = io.BytesIO()
+        img.save(buffer, "JPEG", quality=quality)
+        return buffer.getvalue()
+
+    original = dhash(encode(image, 95))
+    copy = dhash(encode(image.resize((160, 120)), 60))
+    assert bin(original ^ copy).count("1") <= 6
+    flipped = dhash(encode(image.transpose(Image.FLIP_LEFT_RIGHT), 95))
+    assert bin(original ^ flipped).count("1") > 6
+
+
+def test_prune_bounds_the_shared_index_by_age_and_size():
+    rng = random.Random(3)
+    old, recent = rng.getrandbits(64), [rng.getrandbits(64) for _ in range(10)]
+    phash_index.remember(old, {"setting": "old"})
+    state_db.connect().execute("UPDATE phash_index SET created_at = created_at - ?", (phash_index.PHASH_TTL + 1,))
+    # Past its TTL the entry is a miss even before the sweep deletes it
+    assert phash_index.lookup(old) is None
+    for n, value in enumerate(recent):
+        phash_index.remember(value, {"setting": f"recent {n}"})
+
+    max_entries = phash_index.PHASH_MAX_ENTRIES
+    phash_index.PHASH_MAX_ENTRIES = 5
+    try:
+        # The expired row, then the oldest recent ones down to 90% of the cap
+        assert phash_index.prune() == 1 + 6
+    finally:
+        phash_index.PHASH_MAX_ENTRIES = max_entries
+    assert phash_index.lookup(recent[0]) is None
+    assert phash_index.lookup(recent[-1]) == ({"setting": "recent 9"}, 0)
+    assert len(phash_index._index) == 4
+    assert phash_index.summary()["entries"] == 4
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
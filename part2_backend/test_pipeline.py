@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Test script for the coordinator's stage DAG (pipeline.Pipeline), with stages that only record their dispatches
+Usage: python3 test_pipeline.py   (or: python3 -m pytest test_pipeline.py)
+"""
+import sys
+import os
+import asyncio
+import time
+
+# Add the project root to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pipeline import Pipeline, Stage
+from session_store import SessionState
+
+
+def _pipeline(dispatched, **overrides):
+    async def run(ctx, state, deadline, name=None):
+        dispatched.append((state.session_id, name))
+
+    def stage(name, inputs=(), **kwargs):
+        return Stage(name, lambda ctx, state, deadline: run(ctx, state, deadline, name), inputs, **kwargs)
+
+    return Pipeline([
+        stage("voice", ["narration"]),
+        stage("perception"),
+        stage("emotion", ["perception"]),
+        stage("ambient", ["perception"]),
+        stage("narration", ["perception", "emotion"]),
+    ], **overrides)
+
+
+def test_stages_start_once_their_inputs_finish():
+    async def scenario():
+        dispatched = []
+        pipeline = _pipeline(dispatched)
+        assert pipeline.order.index("perception") < pipeline.order.index("emotion") < pipeline.order.index("narration")
+        assert sorted(pipeline.sinks) == ["ambient", "voice"]
+        state = SessionState("s1")
+        await pipeline.advance(None, state)
+        assert dispatched == [("s1", "perception")]
+        await pipeline.finished(None, state, "perception")
+        assert sorted(name for _, name in dispatched[1:]) == ["ambient", "emotion"]
+        await pipeline.finished(None, state, "emotion")
+        assert dispatched[-1] == ("s1", "narration")
+        for name in ("ambient", "narration"):
+            assert not await pipeline.finished(None, state, name)
+        assert await pipeline.finished(None, state, "voice")
+        # A duplicate reply is ignored
+        assert not await pipeline.finished(None, state, "voice")
+    asyncio.run(scenario())
+
+
+def test_cycles_and_unknown_inputs_are_rejected():
+    async def noop(ctx, state, deadline):
+        pass
+
+    for stages in ([Stage("a", noop, ["b"]), Stage("b", noop, ["a"])], [Stage("a", noop, ["missing"])]):
+        try:
+            Pipeline(stages)
+        except ValueError:
+            continue
+        raise AssertionError(f"accepted {[s.name for s in stages]}")
+
+
+def test_missed_deadline_retries_then_gives_up():
+    async def scenario():
+        dispatched = []
+        pipeline = _pipeline(dispatched, timeouts={"perception": 0.01}, retries={"perception": 1})
+        state = SessionState("s1")
+        await pipeline.advance(None, state)
+        await asyncio.sleep(0.02)
+        assert await pipeline.check_deadlines(None, state) is None
+        assert dispatched == [("s1", "perception")] * 2
+        assert state.attempts["perception"][0] == 2
+        await asyncio.sleep(0.02)
+        assert await pipeline.check_deadlines(None, state) == "perception"
+        assert len(dispatched) == 2
+    asyncio.run(scenario())
+
+
+def test_stage_limit_queues_sessions_and_cancel_frees_the_slot():
+    async def scenario():
+        dispatched = []
+        pipeline = _pipeline(dispatched, limits={"perception": 1})
+        first, second, third = SessionState("s1"), SessionState("s2"), SessionState("s3")
+        for state in (first, second, third):
+            await pipeline.advance(None, state)
+        assert dispatched == [("s1", "perception")]
+        assert pipeline.stats()["perception"]["waiting"] == 2
+        # s2 gives up while queued; cancelling s1 hands its slot to s3
+        pipeline.cancel(second)
+        pipeline.cancel(first)
+        await asyncio.sleep(0)
+        assert dispatched == [("s1", "perception"), ("s3", "perception")]
+        assert pipeline.stats()["perception"]["running"] == 1
+        assert pipeline.stats()["perception"]["waiting"] == 0
+    asyncio.run(scenario())
+
+
+def test_critical_path_follows_the_last_finishing_inputs():
+    pipeline = _pipeline([])
+    state = SessionState("s1")
+    t = time.time()
+    state.timings = {
+        "perception": [t, t + 1.0],
+        "emotion": [t + 1.0, t + 1.5],
+        "ambient": [t + 1.0, t + 4.0],
+        "narration": [t + 1.75, t + 3.0],
+        "voice": [t + 3.0, t + 5.0],
+    }
+    path = pipeline.critical_path(state)
+    assert [step["stage"] for step in path] == ["perception", "emotion", "narration", "voice"]
+    assert [step["ms"] for step in path] == [1000.0, 500.0, 1250.0, 2000.0]
+    assert path[2]["wait_ms"] == 250.0
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
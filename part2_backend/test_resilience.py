@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Test script for provider call deadlines, retries and hedging (resilience.call)
+Usage: python3 test_resilience.py   (or: python3 -m pytest test_resilience.py)
+"""
+import sys
+import os
+import asyncio
+import tempfile
+import time
+
+# Add the project root to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Retries and hedges are counted in the state DB, which is found through STATE_DB_PATH at import
+os.environ["STATE_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="resilience_test_"), "state.db")
+
+import httpx
+import resilience
+
+FAST = dict(timeout=5.0, base_delay=0.01, max_delay=0.02)
+
+
+def _sender(*outcomes, delays=()):
+    """send(timeout) that plays back `outcomes` (status codes or exceptions) and records its calls"""
+    calls = []
+
+    async def send(timeout):
+        index = len(calls)
+        calls.append(timeout)
+        if index < len(delays):
+            await asyncio.sleep(delays[index])
+        outcome = outcomes[min(index, len(outcomes) - 1)]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return httpx.Response(outcome, text=f"attempt {index + 1}")
+    return send, calls
+
+
+def test_budget_is_capped_by_the_deadline():
+    assert resilience.budget(None, 30.0) == 30.0
+    assert resilience.budget(time.time() + 5, 30.0) <= 5
+    try:
+        resilience.budget(time.time() - 1, 30.0)
+    except resilience.DeadlineExceeded:
+        return
+    raise AssertionError("expected DeadlineExceeded")
+
+
+def test_retryable_status_is_retried_until_it_succeeds():
+    send, calls = _sender(503, 429, 200)
+    response = asyncio.run(resilience.call("test", send, resilience.RetryPolicy(attempts=3, **FAST)))
+    assert response.status_code == 200
+    assert len(calls) == 3
+
+
+def test_other_statuses_are_returned_as_they_are():
+    send, calls = _sender(400)
+    response = asyncio.run(resilience.call("test", send, resilience.RetryPolicy(attempts=3, **FAST)))
+    assert response.status_code == 400
+    assert len(calls) == 1
+
+
+def test_last_outcome_is_surfaced_when_attempts_run_out():
+    send, calls = _sender(503)
+    response = asyncio.run(resilience.call("test", send, resilience.RetryPolicy(attempts=2, **FAST)))
+    assert response.status_code == 503
+    assert len(calls) == 2
+
+    send, calls = _sender(httpx.ConnectError("refused"))
+    try:
+        asyncio.run(resilience.call("test", send, resilience.RetryPolicy(attempts=2, **FAST)))
+    except httpx.ConnectError:
+        assert len(calls) == 2
+        return
+    raise AssertionError("expected ConnectError")
+
+
+def test_no_retry_once_the_backoff_would_pass_the_deadline():
+    send, calls = _sender(503)
+    policy = resilience.RetryPolicy(attempts=5, timeout=5.0, base_delay=10.0, max_delay=10.0)
+    response = asyncio.run(resilience.call("test", send, policy, deadline=time.time() + 2))
+    assert response.status_code == 503
+    assert len(calls) == 1
+    assert calls[0] <= 2
+
+
+def test_slow_request_is_hedged_and_the_first_good_answer_wins():
+    send, calls = _sender(200, 200, delays=(1.0, 0.0))
+    policy = resilience.RetryPolicy(attempts=1, hedge_after=0.05, **FAST)
+    started = time.perf_counter()
+    response = asyncio.run(resilience.call("test", send, policy))
+    assert response.text == "attempt 2"
+    assert time.perf_counter() - started < 0.5
+    # The hedge only gets what is left of the first request's timeout
+    assert calls == [5.0, 5.0 - 0.05]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Test script for the local scene classifier (scene_lexicon.classify)
+Usage: python3 test_scene_lexicon.py   (or: python3 -m pytest test_scene_lexicon.py)
+"""
+import sys
+import os
+
+# Add the project root to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from scene_lexicon import classify
+
+
+def test_counted_people_add_up():
+    result = classify("Three people sit by a campfire")
+    assert result["people_count"] == 3
+    assert [p["position"] for p in result["people_details"]] == ["center", "left", "right"]
+    assert classify("Two women and 3 kids play on the sand")["people_count"] == 5
+
+
+def test_bare_mentions_fall_back_to_the_largest():
+    assert classify("A couple on a bench")["people_count"] == 2
+    assert classify("A family picnic; the family laughs")["people_count"] == 3
+    assert classify("A man in a forest")["people_count"] == 1
+
+
+def test_scene_lighting_and_colors():
+    result = classify("Waves crash on a rocky beach under a red sky at sunset")
+    assert result["scene_type"] == "outdoor_beach"
+    assert result["lighting"] == "warm golden hour"
+    assert result["colors"] == ["red"]
+    assert "waves" in result["objects"]
+    assert classify("A crowded city street at night")["lighting"] == "nighttime"
+
+
+def test_negated_people_are_not_counted():
+    for text in [
+        "An empty beach with no people in sight",
+        "A quiet beach, empty of people",
+        "A trail without any other people around",
+        "Not a single person on the pier",
+        "There is nobody on the pier",
+    ]:
+        result = classify(text)
+        assert result["people_count"] == 0, text
+        assert result["people_details"] == [], text
+
+
+def test_negation_only_reaches_the_next_noun():
+    assert classify("No clouds, two people walk on the shore")["people_count"] == 2
+    assert classify("No people at first. Later a woman appears")["people_count"] == 1
+    assert classify("A man with no hat")["people_count"] == 1
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
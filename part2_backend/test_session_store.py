@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test script for the coordinator's in-memory session table (session_store.SessionStore)
+Usage: python3 test_session_store.py   (or: python3 -m pytest test_session_store.py)
+"""
+import sys
+import os
+import time
+
+# Add the project root to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from session_store import SessionStore
+
+
+class Output:
+    """Stands in for a stage's reply model; only its serialized size matters here"""
+
+    def __init__(self, text):
+        self.text = text
+
+    def json(self):
+        return self.text
+
+
+def test_capacity_evicts_the_least_recently_updated():
+    evicted = []
+    store = SessionStore(ttl=600, max_sessions=2, on_evict=lambda state, reason: evicted.append((state.session_id, reason)))
+    store.create("a")
+    store.create("b")
+    # Updating "a" makes "b" the oldest
+    store.record("a", "perception", Output("{}"))
+    store.create("c")
+    assert evicted == [("b", "capacity")]
+    assert "a" in store and "c" in store and "b" not in store
+    assert store.stats()["evicted_capacity"] == 1
+
+
+def test_ttl_evicts_sessions_without_recent_updates():
+    evicted = []
+    store = SessionStore(ttl=0.05, max_sessions=10, on_evict=lambda state, reason: evicted.append((state.session_id, reason)))
+    store.create("old")
+    time.sleep(0.1)
+    store.create("new")
+    assert store.evict_expired() == ["old"]
+    assert evicted == [("old", "ttl")]
+    assert len(store) == 1
+    assert store.record("old", "perception", Output("{}")) is None
+
+
+def test_recreating_a_session_replaces_it():
+    store = SessionStore(ttl=600, max_sessions=10)
+    first = store.create("a")
+    second = store.create("a")
+    assert first is not second
+    assert store.get("a") is second
+    assert store.stats()["evicted_replaced"] == 1
+
+
+def test_byte_accounting_follows_recorded_outputs():
+    store = SessionStore(ttl=600, max_sessions=10)
+    state = store.create("a")
+    baseline = store.stats()["approx_bytes"]
+    store.record("a", "perception", Output("x" * 100))
+    store.record("a", "emotion", Output("y" * 10), size=40)
+    assert store.stats()["approx_bytes"] == baseline + 140
+    # A re-delivered stage output replaces the earlier one's size
+    store.record("a", "perception", Output("x" * 30))
+    assert state.approx_bytes == baseline + 70
+    store.pop("a")
+    assert store.stats()["approx_bytes"] == 0
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")